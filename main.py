@@ -7,8 +7,19 @@ import sys
 from src.logger import logger
 from src.config import global_config
 from src.maibot_client import maibot_client
-from src.feishu_client import feishu_client
-from src.event_client import feishu_event_client
+from src.feishu_client import feishu_clients
+from src.event_client import feishu_event_clients
+from src.http_server import http_server
+from src.blob_store import blob_store
+from src.image_transcoder import image_transcoder
+from src.retry_queue import retry_queue
+from src.inbound_scheduler import inbound_scheduler
+from src.outbound_scheduler import outbound_scheduler, METADATA
+from src.drain import shutdown_drainer
+from src.admin import register_admin_routes
+from src.warm_cache import warm_cache
+from src.backfill import message_backfill
+from src.memory_governor import memory_governor
 import logging
 import lark_oapi
 from maim_message import UserInfo, BaseMessageInfo, Seg, MessageBase, FormatInfo
@@ -24,7 +35,7 @@ def signal_handler(signum, frame):
     shutdown_count += 1
     
     if shutdown_count == 1:
-        logger.warning(f"收到信号 {signum}，正在优雅关闭... (再次按 Ctrl+C 强制退出)")
+        logger.warning(f"收到信号 {signum}，正在排空并优雅关闭... (再次按 Ctrl+C 强制退出)")
         shutdown_event.set()
     else:
         logger.error("收到第二次中断信号，强制退出！")
@@ -42,15 +53,6 @@ async def run_maibot_client():
         shutdown_event.set()
 
 
-async def run_feishu_event_client():
-    """运行飞书长连接客户端"""
-    try:
-        await feishu_event_client.connect()
-    except Exception as e:
-        logger.error(f"飞书事件客户端错误: {e}")
-        shutdown_event.set()
-
-
 async def async_main():
     """异步主函数"""
     global should_exit
@@ -59,6 +61,13 @@ async def async_main():
     tasks = []
     
     try:
+        # 0. 启动本地 HTTP 服务（reference 图片模式依赖它提供下载）
+        if global_config.server.enable:
+            register_admin_routes(http_server.app)
+            await http_server.start()
+        elif global_config.image.transfer_mode == "reference":
+            logger.warning("⚠️ image.transfer_mode = reference 需要开启 [server]，图片将回退为 base64 内联")
+
         # 1. 先启动 MaiBot 客户端连接
         logger.info("正在启动 MaiBot 客户端...")
         maibot_task = asyncio.create_task(maibot_client.connect())
@@ -67,26 +76,41 @@ async def async_main():
         # 等待 MaiBot 连接成功（最多 2 秒）
         await asyncio.sleep(2)
         
-        # 2. 注册机器人自己
-        await register_bot_self()
+        # 读入缓存快照（机器人信息、token 与各缓存按需从中恢复）
+        await warm_cache.load()
+
+        # 2. 注册机器人自己（每个飞书应用一个机器人）
+        for client in feishu_clients.values():
+            await register_bot_self(client)
+        
+        # 缓存快照定期保存
+        warm_cache.start()
+        # 内存预算检查
+        memory_governor.start()
         
-        # 3. 启动飞书事件监听
+        # 3. 启动飞书事件监听（每个飞书应用一条长连接）
         logger.info("正在启动飞书事件监听...")
-        feishu_task = asyncio.create_task(feishu_event_client.connect())
-        tasks.append(feishu_task)
+        for event_client in feishu_event_clients:
+            feishu_task = asyncio.create_task(event_client.connect())
+            tasks.append(feishu_task)
         
         # 4. 创建 shutdown 监听任务
         shutdown_task = asyncio.create_task(shutdown_event.wait())
         tasks.append(shutdown_task)
         
-        # 5. 等待任一任务完成
-        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        # 5. 等待关闭信号；其他任务提前结束（如某个应用连接失败）不视为退出
+        pending = set(tasks)
+        while shutdown_task in pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not shutdown_task and not task.cancelled() and task.exception():
+                    logger.error(f"❌ 后台任务异常结束: {task.exception()}")
         
-        # 如果 shutdown_event 被触发，取消所有任务
-        if shutdown_task in done:
-            logger.info("收到关闭信号，正在取消所有任务...")
-            for task in pending:
-                task.cancel()
+        # 先排空在途工作，再取消所有任务
+        await shutdown_drainer.drain(feishu_event_clients)
+        logger.info("正在取消所有任务...")
+        for task in pending:
+            task.cancel()
         
         # 等待所有任务完成
         await asyncio.gather(*pending, return_exceptions=True)
@@ -104,44 +128,59 @@ async def async_main():
             if not task.done():
                 task.cancel()
         
-        try:
-            await feishu_event_client.disconnect()
-        except Exception as e:
-            logger.debug(f"关闭飞书连接时出错: {e}")
+        for event_client in feishu_event_clients:
+            try:
+                await event_client.disconnect()
+            except Exception as e:
+                logger.debug(f"关闭飞书连接时出错: {e}")
         
         try:
             await maibot_client.disconnect()
         except Exception as e:
             logger.debug(f"关闭 MaiBot 客户端时出错: {e}")
+        
+        await memory_governor.stop()
+        await message_backfill.stop()
+        await inbound_scheduler.stop()
+        await retry_queue.stop()
+        await warm_cache.stop()
+        
+        try:
+            await http_server.stop()
+            blob_store.close()
+        except Exception as e:
+            logger.debug(f"关闭本地 HTTP 服务时出错: {e}")
+        
+        image_transcoder.shutdown()
+        outbound_scheduler.shutdown()
 
 
-async def register_bot_self():
+async def register_bot_self(client):
     """注册机器人自己到 MaiBot"""
-    from src.feishu_client import feishu_client
     import time
     
     try:
         # 获取机器人自己的信息
         # 飞书 app 的 user_id 通常就是 app_id 对应的 open_id (ou_xxx)
-        # 我们需要调用 API 获取
-        token = feishu_client._get_tenant_access_token()
-        if not token:
-            logger.warning("无法获取 token，跳过机器人注册")
-            return
-        
-        import requests
-        url = "https://open.feishu.cn/open-apis/bot/v3/info"
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        data = response.json()
+        # 我们需要调用 API 获取；快照中有未过期的机器人信息时直接使用
+        saved = warm_cache.lookup("bot_info", client.app_id)
+        if saved is not None:
+            bot_info = saved[0]
+        else:
+            bot_info = await outbound_scheduler.run(METADATA, client.get_bot_info)
+            if bot_info:
+                warm_cache.put(
+                    "bot_info", client.app_id,
+                    {"open_id": bot_info.get("open_id", ""), "app_name": bot_info.get("app_name", "")},
+                    time.time() + global_config.warm_start.bot_info_ttl,
+                )
         
-        if data.get("code") == 0:
-            bot_info = data.get("bot", {})
+        if bot_info:
             bot_open_id = bot_info.get("open_id", "")
             bot_name = bot_info.get("app_name", "Kaisy")
+            client.bot_open_id = bot_open_id
             
-            logger.info(f"🤖 机器人信息: {bot_name} ({bot_open_id})")
+            logger.info(f"🤖 机器人信息 [{client.app_name}]: {bot_name} ({bot_open_id})")
             
             # 构造注册消息发送给 MaiBot
             platform_name = global_config.maibot.platform
@@ -167,7 +206,7 @@ async def register_bot_self():
                 group_info=None,
                 template_info=None,
                 format_info=format_info,
-                additional_config={}
+                additional_config={"feishu": {"app": client.app_name}}
             )
             
             seg = Seg(type="text", data="[Bot Self Registration]")
@@ -192,7 +231,7 @@ async def register_bot_self():
             except:
                 logger.warning("⚠️ 机器人注册失败，但不影响正常使用")
         else:
-            logger.warning(f"获取机器人信息失败: {data}")
+            logger.warning(f"获取机器人信息失败，跳过机器人注册 [{client.app_name}]")
     except Exception as e:
         logger.error(f"注册机器人失败: {e}")
 
@@ -204,11 +243,16 @@ def main():
     logger.info("=" * 50)
     
     # 验证配置
-    if not global_config.feishu.app_id or not global_config.feishu.app_secret:
+    apps = global_config.feishu.all_apps()
+    if any(not app.app_id or not app.app_secret for app in apps):
         logger.error("❌ 飞书配置不完整，请检查 config.toml")
         sys.exit(1)
+    if len({app.name for app in apps}) != len(apps):
+        logger.error("❌ 飞书应用名称重复，请检查 config.toml 中的 [[feishu.apps]]")
+        sys.exit(1)
     
-    logger.info(f"📱 飞书应用 ID: {global_config.feishu.app_id}")
+    for app in apps:
+        logger.info(f"📱 飞书应用 [{app.name}] ID: {app.app_id}")
     logger.info(f"🔗 MaiBot 地址: ws://{global_config.maibot.host}:{global_config.maibot.port}/ws")
     logger.info(f"🌐 使用长连接模式接收飞书事件")
     
@@ -0,0 +1,96 @@
+"""消息转换基准 - 长文本、大量 @ 的 text / post 消息的提及替换与富文本解析耗时
+
+用法（在项目根目录下）:
+    python scripts/bench_message_converter.py [--mentions 50] [--repeat 200]
+
+legacy 一栏是逐个 mention 调用 str.replace 的旧实现，作为对照。
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.message_converter import (  # noqa: E402
+    build_mention_table,
+    iter_post_elements,
+    parse_post_content,
+    rewrite_mentions,
+)
+
+
+def legacy_rewrite_mentions(text: str, mentions: List[Dict[str, Any]]) -> str:
+    """旧实现：每个 mention 对整段文本做一次 replace（@_user_1 会截断 @_user_10）"""
+    for mention in mentions:
+        key = mention["key"]
+        mention_id = mention["id"]["open_id"]
+        if key and mention_id:
+            text = text.replace(key, f"@<{mention['name']}:{mention_id}>")
+    return text
+
+
+def make_mentions(count: int) -> List[Dict[str, Any]]:
+    return [
+        {"key": f"@_user_{i}", "id": {"open_id": f"ou_{i:032x}"}, "name": f"用户{i}"}
+        for i in range(1, count + 1)
+    ]
+
+
+def make_text(mentions: int, paragraphs: int) -> str:
+    line = "".join(f"@_user_{i} 请看一下这个问题，" for i in range(1, mentions + 1))
+    return "\n".join(f"第 {p} 段：{line}这是一段比较长的说明文字。" * 2 for p in range(paragraphs))
+
+
+def make_post(mentions: int, paragraphs: int) -> Dict[str, Any]:
+    content = []
+    for p in range(paragraphs):
+        paragraph: List[Dict[str, Any]] = [{"tag": "text", "text": f"第 {p} 段："}]
+        for i in range(1, mentions + 1):
+            paragraph.append({"tag": "at", "user_id": f"@_user_{i}", "user_name": f"用户{i}"})
+            paragraph.append({"tag": "text", "text": f" 请看 @_user_{i} 提到的问题，"})
+        paragraph.append({"tag": "a", "text": "文档", "href": "https://example.com/doc"})
+        paragraph.append({"tag": "emotion", "emoji_type": "SMILE"})
+        content.append(paragraph)
+    return {"zh_cn": {"title": "周报", "content": content}}
+
+
+def bench(name: str, fn: Callable[[], Any], repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_call = (time.perf_counter() - start) / repeat * 1e6
+    print(f"  {name:<28} {per_call:>10.1f} µs/次")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mentions", type=int, default=50, help="每条消息中的 @ 人数")
+    parser.add_argument("--paragraphs", type=int, default=20, help="段落数")
+    parser.add_argument("--repeat", type=int, default=200, help="每项重复次数")
+    args = parser.parse_args()
+
+    mentions = make_mentions(args.mentions)
+    table, _, _ = build_mention_table(mentions)
+    text = make_text(args.mentions, args.paragraphs)
+    post = make_post(args.mentions, args.paragraphs)
+    loop = asyncio.new_event_loop()
+
+    print(f"text 消息: {len(text)} 字符, {args.mentions} 人 x {args.paragraphs} 段")
+    legacy = bench("legacy str.replace", lambda: legacy_rewrite_mentions(text, mentions), args.repeat)
+    current = bench("rewrite_mentions", lambda: rewrite_mentions(text, table), args.repeat)
+    print(f"  {'加速':<28} {legacy / current:>10.1f} x")
+
+    elements = sum(len(paragraph) for paragraph in post["zh_cn"]["content"])
+    print(f"post 消息: {elements} 个元素")
+    bench("iter_post_elements", lambda: list(iter_post_elements(post, table)), args.repeat)
+    bench("parse_post_content", lambda: loop.run_until_complete(parse_post_content(post, table, "")), args.repeat)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
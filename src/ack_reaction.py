@@ -0,0 +1,86 @@
+"""确认表情 - 消息转交 MaiBot 后立即加表情，回复发出后移除或替换"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Set
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.feishu_client import get_feishu_client
+from src.flood_control import TokenBucket
+from src.outbound_scheduler import outbound_scheduler, REACTION
+
+
+class AckReactions:
+    """确认表情
+
+    - ack(): 在主事件循环中调用，超过速率时直接跳过；添加在 reaction 线程池中进行，调用方不等待
+    - replied(): 回复发出后调用，等添加完成拿到 reaction_id 后移除，配置了 done_emoji_type 时再加上完成表情
+    - 等待回复的消息最多记录 max_tracked 条，更早的表情保留在消息上
+    """
+
+    def __init__(self):
+        cfg = global_config.ack_reaction
+        self._bucket = TokenBucket(cfg.burst, time.monotonic())
+        # message_id -> (应用名称, 添加表情的任务)
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def pending(self) -> int:
+        """进行中的表情添加/移除数"""
+        return len(self._tasks)
+
+    def ack(self, app_name: str, message_id: str, direct: bool):
+        cfg = global_config.ack_reaction
+        if not cfg.enable or not message_id or (cfg.scope == "direct" and not direct):
+            return
+        self._bucket.refill(cfg.rate, cfg.burst, time.monotonic())
+        if self._bucket.tokens < 1:
+            metrics.inc("ack_reaction", result="throttled")
+            return
+        self._bucket.tokens -= 1
+
+        self._pending[message_id] = (app_name, self._spawn(self._add(app_name, message_id, cfg.emoji_type)))
+        while len(self._pending) > cfg.max_tracked:
+            self._pending.popitem(last=False)
+
+    async def _add(self, app_name: str, message_id: str, emoji_type: str) -> Optional[str]:
+        client = get_feishu_client(app_name)
+        try:
+            reaction_id = await outbound_scheduler.run(REACTION, client.add_reaction, message_id, emoji_type)
+        except Exception as e:
+            logger.debug("添加确认表情失败: %s", e)
+            reaction_id = None
+        metrics.inc("ack_reaction", result="added" if reaction_id else "failed")
+        return reaction_id
+
+    def replied(self, message_id: str):
+        """原消息已收到回复：移除（或替换）确认表情"""
+        entry = self._pending.pop(message_id, None) if message_id else None
+        if entry is not None:
+            self._spawn(self._finish(message_id, *entry))
+
+    async def _finish(self, message_id: str, app_name: str, adding: asyncio.Task):
+        reaction_id = await adding
+        if not reaction_id:
+            return
+        client = get_feishu_client(app_name)
+        try:
+            await outbound_scheduler.run(REACTION, client.delete_reaction, message_id, reaction_id)
+        except Exception as e:
+            logger.debug("移除确认表情失败: %s", e)
+            return
+        metrics.inc("ack_reaction", result="removed")
+        done_emoji = global_config.ack_reaction.done_emoji_type
+        if done_emoji:
+            await self._add(app_name, message_id, done_emoji)
+
+
+# 全局确认表情
+ack_reactions = AckReactions()
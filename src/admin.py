@@ -0,0 +1,282 @@
+"""运行时诊断接口 - 挂在本地 HTTP 服务的 /admin 下
+
+- /admin/stats: 任务、队列、线程池、缓存、token、连接状态与指标快照
+- /admin/profile?seconds=N&mode=cprofile|stack: 采样 N 秒后以文件形式下载结果
+- /admin/tracemalloc?seconds=N&top=M: 内存分配排行
+- POST /admin/reconnect?app=NAME: 断开并重建飞书长连接（不指定 app 时为全部应用）
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import ipaddress
+import json
+import marshal
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict
+from aiohttp import web
+from src.logger import logger, queue_handler
+from src.config import global_config
+from src.metrics import metrics
+
+# 单次采样的最长时间（秒）
+_MAX_SECONDS = 300
+# 栈采样间隔范围（秒）
+_MIN_INTERVAL, _MAX_INTERVAL = 0.001, 1.0
+# tracemalloc 记录的最大栈深度
+_MAX_FRAMES = 64
+# tracemalloc 输出的最大行数
+_MAX_TOP = 1000
+
+
+def _number(request: web.Request, name: str, default: float, low: float, high: float,
+            cast: Callable[[str], float] = float) -> float:
+    """读取数值查询参数并限制在 [low, high] 内，格式错误时返回 400"""
+    raw = request.query.get(name)
+    if raw is None:
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} 必须是{'整数' if cast is int else '数字'}")
+    if not math.isfinite(value):
+        raise web.HTTPBadRequest(text=f"{name} 必须是有限的数字")
+    return min(max(value, low), high)
+
+
+def _seconds(request: web.Request, default: float) -> float:
+    return _number(request, "seconds", default, 0.1, _MAX_SECONDS)
+
+
+def _attachment(body: bytes, filename: str, content_type: str = "text/plain") -> web.Response:
+    return web.Response(
+        body=body,
+        content_type=content_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _sample_stacks(seconds: float, interval: float) -> str:
+    """在独立线程中定时采集所有线程的调用栈，输出折叠栈格式（可直接生成火焰图）"""
+    me = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+class AdminHandlers:
+    """诊断接口处理函数
+
+    同一时间只允许一个剖析任务；未配置 admin_token 时只接受本机请求
+    （设置了 public_base_url 时不允许这样做，见 register_admin_routes）。
+    """
+
+    def __init__(self):
+        self._profiling = asyncio.Lock()
+
+    @web.middleware
+    async def guard(self, request: web.Request, handler):
+        if not request.path.startswith("/admin"):
+            return await handler(request)
+        token = global_config.server.admin_token
+        if token:
+            # 只接受请求头中的令牌：查询参数会出现在访问日志与浏览器历史中
+            supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+                raise web.HTTPUnauthorized()
+        else:
+            try:
+                local = ipaddress.ip_address(request.remote or "").is_loopback
+            except ValueError:
+                local = False
+            if not local:
+                raise web.HTTPForbidden(text="未配置 server.admin_token，/admin 只允许本机访问")
+        return await handler(request)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.collect_stats(), dumps=_dumps)
+
+    def collect_stats(self) -> Dict[str, Any]:
+        from src.feishu_client import feishu_clients
+        from src.event_client import feishu_event_clients
+        from src.maibot_client import maibot_client
+        from src.inbound_scheduler import inbound_scheduler
+        from src.outbound_scheduler import outbound_scheduler
+        from src.retry_queue import retry_queue
+        from src.flood_control import flood_control
+        from src.circuit_breaker import circuit_breakers
+        from src.chat_cache import chat_info_cache
+        from src.user_cache import user_profile_cache
+        from src.reply_context import reply_context
+        from src.blob_store import blob_store
+        from src.dedup import processed_message_ids
+        from src.backfill import message_backfill
+        from src.broadcast import broadcaster
+        from src.memory_governor import memory_governor
+
+        loop = asyncio.get_running_loop()
+        tasks = Counter(
+            getattr(task.get_coro(), "__qualname__", type(task.get_coro()).__name__)
+            for task in asyncio.all_tasks(loop)
+        )
+        default_executor = getattr(loop, "_default_executor", None)
+        now = time.time()
+
+        return {
+            "tasks": {"total": sum(tasks.values()), "by_coroutine": dict(tasks.most_common(20))},
+            "threads": threading.active_count(),
+            "memory": memory_governor.stats(),
+            "executors": {
+                "default_queue": default_executor._work_queue.qsize() if default_executor else 0,
+                "outbound_pending": outbound_scheduler.pending(),
+            },
+            "inbound": {
+                "queued": inbound_scheduler.depth(),
+                "processing": inbound_scheduler.in_flight,
+                "top_throttled": flood_control.top_throttled(),
+            },
+            "retry_queue": len(retry_queue),
+            "backfill": {"in_progress": message_backfill.in_progress(), "last": message_backfill.reports},
+            "circuit_breakers": circuit_breakers.states(),
+            "caches": {
+                "chat_info": chat_info_cache.cache.stats(),
+                "user_profile": user_profile_cache.cache.stats(),
+                "quoted_message": reply_context.fetched.stats(),
+                "recent_messages": {
+                    "size": len(reply_context.buffer),
+                    "approx_bytes": reply_context.buffer.approx_bytes,
+                },
+                "blobs": {"size": len(blob_store), "bytes": blob_store.total_bytes},
+                "processed_message_ids": len(processed_message_ids),
+            },
+            "feishu": {
+                name: {
+                    "token_age": round(now - client.token_fetched_at, 1) if client.token_fetched_at else None,
+                    "bot_open_id": client.bot_open_id,
+                }
+                for name, client in feishu_clients.items()
+            },
+            "feishu_connections": {
+                event_client.app.name: event_client.state() for event_client in feishu_event_clients
+            },
+            "maibot": maibot_client.stats(),
+            "broadcasts": [report.to_dict() for report in broadcaster.reports.values()],
+            "log_queue": {"size": queue_handler.queue.qsize(), "dropped": queue_handler.dropped},
+            "metrics": metrics.snapshot(),
+        }
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        """mode=cprofile 剖析主事件循环线程；mode=stack 对所有线程做栈采样"""
+        seconds = _seconds(request, 10)
+        mode = request.query.get("mode", "cprofile")
+        if mode not in ("cprofile", "stack"):
+            raise web.HTTPBadRequest(text="mode 只能是 cprofile 或 stack")
+        interval = _number(request, "interval", 0.01, _MIN_INTERVAL, _MAX_INTERVAL)
+        if self._profiling.locked():
+            raise web.HTTPConflict(text="已有剖析任务在进行中")
+
+        async with self._profiling:
+            logger.info(f"🔬 开始剖析: mode={mode}, {seconds} 秒")
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            if mode == "stack":
+                loop = asyncio.get_running_loop()
+                text = await loop.run_in_executor(None, _sample_stacks, seconds, interval)
+                return _attachment(text.encode("utf-8"), f"stacks-{stamp}.txt")
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            if request.query.get("format") == "text":
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+                return _attachment(out.getvalue().encode("utf-8"), f"profile-{stamp}.txt")
+            # 与 pstats.dump_stats 相同的格式，可用 snakeviz / pstats 打开
+            profiler.create_stats()
+            return _attachment(marshal.dumps(profiler.stats), f"profile-{stamp}.prof", "application/octet-stream")
+
+    async def handle_tracemalloc(self, request: web.Request) -> web.Response:
+        """统计 N 秒内新增的内存分配；tracemalloc 已在运行时直接取当前快照"""
+        seconds = _seconds(request, 10)
+        top = int(_number(request, "top", 30, 1, _MAX_TOP, int))
+        frames = int(_number(request, "frames", 1, 1, _MAX_FRAMES, int))
+        if self._profiling.locked():
+            raise web.HTTPConflict(text="已有剖析任务在进行中")
+
+        async with self._profiling:
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(frames)
+            try:
+                if started_here:
+                    await asyncio.sleep(seconds)
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_here:
+                    tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        lines = [f"# traced current={current} peak={peak} bytes", ""]
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:top])
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return _attachment(("\n".join(lines) + "\n").encode("utf-8"), f"tracemalloc-{stamp}.txt")
+
+
+    async def handle_reconnect(self, request: web.Request) -> web.Response:
+        from src.event_client import feishu_event_clients
+
+        app_name = request.query.get("app")
+        targets = [c for c in feishu_event_clients if not app_name or c.app.name == app_name]
+        if not targets:
+            raise web.HTTPNotFound(text=f"未找到飞书应用: {app_name}")
+        for event_client in targets:
+            await event_client.reconnect()
+        logger.info(f"🔗 已通过诊断接口重连飞书长连接: {[c.app.name for c in targets]}")
+        return web.json_response({c.app.name: c.state() for c in targets}, dumps=_dumps)
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def register_admin_routes(app: web.Application):
+    """在本地 HTTP 服务上注册 /admin 接口（需在服务启动前调用）"""
+    cfg = global_config.server
+    if not cfg.admin_enable:
+        return
+    if cfg.public_base_url and not cfg.admin_token:
+        # 经反向代理或隧道转发的请求来源也是本机，仅凭来源地址无法区分
+        logger.warning("⚠️ 设置了 server.public_base_url 但未配置 server.admin_token，/admin 接口不开启")
+        return
+    handlers = AdminHandlers()
+    app.middlewares.append(handlers.guard)
+    app.router.add_get("/admin/stats", handlers.handle_stats)
+    app.router.add_get("/admin/profile", handlers.handle_profile)
+    app.router.add_get("/admin/tracemalloc", handlers.handle_tracemalloc)
+    app.router.add_post("/admin/reconnect", handlers.handle_reconnect)
@@ -0,0 +1,308 @@
+"""断线补拉 - 记录各会话最后收到的消息，长连接建立后拉取期间错过的消息"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.dedup import processed_message_ids
+from src.feishu_client import get_feishu_client
+from src.flood_control import flood_control, COLLAPSE, DELAY
+from src.inbound_scheduler import inbound_scheduler, classify_message
+from src.outbound_scheduler import outbound_scheduler, METADATA
+from src.user_cache import user_profile_cache
+from src.message_converter import process_feishu_message
+from src.warm_cache import warm_cache
+
+
+class MessageBackfill:
+    """断线补拉
+
+    - record(): 每条收到的消息更新所在会话的高水位 [最后的 create_time(ms), 会话类型, 该毫秒内的消息 ID]，
+      只跟踪最近活跃的 max_chats 个会话
+    - 高水位以 backfill_hwm 命名空间随缓存快照保存，适配器重启后同样可以补拉
+    - trigger(): 长连接建立后在主事件循环中调用，先取高水位快照（此后实时消息推进的高水位不影响本次补拉），
+      再以 concurrency 个会话为上限并发翻页拉取 im/v1/messages；
+      早于高水位、或与高水位同一毫秒且 ID 已记录的消息跳过（去重集合重启后为空，不能依赖它），
+      其余消息与实时消息一样先经过入站限流，再按与实时消息相同的类别（私聊 / @机器人 / 普通群消息）
+      提交到入站调度器；补拉的消息不参与过载与超时丢弃，不加确认表情
+    - 高水位在消息真正处理后才推进，排队中退出或被限流丢弃的消息下次重新补拉；
+      入站队列已满时停止该会话的补拉
+    - 入站队列超过 max_ambient_queue 的一半时暂停翻页，避免补拉挤占实时消息
+    - 每次补拉记录条数、耗时、吞吐与最大延迟（消息创建到补拉提交的时间）
+    """
+
+    name = "backfill_hwm"
+
+    # 高水位同一毫秒内最多记录的消息 ID 数
+    _MAX_IDS_AT_MARK = 20
+
+    def __init__(self):
+        self._marks: "OrderedDict[Tuple[str, str], List[Any]]" = OrderedDict()
+        self._loaded = False
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_run: Dict[str, float] = {}
+        self.reports: Dict[str, Dict[str, Any]] = {}
+        warm_cache.register(self)
+
+    def record(self, app_name: str, chat_id: str, chat_type: str, create_time: Any, message_id: str = ""):
+        """更新会话高水位（只在主事件循环中调用）"""
+        try:
+            create_ms = int(create_time)
+        except (TypeError, ValueError):
+            return
+        if not chat_id or not create_ms:
+            return
+        key = (app_name, chat_id)
+        mark = self._marks.get(key)
+        if mark is None:
+            self._marks[key] = [create_ms, chat_type, [message_id] if message_id else []]
+            while len(self._marks) > global_config.backfill.max_chats:
+                self._marks.popitem(last=False)
+        else:
+            if len(mark) < 3:
+                mark.append([])  # 旧快照中的高水位不含消息 ID
+            if create_ms > mark[0]:
+                mark[0] = create_ms
+                mark[2] = [message_id] if message_id else []
+            elif create_ms == mark[0] and message_id and message_id not in mark[2]:
+                mark[2] = (mark[2] + [message_id])[-self._MAX_IDS_AT_MARK:]
+            self._marks.move_to_end(key)
+
+    def items(self) -> Iterator[Tuple[Tuple[str, str], float, List[Any]]]:
+        """供缓存快照保存：超过 max_lookback 的高水位不再保存"""
+        lookback = global_config.backfill.max_lookback
+        now = time.time()
+        for key, mark in list(self._marks.items()):
+            expire_at = mark[0] / 1000 + lookback
+            if expire_at >= now:
+                yield key, expire_at, list(mark)
+
+    def _load(self):
+        """首次补拉前从快照恢复高水位（内存中更新的值优先）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        restored = 0
+        for key, value, _ in warm_cache.scan(self.name):
+            if key not in self._marks and isinstance(value, list) and len(value) in (2, 3):
+                self._marks[key] = value
+                self._marks.move_to_end(key, last=False)
+                restored += 1
+        if restored:
+            logger.info(f"🔥 已从快照恢复 {restored} 个会话的补拉进度")
+
+    def trigger(self, app_name: str):
+        """长连接建立后调用：补拉该应用各活跃会话错过的消息"""
+        cfg = global_config.backfill
+        if not cfg.enable:
+            return
+        task = self._tasks.get(app_name)
+        now = time.monotonic()
+        if (task and not task.done()) or now - self._last_run.get(app_name, -cfg.min_interval) < cfg.min_interval:
+            return
+        self._last_run[app_name] = now
+        self._load()
+
+        cutoff_ms = (time.time() - cfg.max_lookback) * 1000
+        chats = [
+            # 旧快照没有消息 ID 时为 None：高水位那一毫秒的消息全部跳过
+            (chat_id, mark[0], mark[1], set(mark[2]) if len(mark) > 2 else None)
+            for (app, chat_id), mark in reversed(self._marks.items())
+            if app == app_name and mark[0] >= cutoff_ms
+        ]
+        if chats:
+            self._tasks[app_name] = asyncio.get_running_loop().create_task(self.catch_up(app_name, chats))
+
+    async def catch_up(self, app_name: str, chats: List[Tuple[str, int, str, Optional[Set[str]]]]):
+        started = time.monotonic()
+        logger.info(f"⏪ 开始补拉 [{app_name}]: {len(chats)} 个会话")
+        slots = asyncio.Semaphore(max(1, global_config.backfill.concurrency))
+        results = await asyncio.gather(
+            *(self._catch_up_chat(app_name, chat_id, since_ms, chat_type, seen_ids, slots)
+              for chat_id, since_ms, chat_type, seen_ids in chats),
+            return_exceptions=True,
+        )
+
+        fed, max_lag, failed = 0, 0.0, 0
+        for result in results:
+            if isinstance(result, BaseException):
+                failed += 1
+                logger.debug("补拉会话失败: %s", result)
+                continue
+            fed += result[0]
+            max_lag = max(max_lag, result[1])
+        elapsed = time.monotonic() - started
+        self.reports[app_name] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "chats": len(chats),
+            "failed_chats": failed,
+            "messages": fed,
+            "seconds": round(elapsed, 2),
+            "per_second": round(fed / elapsed, 2) if elapsed > 0 else 0,
+            "max_lag": round(max_lag, 1),
+        }
+        metrics.observe("backfill_seconds", elapsed, app=app_name)
+        if fed:
+            logger.info(
+                f"⏪ 补拉完成 [{app_name}]: {fed} 条消息，{len(chats)} 个会话，用时 {elapsed:.1f} 秒"
+                f"（{fed / max(elapsed, 0.001):.1f} 条/秒，最大延迟 {max_lag:.0f} 秒）"
+            )
+        else:
+            logger.info(f"⏪ 补拉完成 [{app_name}]: 没有错过的消息")
+
+    @staticmethod
+    def _before_mark(item: Dict[str, Any], since_ms: int, seen_ids: Optional[Set[str]]) -> bool:
+        """条目是否已在高水位之内（按秒取的起点会包含高水位所在那一秒的消息）"""
+        try:
+            create_ms = int(item.get("create_time") or 0)
+        except (TypeError, ValueError):
+            return False
+        if create_ms != since_ms:
+            return create_ms < since_ms
+        return seen_ids is None or item.get("message_id", "") in seen_ids
+
+    async def _catch_up_chat(
+        self, app_name: str, chat_id: str, since_ms: int, chat_type: str,
+        seen_ids: Optional[Set[str]], slots: asyncio.Semaphore,
+    ) -> Tuple[int, float]:
+        """补拉单个会话，返回 (处理条数, 最大延迟秒数)"""
+        cfg = global_config.backfill
+        client = get_feishu_client(app_name)
+        fed, max_lag = 0, 0.0
+        page_token = ""
+        async with slots:
+            for _ in range(max(1, cfg.max_pages)):
+                data = await outbound_scheduler.run(
+                    METADATA, client.list_chat_messages, chat_id, since_ms // 1000, page_token, cfg.page_size
+                )
+                if data is None:
+                    break
+                for item in data.get("items") or []:
+                    if item.get("deleted") or self._before_mark(item, since_ms, seen_ids):
+                        continue
+                    # 长连接与补拉同时收到的消息由去重跳过
+                    if not processed_message_ids.add(item.get("message_id", "")):
+                        continue
+                    message_data = await self._to_message_data(app_name, chat_id, chat_type, item)
+                    if message_data is None:
+                        # 机器人自己的消息：不推进高水位，以免越过排队中尚未处理的消息
+                        continue
+                    lag = time.time() - int(item.get("create_time") or 0) / 1000
+                    max_lag = max(max_lag, lag)
+                    metrics.observe("backfill_lag_seconds", lag, app=app_name)
+                    metrics.inc("backfill_messages", app=app_name)
+                    if not await self._dispatch(client, message_data):
+                        return fed, max_lag
+                    fed += 1
+                page_token = data.get("page_token") or ""
+                if not data.get("has_more") or not page_token:
+                    break
+                await self._wait_for_room()
+        return fed, max_lag
+
+    async def _dispatch(self, client, message_data: Dict[str, Any]) -> bool:
+        """经过入站限流后按实时消息的类别提交（delay 模式在补拉任务中等待，不占用定时器）
+
+        Returns:
+            入站队列已满、消息未能提交时为 False
+        """
+        cfg = global_config.flood_control
+        message = message_data["message"]
+        open_id = message_data["sender"]["sender_id"]["open_id"]
+        chat_id = message["chat_id"]
+        priority = classify_message(message["chat_type"], message["mentions"], client.bot_open_id)
+        first_seen = time.monotonic()
+        while True:
+            key, wait = flood_control.admit(open_id, chat_id)
+            if key is None:
+                return inbound_scheduler.submit(priority, chat_id, self._process, message_data, droppable=False)
+            if cfg.mode == DELAY and time.monotonic() + wait - first_seen <= cfg.max_delay:
+                await asyncio.sleep(wait)
+            elif cfg.mode == COLLAPSE:
+                flood_control.collapse(key, (priority, message_data), self._submit_collapsed)
+                return True
+            else:
+                # 不推进高水位：下次补拉时重新判断
+                metrics.inc("inbound_dropped", cls=priority, reason="throttled")
+                return True
+
+    def _advance(self, message_data: Dict[str, Any]):
+        message = message_data["message"]
+        self.record(
+            message_data["app"], message["chat_id"], message["chat_type"], message["create_time"], message["message_id"]
+        )
+
+    async def _process(self, message_data: Dict[str, Any]):
+        """处理一条补拉的消息，完成后才推进高水位"""
+        await process_feishu_message(message_data, ack=False)
+        self._advance(message_data)
+
+    def _submit_collapsed(self, last, count: int):
+        priority, message_data = last
+        message = dict(message_data["message"])
+        message.update({
+            "message_type": "text",
+            "content": json.dumps({"text": f"[短时间内发送了 {count} 条消息，已折叠]"}, ensure_ascii=False),
+            "mentions": [],
+        })
+        # 摘要沿用最后一条消息的 ID 与时间，处理后高水位推进到它
+        inbound_scheduler.submit(
+            priority, message["chat_id"], self._process, dict(message_data, message=message), droppable=False
+        )
+
+    @staticmethod
+    async def _wait_for_room():
+        """入站队列过长时等待其回落"""
+        limit = max(1, global_config.inbound.max_ambient_queue // 2)
+        while len(inbound_scheduler) >= limit:
+            await asyncio.sleep(0.2)
+
+    async def _to_message_data(
+        self, app_name: str, chat_id: str, chat_type: str, item: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """将 im/v1/messages 的条目转换为与长连接事件相同的结构"""
+        sender = item.get("sender") or {}
+        if sender.get("sender_type") == "app":
+            return None
+        open_id = sender.get("id", "") if sender.get("id_type", "open_id") == "open_id" else ""
+        user_info = (await user_profile_cache.get(open_id, app_name) if open_id else None) or {}
+        sender_name = user_info.get("name", "飞书用户")
+        return {
+            "app": app_name,
+            "sender": {
+                "sender_id": {"open_id": open_id, "user_id": ""},
+                "sender_type": sender.get("sender_type", "user"),
+                "tenant_key": sender.get("tenant_key", ""),
+                "name": sender_name,
+                "sender_name": {"default_name": sender_name},
+                "avatar_url": user_info.get("avatar_url", ""),
+            },
+            "message": {
+                "message_id": item.get("message_id", ""),
+                "root_id": item.get("root_id", ""),
+                "parent_id": item.get("parent_id", ""),
+                "create_time": item.get("create_time", "0"),
+                "chat_id": chat_id,
+                "chat_type": chat_type,
+                "message_type": item.get("msg_type", ""),
+                "content": (item.get("body") or {}).get("content", "{}"),
+                "mentions": item.get("mentions") or [],
+            },
+        }
+
+    def in_progress(self) -> List[str]:
+        return [app for app, task in self._tasks.items() if not task.done()]
+
+    async def stop(self):
+        """取消进行中的补拉（未处理的消息高水位未推进，下次启动时重新补拉）"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# 全局断线补拉
+message_backfill = MessageBackfill()
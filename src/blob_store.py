@@ -0,0 +1,198 @@
+"""本地 blob 存储 - 基于内存映射文件的 LRU 图片缓存"""
+import hashlib
+import mmap
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+
+@dataclass
+class _BlobEntry:
+    path: Path
+    size: int
+    mime: str
+    mm: Optional[mmap.mmap]
+
+
+class BlobStore:
+    """以内容哈希为 ID 的 blob 存储
+
+    数据写入磁盘文件后以只读 mmap 打开，读取时返回 memoryview，
+    不在 Python 堆上保留副本。总容量或数量超限时按 LRU 淘汰。
+    """
+
+    def __init__(self, blob_dir: str, max_bytes: int, max_count: int):
+        self.blob_dir = Path(blob_dir)
+        if not self.blob_dir.is_absolute():
+            self.blob_dir = Path(__file__).parent.parent / self.blob_dir
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self._entries: "OrderedDict[str, _BlobEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # 淘汰时仍被 HTTP 响应引用的 mmap，稍后再关闭
+        self._retired = []
+        self._prepared = False
+
+    def _prepare(self):
+        """首次写入时创建目录并清理上次运行残留的文件"""
+        if self._prepared:
+            return
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        for pattern in ("*.blob", "*.part"):
+            for stale in self.blob_dir.glob(pattern):
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+        self._prepared = True
+
+    def temp_path(self) -> Path:
+        """流式写入用的临时文件路径；与 blob 同目录，写完后 adopt_file 直接改名，无需复制"""
+        with self._lock:
+            self._prepare()
+        return self.blob_dir / f"{uuid.uuid4().hex}.part"
+
+    def adopt_file(self, temp_path: Path, digest: str, mime: str = "application/octet-stream") -> Optional[str]:
+        """将已写好的临时文件收为 blob，返回 blob_id；相同内容只存一份"""
+        blob_id = digest[:32]
+        with self._lock:
+            if blob_id in self._entries:
+                self._entries.move_to_end(blob_id)
+                metrics.inc("blob_store_dedup")
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                return blob_id
+
+            path = self.blob_dir / f"{blob_id}.blob"
+            try:
+                os.replace(temp_path, path)
+                size = path.stat().st_size
+                if not size:
+                    os.unlink(path)
+                    return None
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except OSError as e:
+                logger.error(f"❌ 写入 blob 失败: {e}")
+                return None
+
+            self._entries[blob_id] = _BlobEntry(path=path, size=size, mime=mime, mm=mm)
+            self._total_bytes += size
+            self._evict_locked()
+            self._update_gauges_locked()
+
+        metrics.inc("blob_store_put_bytes", size)
+        return blob_id
+
+    def put(self, data: bytes, mime: str = "application/octet-stream") -> Optional[str]:
+        """写入 blob，返回 blob_id；相同内容只存一份"""
+        if not data:
+            return None
+        blob_id = hashlib.sha256(data).hexdigest()[:32]
+
+        with self._lock:
+            if blob_id in self._entries:
+                self._entries.move_to_end(blob_id)
+                metrics.inc("blob_store_dedup")
+                return blob_id
+
+            self._prepare()
+            path = self.blob_dir / f"{blob_id}.blob"
+            try:
+                with open(path, "wb") as f:
+                    f.write(data)
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except OSError as e:
+                logger.error(f"❌ 写入 blob 失败: {e}")
+                return None
+
+            self._entries[blob_id] = _BlobEntry(path=path, size=len(data), mime=mime, mm=mm)
+            self._total_bytes += len(data)
+            self._evict_locked()
+            self._update_gauges_locked()
+
+        metrics.inc("blob_store_put_bytes", len(data))
+        return blob_id
+
+    def get(self, blob_id: str) -> Optional[Tuple[memoryview, str]]:
+        """读取 blob，返回 (只读 memoryview, mime)"""
+        with self._lock:
+            entry = self._entries.get(blob_id)
+            if entry is None or entry.mm is None:
+                metrics.inc("blob_store_miss")
+                return None
+            self._entries.move_to_end(blob_id)
+            metrics.inc("blob_store_hit")
+            return memoryview(entry.mm), entry.mime
+
+    def shrink(self, max_bytes: int):
+        """将占用压缩到给定字节数以内"""
+        with self._lock:
+            self._evict_locked(max_bytes)
+            self._update_gauges_locked()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict_locked(self, max_bytes: Optional[int] = None):
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        self._close_retired_locked()
+        while self._entries and (self._total_bytes > limit or len(self._entries) > self.max_count):
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            self._release_locked(entry)
+            metrics.inc("blob_store_evicted")
+
+    def _release_locked(self, entry: _BlobEntry):
+        try:
+            if entry.mm is not None:
+                entry.mm.close()
+        except BufferError:
+            # 仍有 memoryview 在使用（响应未写完），延后关闭
+            self._retired.append(entry)
+            return
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _close_retired_locked(self):
+        retired, self._retired = self._retired, []
+        for entry in retired:
+            self._release_locked(entry)
+
+    def _update_gauges_locked(self):
+        metrics.set_gauge("blob_store_bytes", self._total_bytes)
+        metrics.set_gauge("blob_store_count", len(self._entries))
+
+    def close(self):
+        """关闭所有 mmap 并删除文件"""
+        with self._lock:
+            while self._entries:
+                _, entry = self._entries.popitem(last=False)
+                self._release_locked(entry)
+            self._total_bytes = 0
+            self._close_retired_locked()
+
+
+# 全局 blob 存储实例
+blob_store = BlobStore(
+    global_config.image.blob_dir,
+    global_config.image.blob_max_bytes,
+    global_config.image.blob_max_count,
+)
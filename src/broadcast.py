@@ -0,0 +1,161 @@
+"""广播发送 - MaiBot 主动推送到多个会话/用户时的批量发送与并发扇出"""
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.retry_queue import retry_queue
+from src.outbound_scheduler import outbound_scheduler, REPLY
+
+# message/v4/batch_send 单次请求的人数上限
+_BATCH_SIZE = 200
+# 保留的广播报告数
+_MAX_REPORTS = 20
+# 单份报告中列出的失败目标数上限
+_MAX_FAILED_LISTED = 200
+
+
+class BroadcastReport:
+    """一次广播的进度与结果"""
+
+    def __init__(self, broadcast_id: int, description: str, total: int):
+        self.id = broadcast_id
+        self.description = description
+        self.total = total
+        self.sent = 0
+        self.deferred = 0
+        self.failed: List[str] = []
+        self.failed_count = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._last_log = self.started
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.deferred + self.failed_count
+
+    def record(self, target: str, result: Optional[bool]):
+        """result: True 已发送 / None 熔断暂存 / False 失败"""
+        if result is True:
+            self.sent += 1
+        elif result is None:
+            self.deferred += 1
+        else:
+            self.failed_count += 1
+            if len(self.failed) < _MAX_FAILED_LISTED:
+                self.failed.append(target)
+        metrics.inc("broadcast_targets", result={True: "sent", None: "deferred"}.get(result, "failed"))
+        now = time.monotonic()
+        if now - self._last_log >= global_config.broadcast.progress_interval and self.done < self.total:
+            self._last_log = now
+            logger.info(f"📣 广播 #{self.id} 进度: {self.done}/{self.total}（失败 {self.failed_count}）")
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {
+            "id": self.id,
+            "description": self.description,
+            "total": self.total,
+            "done": self.done,
+            "sent": self.sent,
+            "deferred": self.deferred,
+            "failed_count": self.failed_count,
+            "failed": self.failed,
+            "seconds": round(end - self.started, 2),
+            "finished": self.finished is not None,
+        }
+
+
+class Broadcaster:
+    """广播发送
+
+    - 纯文本消息发给多个用户时，优先使用飞书批量发送接口（每 200 人一次请求），无效的 open_id 计为失败
+    - 其余目标（群、含图片/文件的消息、关闭批量接口时）以 concurrency 为上限并发逐个发送
+    - 接口熔断时的发送转入重试队列，计为 deferred
+    - 进度每 progress_interval 秒输出一次；最近的报告可在 /admin/stats 查看
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.reports: "OrderedDict[int, BroadcastReport]" = OrderedDict()
+
+    async def run(
+        self,
+        feishu_client,
+        targets: List[Tuple[str, str]],
+        send_one: Callable[[str, str], Awaitable[Optional[bool]]],
+        description: str,
+        batch_texts: Optional[List[str]] = None,
+    ) -> BroadcastReport:
+        cfg = global_config.broadcast
+        report = BroadcastReport(next(self._ids), description, len(targets))
+        self.reports[report.id] = report
+        while len(self.reports) > _MAX_REPORTS:
+            self.reports.popitem(last=False)
+        logger.info(f"📣 开始广播 #{report.id}: {description} -> {len(targets)} 个目标")
+
+        fan_out = targets
+        jobs = []
+        if cfg.use_batch_api and batch_texts:
+            open_ids = [receive_id for receive_id, id_type in targets if id_type == "open_id"]
+            if len(open_ids) > 1:
+                fan_out = [target for target in targets if target[1] != "open_id"]
+                jobs.extend(
+                    self._batch(feishu_client, open_ids[i:i + _BATCH_SIZE], batch_texts, report)
+                    for i in range(0, len(open_ids), _BATCH_SIZE)
+                )
+
+        slots = asyncio.Semaphore(max(1, cfg.concurrency))
+
+        async def one(receive_id: str, receive_id_type: str):
+            async with slots:
+                try:
+                    result = await send_one(receive_id, receive_id_type)
+                except Exception as e:
+                    logger.debug("广播发送失败 %s: %s", receive_id, e)
+                    result = False
+                report.record(receive_id, result)
+
+        jobs.extend(one(receive_id, id_type) for receive_id, id_type in fan_out)
+        await asyncio.gather(*jobs)
+
+        report.finished = time.monotonic()
+        elapsed = report.finished - report.started
+        metrics.observe("broadcast_seconds", elapsed)
+        summary = f"📣 广播 #{report.id} 完成: 成功 {report.sent}，暂存 {report.deferred}，失败 {report.failed_count}，用时 {elapsed:.1f} 秒"
+        if report.failed_count:
+            logger.warning(f"{summary}；失败目标: {', '.join(report.failed[:20])}{' ...' if report.failed_count > 20 else ''}")
+        else:
+            logger.info(summary)
+        return report
+
+    async def _batch(self, feishu_client, open_ids: List[str], texts: List[str], report: BroadcastReport):
+        """一批用户的批量发送：所有文本段都提交成功才计为已发送"""
+        result: Optional[bool] = True
+        invalid: set = set()
+        for text in texts:
+            async def send_batch(text=text):
+                # 包一层元组：run_or_defer 只在熔断暂存时返回 None
+                return (await outbound_scheduler.run(
+                    REPLY, feishu_client.batch_send, open_ids, "text", {"text": text}
+                ),)
+
+            outcome = await retry_queue.run_or_defer(
+                feishu_client.app_name, "batch_send", f"批量消息 -> {len(open_ids)} 人", send_batch
+            )
+            if outcome is None:
+                if result is True:
+                    result = None
+            elif outcome[0] is None:
+                result = False
+            else:
+                invalid.update(outcome[0])
+        for open_id in open_ids:
+            report.record(open_id, False if open_id in invalid else result)
+
+
+# 全局广播发送
+broadcaster = Broadcaster()
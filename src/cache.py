@@ -0,0 +1,141 @@
+"""通用缓存模块 - 带 TTL 与单飞加载的异步缓存"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional, Tuple
+from src.metrics import metrics
+
+_MISSING = object()
+
+
+class AsyncTTLCache:
+    """带过期时间和容量上限的 LRU 缓存
+
+    - get_or_load: 同一个 key 的并发加载只会真正发起一次（single-flight）
+    - 加载结果为 None 时按 negative_ttl 短暂缓存，避免失败时反复请求
+    - invalidate: 删除条目，并让正在进行的加载结果不再写回
+
+    只在事件循环线程中使用，跨线程调用请通过 loop.call_soon_threadsafe。
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int, negative_ttl: float = 60):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def _lookup(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expire_at, value = item
+        if expire_at < time.time():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取未过期的条目"""
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            metrics.inc("cache_miss", cache=self.name)
+            return default
+        self.hits += 1
+        metrics.inc("cache_hit", cache=self.name)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入条目；正在进行的加载结果比此次写入旧，不再回填"""
+        self._inflight.pop(key, None)
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> bool:
+        """删除条目，返回条目是否存在"""
+        self._inflight.pop(key, None)
+        existed = self._data.pop(key, None) is not None
+        if existed:
+            metrics.inc("cache_invalidated", cache=self.name)
+        return existed
+
+    def clear(self):
+        self._inflight.clear()
+        self._data.clear()
+
+    def shrink(self, max_size: int):
+        """按 LRU 顺序淘汰到给定数量"""
+        while len(self._data) > max_size:
+            self._data.popitem(last=False)
+
+    def items(self) -> Iterator[Tuple[Hashable, float, Any]]:
+        """遍历未过期条目，产出 (key, 过期时间戳, value)"""
+        now = time.time()
+        for key, (expire_at, value) in list(self._data.items()):
+            if expire_at >= now:
+                yield key, expire_at, value
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """读取条目，不存在时调用 loader 加载；并发请求共享同一次加载"""
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            metrics.inc("cache_hit", cache=self.name)
+            return value
+
+        self.misses += 1
+        metrics.inc("cache_miss", cache=self.name)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            future.cancel()
+            raise
+        except Exception as e:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+
+        # 加载期间被 invalidate 的结果不写回缓存
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            self.set(key, value)
+        future.set_result(value)
+        return value
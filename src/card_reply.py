@@ -0,0 +1,129 @@
+"""卡片回复 - 同一条消息的多段文本回复合并到一张消息卡片中，逐步更新"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.outbound_scheduler import outbound_scheduler, REPLY
+
+# 更新失败后重试的次数（卡片内容是全量的，重试成功即可补齐）
+_MAX_PATCH_RETRIES = 3
+
+
+def _render(parts: List[str]) -> str:
+    """渲染卡片内容；开启 update_multi 后卡片才能被 PATCH 更新"""
+    return json.dumps({
+        "config": {"wide_screen_mode": True, "update_multi": True},
+        "elements": [{"tag": "div", "text": {"tag": "plain_text", "content": "\n".join(parts)}}],
+    }, ensure_ascii=False)
+
+
+class _CardStream:
+    """一张正在逐步更新的卡片"""
+
+    __slots__ = ("parts", "chars", "message_id", "created", "last_patch", "timer", "lock", "failures")
+
+    def __init__(self, now: float):
+        self.parts: List[str] = []
+        self.chars = 0
+        self.message_id: Optional[str] = None
+        self.created = now
+        self.last_patch = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.lock = asyncio.Lock()
+        self.failures = 0
+
+
+class CardReplies:
+    """卡片回复
+
+    - 对某条消息的第一段文本回复立即以卡片回复（首段内容不等待）
+    - window 秒内同一条消息的后续文本追加到卡片中，距上次更新不足 patch_interval 时合并到下一次更新
+    - 卡片超过 max_chars 后另起一张；卡片创建失败时 append() 返回 False，由调用方按普通文本发送
+    只在主事件循环中使用。
+    """
+
+    def __init__(self):
+        self._streams: "OrderedDict[Tuple[str, str], _CardStream]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def pending(self) -> int:
+        """尚未发出的卡片更新数"""
+        return sum(1 for stream in self._streams.values() if stream.timer) + len(self._tasks)
+
+    def _expire(self, now: float):
+        window = global_config.card_reply.window
+        while self._streams:
+            key, stream = next(iter(self._streams.items()))
+            if now - stream.created < window:
+                break
+            del self._streams[key]
+
+    async def append(self, feishu_client, original_message_id: str, text: str) -> bool:
+        """把一段回复文本加入对应卡片，返回是否已由卡片承载"""
+        cfg = global_config.card_reply
+        now = time.monotonic()
+        self._expire(now)
+        key = (feishu_client.app_name, original_message_id)
+        stream = self._streams.get(key)
+        if stream is None or stream.chars + len(text) > cfg.max_chars:
+            stream = self._streams[key] = _CardStream(now)
+            self._streams.move_to_end(key)
+
+        async with stream.lock:
+            if stream.message_id is None:
+                parts = stream.parts + [text]
+                message_id = await outbound_scheduler.run(
+                    REPLY, feishu_client.reply_card, original_message_id, _render(parts)
+                )
+                if not message_id:
+                    metrics.inc("card_reply", result="fallback")
+                    return False
+                stream.parts = parts
+                stream.chars += len(text)
+                stream.message_id = message_id
+                stream.last_patch = time.monotonic()
+                metrics.inc("card_reply", result="created")
+                return True
+
+        stream.parts.append(text)
+        stream.chars += len(text)
+        self._schedule(feishu_client, stream)
+        return True
+
+    def _schedule(self, feishu_client, stream: _CardStream):
+        """安排一次更新；已有待执行的更新时新内容会随它一起发出"""
+        if stream.timer is not None:
+            metrics.inc("card_reply", result="coalesced")
+            return
+        delay = max(0.0, stream.last_patch + global_config.card_reply.patch_interval - time.monotonic())
+        loop = asyncio.get_running_loop()
+        stream.timer = loop.call_later(delay, self._spawn_patch, feishu_client, stream)
+
+    def _spawn_patch(self, feishu_client, stream: _CardStream):
+        stream.timer = None
+        stream.last_patch = time.monotonic()
+        task = asyncio.get_running_loop().create_task(self._patch(feishu_client, stream))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _patch(self, feishu_client, stream: _CardStream):
+        try:
+            ok = await outbound_scheduler.run(REPLY, feishu_client.patch_card, stream.message_id, _render(stream.parts))
+        except Exception as e:
+            logger.debug("更新消息卡片失败: %s", e)
+            ok = False
+        metrics.inc("card_reply", result="patched" if ok else "patch_failed")
+        if ok:
+            stream.failures = 0
+        else:
+            stream.failures += 1
+            if stream.failures <= _MAX_PATCH_RETRIES:
+                self._schedule(feishu_client, stream)
+
+
+# 全局卡片回复
+card_replies = CardReplies()
@@ -0,0 +1,60 @@
+"""群信息缓存 - 群名、成员数、群模式"""
+from typing import Any, Dict, Optional
+from src.cache import AsyncTTLCache
+from src.config import global_config
+from src.feishu_client import get_feishu_client
+from src.outbound_scheduler import outbound_scheduler, METADATA
+from src.warm_cache import warm_cache
+
+
+def _compact_chat_info(data: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留转换消息需要的字段"""
+    try:
+        member_count = int(data.get("user_count", 0) or 0)
+    except (TypeError, ValueError):
+        member_count = 0
+    return {
+        "name": data.get("name", "") or "",
+        "member_count": member_count,
+        "chat_mode": data.get("chat_mode", "") or "",
+    }
+
+
+class ChatInfoCache:
+    """群信息缓存
+
+    首次遇到某个群时通过 im/v1/chats/{chat_id} 获取，之后在 TTL 内直接复用；
+    群信息变更事件 (im.chat.updated_v1) 到达时主动失效。
+    以 (应用名称, chat_id) 为键，不同应用对同一个群的可见信息互不影响。
+    """
+
+    def __init__(self):
+        self.cache = AsyncTTLCache(
+            "chat_info",
+            ttl=global_config.cache.chat_ttl,
+            max_size=global_config.cache.chat_max_size,
+        )
+        warm_cache.register(self.cache)
+
+    async def get(self, chat_id: str, app_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取群信息，失败返回 None"""
+        if not chat_id:
+            return None
+        client = get_feishu_client(app_name)
+
+        async def load():
+            data = await outbound_scheduler.run(METADATA, client.get_chat_info, chat_id)
+            return _compact_chat_info(data) if data else None
+
+        key = (client.app_name, chat_id)
+        warm_cache.restore(self.cache, key)
+        return await self.cache.get_or_load(key, load)
+
+    def invalidate(self, chat_id: str, app_name: Optional[str] = None):
+        key = (get_feishu_client(app_name).app_name, chat_id)
+        self.cache.invalidate(key)
+        warm_cache.forget(self.cache.name, key)
+
+
+# 全局群信息缓存实例
+chat_info_cache = ChatInfoCache()
@@ -0,0 +1,133 @@
+"""熔断器 - 按飞书应用与接口统计错误率与延迟，故障期间快速失败"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发出"""
+
+    def __init__(self, app: str, endpoint: str):
+        super().__init__(f"飞书接口 {endpoint} [{app}] 已熔断")
+        self.app = app
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    """单个应用单个接口的熔断器
+
+    - closed: 正常放行；滑动窗口内错误率或慢调用比例超过阈值时转为 open
+    - open: 直接拒绝，open_seconds 后转为 half_open
+    - half_open: 只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, app: str, endpoint: str):
+        self.app = app
+        self.endpoint = endpoint
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (时间戳, 是否失败, 是否慢调用)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"⚡ 熔断器 [{self.app}/{self.endpoint}] {self.state} -> {state}")
+        self.state = state
+        metrics.set_gauge("circuit_state", _STATE_VALUES[state], app=self.app, endpoint=self.endpoint)
+        metrics.inc("circuit_transition", app=self.app, endpoint=self.endpoint, state=state)
+
+    def is_open(self) -> bool:
+        """是否处于拒绝状态（不含可以探测的 half_open）"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at < global_config.circuit_breaker.open_seconds
+            return self.state == HALF_OPEN and self._probe_in_flight
+
+    def allow(self) -> bool:
+        """判断是否放行一次请求"""
+        if not global_config.circuit_breaker.enable:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < global_config.circuit_breaker.open_seconds:
+                    metrics.inc("circuit_rejected", app=self.app, endpoint=self.endpoint)
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._probe_in_flight:
+                metrics.inc("circuit_rejected", app=self.app, endpoint=self.endpoint)
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, failed: bool, elapsed: float):
+        """记录一次请求结果"""
+        cfg = global_config.circuit_breaker
+        if not cfg.enable:
+            return
+        now = time.monotonic()
+        slow = elapsed >= cfg.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+                else:
+                    self._calls.clear()
+                    self._set_state(CLOSED)
+                return
+
+            self._calls.append((now, failed, slow))
+            while self._calls and now - self._calls[0][0] > cfg.window_seconds:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if self.state != CLOSED or total < cfg.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= cfg.failure_rate or slow_calls / total >= cfg.slow_call_rate:
+                self._opened_at = now
+                self._calls.clear()
+                self._set_state(OPEN)
+
+
+class CircuitBreakerRegistry:
+    """按 (应用名称, 接口名称) 管理熔断器：一个应用的凭据或配额问题不影响其他应用"""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, app: str, endpoint: str) -> CircuitBreaker:
+        key = (app, endpoint)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(app, endpoint))
+        return breaker
+
+    def states(self) -> Dict[str, Dict[str, str]]:
+        states: Dict[str, Dict[str, str]] = {}
+        for (app, endpoint), breaker in list(self._breakers.items()):
+            states.setdefault(app, {})[endpoint] = breaker.state
+        return states
+
+
+# 全局熔断器注册表
+circuit_breakers = CircuitBreakerRegistry()
@@ -6,6 +6,20 @@ from typing import List
 import shutil
 
 
+DEFAULT_APP_NAME = "default"
+
+
+@dataclass
+class FeishuAppConfig:
+    """单个飞书应用配置"""
+    name: str = DEFAULT_APP_NAME
+    app_id: str = ""
+    app_secret: str = ""
+    encrypt_key: str = ""
+    verification_token: str = ""
+    connections: int = 1  # 长连接数量，飞书会把事件分摊到各条连接
+
+
 @dataclass
 class FeishuConfig:
     """飞书配置"""
@@ -13,6 +27,36 @@ class FeishuConfig:
     app_secret: str = ""
     encrypt_key: str = ""
     verification_token: str = ""
+    connections: int = 1  # 长连接数量，飞书会把事件分摊到各条连接
+    # 多应用：[[feishu.apps]]，每个应用有独立的凭证、token 缓存和长连接
+    apps: List[FeishuAppConfig] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.apps = [app if isinstance(app, FeishuAppConfig) else FeishuAppConfig(**app) for app in self.apps]
+
+    def all_apps(self) -> List[FeishuAppConfig]:
+        """返回所有应用；[feishu] 顶层的 app_id 作为名为 default 的应用"""
+        apps = []
+        if self.app_id or not self.apps:
+            apps.append(FeishuAppConfig(
+                name=DEFAULT_APP_NAME,
+                app_id=self.app_id,
+                app_secret=self.app_secret,
+                encrypt_key=self.encrypt_key,
+                verification_token=self.verification_token,
+                connections=self.connections,
+            ))
+        apps.extend(self.apps)
+        return apps
+
+
+@dataclass
+class MaiBotBackendConfig:
+    """单个 MaiBot 实例配置"""
+    name: str = ""
+    host: str = "localhost"
+    port: int = 8000
+
 
 @dataclass
 class MaiBotConfig:
@@ -20,6 +64,25 @@ class MaiBotConfig:
     host: str = "localhost"
     port: int = 8000
     platform: str = "feishu"
+    # 多实例：[[maibot.backends]]，按 chat_id 一致性哈希分配会话
+    backends: List[MaiBotBackendConfig] = field(default_factory=list)
+    health_check_interval: float = 5  # 健康检查间隔（秒）
+    virtual_nodes: int = 160  # 一致性哈希环上每个实例的虚拟节点数
+
+    def __post_init__(self):
+        self.backends = [
+            backend if isinstance(backend, MaiBotBackendConfig) else MaiBotBackendConfig(**backend)
+            for backend in self.backends
+        ]
+
+    def all_backends(self) -> List[MaiBotBackendConfig]:
+        """返回所有 MaiBot 实例；未配置 backends 时使用 host/port 作为唯一实例"""
+        if not self.backends:
+            return [MaiBotBackendConfig(name="default", host=self.host, port=self.port)]
+        return [
+            MaiBotBackendConfig(name=backend.name or f"{backend.host}:{backend.port}", host=backend.host, port=backend.port)
+            for backend in self.backends
+        ]
 
 
 @dataclass
@@ -36,6 +99,184 @@ class ChatConfig:
 class DebugConfig:
     """调试配置"""
     level: str = "INFO"
+    log_format: str = "text"  # text / json
+    hot_path_log_rate: float = 5  # 每条消息都会触发的日志，每类每秒最多输出条数（<= 0 不限速）
+
+
+@dataclass
+class ServerConfig:
+    """本地 HTTP 服务配置"""
+    enable: bool = False
+    host: str = "127.0.0.1"
+    port: int = 8090
+    public_base_url: str = ""  # MaiBot 访问本服务使用的地址，留空则使用 http://host:port
+    admin_enable: bool = False  # 开启 /admin 运行状态与性能剖析接口
+    admin_token: str = ""  # /admin 接口的访问令牌；留空时只允许本机访问，设置了 public_base_url 时必填
+
+
+@dataclass
+class ImageConfig:
+    """图片配置"""
+    transfer_mode: str = "base64"  # base64: 内联到消息中；reference: 存入本地 blob 并发送引用地址
+    blob_dir: str = "data/blobs"
+    blob_max_bytes: int = 256 * 1024 * 1024
+    blob_max_count: int = 2000
+    transcode_enable: bool = False  # 转发前缩小图片（需要安装 Pillow）
+    max_dimension: int = 2048  # 长边像素上限
+    target_format: str = "JPEG"  # JPEG / WEBP / PNG
+    quality: int = 85
+    skip_below_bytes: int = 200 * 1024  # 小于该大小且尺寸未超限的图片不处理
+    transcode_workers: int = 2  # 转码进程数
+    transcode_cache_size: int = 256  # 按 image_key 缓存的转码结果数量
+
+
+@dataclass
+class MediaConfig:
+    """文件、语音、视频消息配置"""
+    enable: bool = True  # 下载收到的文件/语音/视频并以下载地址转发（需要开启 [server]）
+    max_download_bytes: int = 100 * 1024 * 1024  # 单个文件下载上限，超出时只发送占位文本
+    max_upload_bytes: int = 30 * 1024 * 1024  # 单个文件上传上限（飞书 im/v1/files 限制 30MB）
+
+
+@dataclass
+class CacheConfig:
+    """缓存配置"""
+    chat_ttl: int = 3600  # 群信息缓存时间（秒），群信息变更事件会主动失效
+    chat_max_size: int = 5000
+    user_ttl: int = 6 * 3600  # 用户资料缓存时间（秒），通讯录变更事件会主动更新
+    user_max_size: int = 20000
+    recent_per_chat: int = 50  # 每个会话保留的最近消息条数（用于解析回复引用）
+    recent_memory_budget: int = 8 * 1024 * 1024  # 最近消息缓冲区的内存预算（字节，估算值）
+    recent_text_chars: int = 200  # 每条消息保留的文本长度
+    quoted_message_ttl: int = 600  # 通过接口获取的被引用消息缓存时间（秒）
+    uploaded_image_ttl: int = 7 * 86400  # 已上传图片（内容哈希 -> image_key）缓存时间（秒）
+    uploaded_image_max_size: int = 5000
+
+
+@dataclass
+class OutboundConfig:
+    """出站请求调度配置：每类请求独立的线程池大小"""
+    reply_workers: int = 8  # 文本发送/回复
+    image_send_workers: int = 4  # 已上传图片的消息发送
+    metadata_workers: int = 4  # 用户资料、群信息、被引用消息
+    media_download_workers: int = 4  # 下载消息中的图片
+    image_upload_workers: int = 2  # 图片上传
+    file_transfer_workers: int = 2  # 文件/语音/视频的下载与上传
+    reaction_workers: int = 2  # 确认表情的添加与移除
+    max_pending: int = 200  # 每类请求排队+执行中的上限，超出时调用方等待
+
+
+@dataclass
+class InboundConfig:
+    """入站消息调度配置"""
+    workers: int = 16  # 同时转换的消息数
+    dm_weight: int = 4  # 私聊出队权重
+    mention_weight: int = 4  # 群聊 @机器人 出队权重
+    group_weight: int = 1  # 普通群消息出队权重
+    max_queue: int = 5000  # 入站队列总上限
+    max_ambient_queue: int = 1000  # 普通群消息排队上限，超出时丢弃最旧的
+    ambient_max_delay: float = 30  # 普通群消息最长排队时间（秒），超出时丢弃
+
+
+@dataclass
+class FloodControlConfig:
+    """入站限流配置（令牌桶）"""
+    enable: bool = False  # 默认关闭：开启后超限消息会被延迟、折叠或丢弃
+    mode: str = "delay"  # 超限处理方式: drop(丢弃) / collapse(折叠为一条摘要) / delay(延迟处理)
+    user_rate: float = 1.0  # 每个用户每秒补充的消息数
+    user_burst: int = 10  # 每个用户允许的突发条数
+    chat_rate: float = 5.0  # 每个会话每秒补充的消息数
+    chat_burst: int = 30  # 每个会话允许的突发条数
+    collapse_window: float = 10  # collapse 模式下合并超限消息的时间窗口（秒）
+    max_delay: float = 30  # delay 模式下最长等待时间（秒），超出时丢弃
+    max_tracked: int = 20000  # 最多跟踪的用户/会话数
+
+
+@dataclass
+class ShutdownConfig:
+    """优雅关闭配置"""
+    drain_timeout: float = 30  # 收到 SIGTERM 后等待在途工作完成的最长时间（秒）
+    idle_grace: float = 10  # 与 MaiBot 最后一次往来后再等待的时间（秒），给已转发消息的回复留出时间
+    report_path: str = "data/unfinished.json"  # 超时未完成的工作记录位置（相对路径基于项目根目录）
+
+
+@dataclass
+class WarmStartConfig:
+    """热启动快照配置"""
+    enable: bool = False  # 默认关闭：开启后用户资料与群信息会落盘
+    path: str = "data/warm_cache.sqlite3"  # 快照文件位置（相对路径基于项目根目录）
+    save_interval: float = 300  # 定期保存间隔（秒），关闭时也会保存一次
+    max_age: float = 86400  # 超过该时间未更新的快照整体丢弃（秒）
+    bot_info_ttl: float = 86400  # 机器人信息在快照中的有效期（秒）
+    persist_token: bool = False  # 是否保存 tenant_access_token（按其过期时间失效）
+
+
+@dataclass
+class AckReactionConfig:
+    """收到消息时的确认表情配置"""
+    enable: bool = False
+    emoji_type: str = "OnIt"  # 消息转交 MaiBot 时添加的表情
+    done_emoji_type: str = ""  # 回复发出后替换为该表情，留空则直接移除
+    scope: str = "direct"  # direct: 只对私聊和 @机器人 的消息；all: 所有转交的消息
+    rate: float = 5.0  # 每秒最多添加的表情数
+    burst: int = 10  # 允许的突发数
+    max_tracked: int = 2000  # 等待回复的消息数上限，超出时最早的不再移除
+
+
+@dataclass
+class CardReplyConfig:
+    """卡片回复配置"""
+    enable: bool = False
+    patch_interval: float = 1.0  # 两次更新卡片之间的最小间隔（秒）
+    window: float = 120  # 首条回复后多长时间内的后续回复并入同一张卡片（秒）
+    max_chars: int = 8000  # 单张卡片的最大字数，超出时另起一张
+
+
+@dataclass
+class BroadcastConfig:
+    """MaiBot 主动推送到多个目标时的广播配置"""
+    concurrency: int = 8  # 逐个发送时的并发目标数
+    use_batch_api: bool = True  # 纯文本发给多个用户时使用飞书批量发送接口
+    progress_interval: float = 5  # 进度日志间隔（秒）
+
+
+@dataclass
+class MemoryConfig:
+    """内存预算配置"""
+    enable: bool = False  # 默认关闭：开启后接近预算时图片改为占位文本、暂停接收事件
+    budget_mb: int = 0  # 进程内存预算（MB，按 RSS 计）；0 表示使用容器 / cgroup 的内存上限
+    shrink_at: float = 0.7  # 达到预算该比例时压缩缓存
+    placeholder_at: float = 0.85  # 达到该比例时图片以占位文本转发，不再下载
+    pause_at: float = 0.95  # 达到该比例时暂停接收事件
+    hysteresis: float = 0.05  # 回落到阈值以下该比例后才恢复
+    shrink_ratio: float = 0.5  # 压缩时各缓存保留的容量比例
+    check_interval: float = 2  # 检查间隔（秒）
+
+
+@dataclass
+class BackfillConfig:
+    """断线补拉配置"""
+    enable: bool = False  # 默认关闭：开启后重连时会把期间错过的消息转发给 MaiBot
+    max_lookback: float = 21600  # 最多补拉多久以前的消息（秒），更早的会话不再补拉
+    max_chats: int = 500  # 最多跟踪的会话数（按最近活跃保留）
+    concurrency: int = 3  # 同时补拉的会话数
+    page_size: int = 50  # 每页消息数（飞书上限 50）
+    max_pages: int = 20  # 每个会话最多翻页数
+    min_interval: float = 30  # 两次补拉之间的最小间隔（秒），多条连接同时重连时只补拉一次
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """飞书接口熔断配置"""
+    enable: bool = True
+    window_seconds: float = 30  # 统计窗口（秒）
+    min_calls: int = 10  # 窗口内请求数达到该值才判断是否熔断
+    failure_rate: float = 0.5  # 错误率阈值（超时、连接错误、HTTP 5xx/429）
+    slow_call_seconds: float = 5  # 超过该耗时视为慢调用
+    slow_call_rate: float = 0.8  # 慢调用比例阈值
+    open_seconds: float = 30  # 熔断持续时间，之后放行一个探测请求
+    retry_queue_size: int = 500  # 熔断期间暂存的待发送消息上限
+    retry_max_age: float = 300  # 暂存消息的最长等待时间（秒），超时丢弃
 
 
 @dataclass
@@ -45,6 +286,21 @@ class GlobalConfig:
     maibot: MaiBotConfig
     chat: ChatConfig
     debug: DebugConfig
+    server: ServerConfig = field(default_factory=ServerConfig)
+    image: ImageConfig = field(default_factory=ImageConfig)
+    media: MediaConfig = field(default_factory=MediaConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    circuit_breaker: CircuitBreakerConfig = field(default_factory=CircuitBreakerConfig)
+    outbound: OutboundConfig = field(default_factory=OutboundConfig)
+    inbound: InboundConfig = field(default_factory=InboundConfig)
+    flood_control: FloodControlConfig = field(default_factory=FloodControlConfig)
+    shutdown: ShutdownConfig = field(default_factory=ShutdownConfig)
+    warm_start: WarmStartConfig = field(default_factory=WarmStartConfig)
+    backfill: BackfillConfig = field(default_factory=BackfillConfig)
+    ack_reaction: AckReactionConfig = field(default_factory=AckReactionConfig)
+    card_reply: CardReplyConfig = field(default_factory=CardReplyConfig)
+    broadcast: BroadcastConfig = field(default_factory=BroadcastConfig)
+    memory: MemoryConfig = field(default_factory=MemoryConfig)
 
 
 def load_config() -> GlobalConfig:
@@ -69,7 +325,22 @@ def load_config() -> GlobalConfig:
         feishu=FeishuConfig(**config_data.get("feishu", {})),
         maibot=MaiBotConfig(**config_data.get("maibot", {})),
         chat=ChatConfig(**config_data.get("chat", {})),
-        debug=DebugConfig(**config_data.get("debug", {}))
+        debug=DebugConfig(**config_data.get("debug", {})),
+        server=ServerConfig(**config_data.get("server", {})),
+        image=ImageConfig(**config_data.get("image", {})),
+        media=MediaConfig(**config_data.get("media", {})),
+        cache=CacheConfig(**config_data.get("cache", {})),
+        circuit_breaker=CircuitBreakerConfig(**config_data.get("circuit_breaker", {})),
+        outbound=OutboundConfig(**config_data.get("outbound", {})),
+        inbound=InboundConfig(**config_data.get("inbound", {})),
+        flood_control=FloodControlConfig(**config_data.get("flood_control", {})),
+        shutdown=ShutdownConfig(**config_data.get("shutdown", {})),
+        warm_start=WarmStartConfig(**config_data.get("warm_start", {})),
+        backfill=BackfillConfig(**config_data.get("backfill", {})),
+        ack_reaction=AckReactionConfig(**config_data.get("ack_reaction", {})),
+        card_reply=CardReplyConfig(**config_data.get("card_reply", {})),
+        broadcast=BroadcastConfig(**config_data.get("broadcast", {})),
+        memory=MemoryConfig(**config_data.get("memory", {})),
     )
 
 
@@ -0,0 +1,44 @@
+"""消息去重 - 记录最近处理过的 ID"""
+import threading
+import time
+from collections import OrderedDict
+from src.metrics import metrics
+
+
+class RecentIdSet:
+    """线程安全的最近 ID 集合，超过容量或 TTL 的 ID 会被遗忘"""
+
+    def __init__(self, name: str, max_size: int = 50000, ttl: float = 24 * 3600):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._ids: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        with self._lock:
+            seen_at = self._ids.get(item_id)
+            return seen_at is not None and time.monotonic() - seen_at < self.ttl
+
+    def add(self, item_id: str) -> bool:
+        """记录 ID；已存在（重复）时返回 False"""
+        if not item_id:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._ids.get(item_id)
+            if seen_at is not None and now - seen_at < self.ttl:
+                metrics.inc("dedup_duplicate", set=self.name)
+                return False
+            self._ids[item_id] = now
+            self._ids.move_to_end(item_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+            return True
+
+
+# 已接收的飞书消息 ID（多条长连接、重复投递、补拉共用）
+processed_message_ids = RecentIdSet("message")
@@ -0,0 +1,117 @@
+"""优雅关闭 - 停止接收事件，在期限内完成在途的转换与发送，并记录未完成的工作"""
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.inbound_scheduler import inbound_scheduler
+from src.outbound_scheduler import outbound_scheduler
+from src.retry_queue import retry_queue
+from src.maibot_client import maibot_client
+from src.card_reply import card_replies
+from src.flood_control import flood_control
+from src.backfill import message_backfill
+from src.ack_reaction import ack_reactions
+
+
+def _message_id(args: tuple) -> str:
+    """从入站调度参数 (P2ImMessageReceiveV1 或补拉的消息 dict, ...) 中取出 message_id"""
+    try:
+        if isinstance(args[0], dict):
+            return args[0]["message"]["message_id"]
+        return args[0].event.message.message_id
+    except (AttributeError, IndexError, KeyError):
+        return ""
+
+
+class ShutdownDrainer:
+    """关闭时的排空流程
+
+    1. 各长连接停止接收事件并断开，之后投递的事件不确认，由飞书重新投递；
+       限流中等待（delay）或被折叠（collapse）的消息立即提交
+    2. 等待入站队列、限流、补拉、确认表情、MaiBot 发送、MaiBot 回复处理、出站线程池与熔断重试队列全部空闲，
+       且距离最后一次与 MaiBot 的往来超过 idle_grace 秒（给已转发消息的回复留出时间）；
+       最多等待 drain_timeout 秒
+    3. 超时仍未完成的工作写入 report_path 并输出日志
+    """
+
+    def busy(self) -> Dict[str, int]:
+        """仍在进行中的工作，只包含非零项"""
+        counts = {
+            "inbound_queued": len(inbound_scheduler),
+            "inbound_processing": inbound_scheduler.in_flight,
+            "maibot_sending": sum(backend.in_flight for backend in maibot_client.backends.values()),
+            "replies_processing": maibot_client.replies_in_flight,
+            "retry_queue": len(retry_queue),
+            "card_patches": card_replies.pending(),
+            "flood_held": flood_control.pending(),
+            "backfill_running": len(message_backfill.in_progress()),
+            "ack_reactions": ack_reactions.pending(),
+        }
+        counts.update({f"outbound_{name}": count for name, count in outbound_scheduler.pending().items()})
+        return {name: count for name, count in counts.items() if count}
+
+    async def drain(self, event_clients: Iterable[Any]):
+        cfg = global_config.shutdown
+        started = time.monotonic()
+        logger.info(f"🛑 进入排空模式，最多等待 {cfg.drain_timeout} 秒...")
+        for event_client in event_clients:
+            try:
+                await event_client.stop_ingest()
+            except Exception as e:
+                logger.warning(f"停止接收事件失败: {e}")
+        # 限流中等待或被折叠的消息不再等窗口结束，立即提交到入站队列
+        flood_control.flush()
+
+        deadline = started + cfg.drain_timeout
+        while True:
+            now = time.monotonic()
+            last_activity = max(maibot_client.last_sent_at, maibot_client.last_reply_at)
+            if not self.busy() and now - last_activity >= cfg.idle_grace:
+                break
+            if now >= deadline:
+                break
+            await asyncio.sleep(0.2)
+
+        remaining = self.busy()
+        metrics.observe("drain_seconds", time.monotonic() - started)
+        if not remaining:
+            logger.info(f"✅ 排空完成，用时 {time.monotonic() - started:.1f} 秒")
+            return
+        metrics.inc("drain_timeout")
+        logger.warning(f"⚠️ 排空超时，仍有未完成的工作: {remaining}")
+        self.report(remaining)
+
+    def report(self, remaining: Dict[str, int]):
+        """将未完成的工作写入报告文件，便于重启后排查或补发"""
+        now = time.monotonic()
+        report = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "remaining": remaining,
+            "inbound": [
+                {"priority": priority, "chat_id": chat_id, "message_id": _message_id(args),
+                 "waited": round(now - enqueued, 1)}
+                for priority, chat_id, enqueued, args in inbound_scheduler.pending_items()
+            ],
+            "deferred_sends": [
+                {"app": app, "endpoint": endpoint, "description": description, "waited": round(now - created, 1)}
+                for app, endpoint, description, created in retry_queue.pending_items()
+            ],
+        }
+        path = Path(global_config.shutdown.report_path)
+        if not path.is_absolute():
+            path = Path(__file__).parent.parent / path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logger.warning(f"📝 未完成的工作已记录到 {path}")
+        except OSError as e:
+            logger.error(f"❌ 写入未完成工作报告失败: {e}")
+
+
+# 全局排空流程
+shutdown_drainer = ShutdownDrainer()
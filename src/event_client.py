@@ -1,34 +1,114 @@
 """飞书长连接事件客户端 (使用官方 SDK)"""
 import asyncio
-import threading  # 🟢 引入 threading
+import json
+import time
+from typing import Any, Dict, List, Optional
 from lark_oapi import ws
+from lark_oapi.ws import client as lark_ws_client
+from lark_oapi.ws.exception import ClientException
 import lark_oapi as lark
 from lark_oapi.api.im.v1 import P2ImMessageReceiveV1
+from lark_oapi.api.contact.v3 import P2ContactUserUpdatedV3, P2ContactUserDeletedV3
 from lark_oapi.event.dispatcher_handler import EventDispatcherHandler
-from src.logger import logger
-from src.config import global_config
+from src.logger import logger, hot_logger
+from src.config import global_config, FeishuAppConfig
 from src.message_converter import process_feishu_message
-from src.feishu_client import feishu_client
+from src.chat_cache import chat_info_cache
+from src.user_cache import user_profile_cache
+from src.dedup import processed_message_ids
+from src.feishu_client import get_feishu_client
+from src.inbound_scheduler import inbound_scheduler, classify_message
+from src.flood_control import flood_control, COLLAPSE, DELAY
+from src.backfill import message_backfill
+from src.memory_governor import memory_governor
+from src.metrics import metrics
+
+
+class _RunningLoop:
+    """lark_oapi.ws.client 使用导入时创建的模块级 loop 变量调度任务；
+    替换为该代理后，SDK 的任务都创建在当前运行的事件循环（适配器主循环）上"""
+    
+    def __getattr__(self, name):
+        return getattr(asyncio.get_event_loop(), name)
+
+
+_HAS_MODULE_LOOP = hasattr(lark_ws_client, "loop")
+lark_ws_client.loop = _RunningLoop()
+
+# 首次连接失败后的重试间隔（秒）
+_FIRST_CONNECT_RETRY_INTERVAL = 30
+
+# 长连接的接管（_hook / _run_connection / stop_ingest）用到的 ws.Client 内部成员，
+# 升级 SDK 后若有缺失则在启动时直接报错，而不是运行中才失败
+_SDK_INTERNALS = (
+    "_connect", "_disconnect", "_receive_message_loop", "_get_conn_url",
+    "_ping_loop", "_auto_reconnect", "_conn",
+)
+
+
+def _check_sdk_internals(cli: ws.Client):
+    missing = [name for name in _SDK_INTERNALS if not hasattr(cli, name)]
+    if not _HAS_MODULE_LOOP:
+        missing.append("lark_oapi.ws.client.loop")
+    if missing:
+        raise RuntimeError(
+            f"当前 lark-oapi 版本与适配器不兼容（缺少 {', '.join(missing)}），"
+            f"请安装 requirements.txt 中指定的版本"
+        )
+
+
+class LongConnection:
+    """一条长连接：SDK 客户端及其运行状态"""
+
+    def __init__(self, cli: ws.Client, index: int):
+        self.cli = cli
+        self.index = index
+        self.state = "idle"  # idle / connecting / connected / disconnected / stopped / failed
+        self.connects = 0
+        self.reconnects = 0
+        self.connected_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "state": self.state,
+            "reconnects": self.reconnects,
+            "connected_for": round(time.time() - self.connected_at, 1) if self.state == "connected" else None,
+        }
 
 
 class FeishuEventClient:
-    """飞书长连接事件客户端"""
+    """飞书长连接事件客户端（每个飞书应用一个实例）
+
+    同一应用可建立多条长连接（feishu.connections），飞书会把事件分摊到各条连接。
+    长连接直接运行在适配器主事件循环上：SDK 的收包、解码与事件回调都在主循环中执行，
+    回调直接调用分发逻辑，不再跨线程投递。所有连接共享同一套去重与分发逻辑。
+    """
     
-    def __init__(self):
-        self.cli = None
+    def __init__(self, app: FeishuAppConfig):
+        self.app = app
+        self.connections: List[LongConnection] = []
         self.main_loop = None
-        self._thread = None  # 保存线程引用
+        self.draining = False
+        self._stopped = asyncio.Event()
+        self.events = 0
+        self.last_event_latency: Optional[float] = None
     
-    async def handle_message_event(self, event_data: P2ImMessageReceiveV1):
-        """处理消息事件"""
+    async def handle_message_event(self, event_data: P2ImMessageReceiveV1, collapsed: int = 0):
+        """处理消息事件
+
+        collapsed > 0 时 event_data 是一段被折叠刷屏中的最后一条，转换为一条摘要文本。
+        """
         try:
             event = event_data.event
             open_id = event.sender.sender_id.open_id
-            user_info = feishu_client.get_user_info(open_id) or {}
+            user_info = await user_profile_cache.get(open_id, self.app.name) or {}
             sender_name = user_info.get("name", "飞书用户")
             sender_avatar = user_info.get("avatar_url", "")
             
             message_data = {
+                "app": self.app.name,
                 "sender": {
                     "sender_id": {
                         "open_id": event.sender.sender_id.open_id,
@@ -52,74 +132,298 @@ class FeishuEventClient:
                     "mentions": getattr(event.message, 'mentions', None) or [],
                 }
             }
+            if collapsed:
+                message_data["message"].update({
+                    "message_type": "text",
+                    "content": json.dumps({"text": f"[短时间内发送了 {collapsed} 条消息，已折叠]"}, ensure_ascii=False),
+                    "mentions": [],
+                })
             await process_feishu_message(message_data)
         except Exception as e:
             logger.error(f"❌ 处理消息事件失败: {e}", exc_info=True)
     
     def on_message_sync(self, data: P2ImMessageReceiveV1):
         """消息事件回调"""
+        if self.draining:
+            # 排空中不再接收：回调失败时 SDK 不会确认该事件，由飞书重新投递
+            raise RuntimeError("适配器正在关闭，拒绝新事件")
+        if memory_governor.paused:
+            # 内存接近预算：同样不确认，等飞书重新投递时内存已回落
+            metrics.inc("events_rejected", reason="memory")
+            raise RuntimeError("内存接近预算，暂停接收事件")
         try:
-            logger.info(f"🔔 收到消息回调！")
-            
-            # 🟢 添加调试日志
+            # 🟢 每条消息都会触发，限速输出且只在真正输出时格式化
             event = data.event
-            chat_type = event.message.chat_type if event and event.message else "unknown"
-            chat_id = event.message.chat_id if event and event.message else "unknown"
-            logger.info(f"📋 消息详情: chat_type={chat_type}, chat_id={chat_id}")
+            if not event or not event.message:
+                return
+            message = event.message
+            self._observe_latency(data)
+            hot_logger.info(
+                "event_received", "🔔 收到消息回调: chat_type=%s, chat_id=%s",
+                message.chat_type, message.chat_id
+            )
+            # 多条连接或重复投递时同一消息只处理一次
+            if not processed_message_ids.add(message.message_id):
+                return
+            metrics.inc("events_received", app=self.app.name)
             
-            if self.main_loop and self.main_loop.is_running():
-                asyncio.run_coroutine_threadsafe(
-                    self.handle_message_event(data), 
-                    self.main_loop
-                )
-            else:
-                logger.warning("⚠️ 主事件循环不可用，无法处理消息")
+            # 只看会话类型与 mentions 判断优先级，消息内容留给调度后再解析
+            priority = classify_message(
+                message.chat_type, getattr(message, "mentions", None),
+                get_feishu_client(self.app.name).bot_open_id
+            )
+            self.dispatch_message(priority, data, time.monotonic())
         except Exception as e:
             logger.error(f"❌ 消息回调失败: {e}", exc_info=True)
+
+    def _observe_latency(self, data: P2ImMessageReceiveV1):
+        """事件延迟：飞书生成事件到适配器收到回调的时间"""
+        self.events += 1
+        try:
+            created_ms = int(data.header.create_time)
+        except (AttributeError, TypeError, ValueError):
+            return
+        latency = max(0.0, time.time() - created_ms / 1000)
+        self.last_event_latency = latency
+        metrics.observe("event_latency_seconds", latency, app=self.app.name)
+    
+    def dispatch_message(self, priority: str, data: P2ImMessageReceiveV1, first_seen: float):
+        """限流后提交到入站调度器（早于任何下载与资料查询）"""
+        event = data.event
+        sender_id = getattr(event.sender, "sender_id", None) if event.sender else None
+        open_id = getattr(sender_id, "open_id", "") or ""
+        chat_id = event.message.chat_id
+        message_backfill.record(
+            self.app.name, chat_id, event.message.chat_type, event.message.create_time, event.message.message_id
+        )
+        key, wait = flood_control.admit(open_id, chat_id)
+        if key is None:
+            inbound_scheduler.submit(priority, chat_id, self.handle_message_event, data)
+            return
+
+        cfg = global_config.flood_control
+        if cfg.mode == DELAY and time.monotonic() + wait - first_seen <= cfg.max_delay:
+            flood_control.delay(wait, self.dispatch_message, priority, data, first_seen)
+        elif cfg.mode == COLLAPSE:
+            flood_control.collapse(key, (priority, data), self._submit_collapsed)
+        else:
+            metrics.inc("inbound_dropped", cls=priority, reason="throttled")
+
+    def _submit_collapsed(self, last, count: int):
+        priority, data = last
+        inbound_scheduler.submit(priority, data.event.message.chat_id, self.handle_message_event, data, count)
+    
+    def on_chat_changed_sync(self, data):
+        """群信息变更/解散事件回调：让群信息缓存失效"""
+        try:
+            chat_id = getattr(data.event, "chat_id", "") if data.event else ""
+            if not chat_id:
+                return
+            logger.debug("🔄 群信息变更，缓存失效: %s", chat_id)
+            chat_info_cache.invalidate(chat_id, self.app.name)
+        except Exception as e:
+            logger.error(f"❌ 群信息变更回调失败: {e}", exc_info=True)
+    
+    def on_user_updated_sync(self, data: P2ContactUserUpdatedV3):
+        """通讯录用户变更事件回调：就地更新用户资料缓存"""
+        try:
+            user_event = getattr(data.event, "object", None) if data.event else None
+            if not user_event:
+                return
+            user_profile_cache.apply_update(user_event, self.app.name)
+        except Exception as e:
+            logger.error(f"❌ 用户变更回调失败: {e}", exc_info=True)
+    
+    def on_user_deleted_sync(self, data: P2ContactUserDeletedV3):
+        """通讯录用户删除事件回调：删除用户资料缓存"""
+        try:
+            user_event = getattr(data.event, "object", None) if data.event else None
+            open_id = getattr(user_event, "open_id", "") if user_event else ""
+            if open_id:
+                user_profile_cache.invalidate(open_id, self.app.name)
+        except Exception as e:
+            logger.error(f"❌ 用户删除回调失败: {e}", exc_info=True)
     
     async def connect(self):
-        """连接到飞书长连接服务"""
+        """建立长连接并持续运行，直到 stop_ingest() 停止所有连接"""
         try:
-            logger.info("🔗 正在建立飞书长连接...")
-            self.main_loop = asyncio.get_event_loop()
+            logger.info(f"🔗 正在建立飞书长连接 [{self.app.name}]...")
+            self.main_loop = asyncio.get_running_loop()
             
             handler_builder = EventDispatcherHandler.builder(
-                global_config.feishu.encrypt_key,
-                global_config.feishu.verification_token
+                self.app.encrypt_key,
+                self.app.verification_token
             )
             
             # 🟢 关键修复：注册群消息和私聊消息的事件处理器
             # p2 表示 API 版本 2.0（point 2）
             handler_builder.register_p2_im_message_receive_v1(self.on_message_sync)  # 通用消息接收
+            # 群信息变更 / 群解散：让群信息缓存失效
+            handler_builder.register_p2_im_chat_updated_v1(self.on_chat_changed_sync)
+            handler_builder.register_p2_im_chat_disbanded_v1(self.on_chat_changed_sync)
+            # 通讯录用户变更 / 删除：更新用户资料缓存
+            handler_builder.register_p2_contact_user_updated_v3(self.on_user_updated_sync)
+            handler_builder.register_p2_contact_user_deleted_v3(self.on_user_deleted_sync)
             
             logger.info("✅ 已注册消息接收事件处理器")
             
-            self.cli = ws.Client(
-                app_id=global_config.feishu.app_id,
-                app_secret=global_config.feishu.app_secret,
-                event_handler=handler_builder.build()
-            )
+            event_handler = handler_builder.build()
+            connections = max(1, self.app.connections)
+            self.connections = [
+                LongConnection(
+                    ws.Client(
+                        app_id=self.app.app_id,
+                        app_secret=self.app.app_secret,
+                        event_handler=event_handler
+                    ),
+                    index,
+                )
+                for index in range(connections)
+            ]
+            _check_sdk_internals(self.connections[0].cli)
             
-            logger.info("✅ 飞书长连接配置完成")
+            logger.info(f"✅ 飞书长连接配置完成 (连接数: {connections})")
             logger.info("💓 开始接收事件...")
             
-            # --- 🟢 关键修改：使用守护线程启动阻塞的 start() ---
-            # 守护线程 (daemon=True) 会在主程序退出时自动随之销毁，不会卡住程序
-            self._thread = threading.Thread(target=self.cli.start)
-            self._thread.daemon = True 
-            self._thread.start()
-            
-            # 注意：这里不再需要 await，因为线程在后台运行
-            
         except Exception as e:
             logger.error(f"❌ 建立长连接失败: {e}", exc_info=True)
             raise
+
+        for connection in self.connections:
+            self._hook(connection)
+            connection.task = self.main_loop.create_task(self._run_connection(connection))
+        await asyncio.gather(*(connection.task for connection in self.connections), return_exceptions=True)
+    
+    def _hook(self, connection: LongConnection):
+        """包装 SDK 客户端的连接、断开与收包循环（启动与自动重连都经过这里）
+
+        - 获取连接地址是同步 HTTP 请求，放到线程池中执行，不阻塞主循环
+        - 连接建立后记录状态与重连次数，并触发断线补拉；补拉先于本连接的事件执行，
+          高水位快照不会被新事件推进
+        - 主动停止时收包循环的退出异常不再抛出
+        """
+        cli = connection.cli
+        connect, disconnect, receive_loop = cli._connect, cli._disconnect, cli._receive_message_loop
+        get_conn_url = cli._get_conn_url
+
+        async def connect_hooked():
+            connection.state = "connecting"
+            url = await asyncio.get_running_loop().run_in_executor(None, get_conn_url)
+            cli._get_conn_url = lambda: url
+            try:
+                await connect()
+            finally:
+                cli._get_conn_url = get_conn_url
+            if cli._conn is None:
+                return
+            connection.state = "connected"
+            connection.connected_at = time.time()
+            connection.connects += 1
+            if connection.connects > 1:
+                connection.reconnects += 1
+                metrics.inc("feishu_reconnects", app=self.app.name)
+                logger.info(f"🔗 飞书长连接已重连 [{self.app.name}#{connection.index}]，累计 {connection.reconnects} 次")
+            self._update_gauge()
+            message_backfill.trigger(self.app.name)
+
+        async def disconnect_hooked():
+            await disconnect()
+            if connection.state == "connected":
+                connection.state = "disconnected"
+                self._update_gauge()
+
+        async def receive_loop_hooked():
+            try:
+                await receive_loop()
+            except Exception as e:
+                # 主动停止时的断开是预期的；否则是 SDK 重连次数用尽
+                if not self.draining:
+                    connection.state = "failed"
+                    self._update_gauge()
+                    logger.error(f"❌ 飞书长连接已断开且重连失败 [{self.app.name}#{connection.index}]: {e}")
+
+        cli._connect = connect_hooked
+        cli._disconnect = disconnect_hooked
+        cli._receive_message_loop = receive_loop_hooked
+
+    async def _run_connection(self, connection: LongConnection):
+        """与 SDK 的 start() 相同的流程，但运行在主循环上，并可由 stop_ingest() 停止"""
+        cli = connection.cli
+        # 首次连接失败时自行重试（而不是交给 SDK 的 _reconnect），每次重试前检查是否已停止，
+        # 避免 stop_ingest() 之后仍在重连而拖住优雅关闭
+        while True:
+            try:
+                await cli._connect()
+                break
+            except ClientException as e:
+                # 凭证等客户端错误，重试也无法恢复
+                connection.state = "failed"
+                logger.error(f"❌ 飞书长连接失败 [{self.app.name}#{connection.index}]: {e}")
+                return
+            except Exception as e:
+                logger.error(
+                    f"❌ 飞书长连接失败 [{self.app.name}#{connection.index}]: {e}，"
+                    f"{_FIRST_CONNECT_RETRY_INTERVAL} 秒后重连"
+                )
+                await cli._disconnect()
+                connection.state = "disconnected"
+            try:
+                await asyncio.wait_for(self._stopped.wait(), _FIRST_CONNECT_RETRY_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+        if self._stopped.is_set():
+            # 连接建立期间已被停止
+            await cli._disconnect()
+            return
+
+        ping = self.main_loop.create_task(cli._ping_loop())
+        try:
+            await self._stopped.wait()
+        finally:
+            ping.cancel()
+
+    def _update_gauge(self):
+        connected = sum(1 for connection in self.connections if connection.state == "connected")
+        metrics.set_gauge("feishu_connections", connected, app=self.app.name)
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "events": self.events,
+            "last_event_latency": round(self.last_event_latency, 3) if self.last_event_latency is not None else None,
+            "connections": [connection.info() for connection in self.connections],
+        }
+
+    async def reconnect(self):
+        """主动断开各条连接，由 SDK 的自动重连重新建立（重连后同样触发补拉）"""
+        for connection in self.connections:
+            if connection.state == "connected":
+                await connection.cli._disconnect()
+
+    async def stop_ingest(self):
+        """停止接收新事件并断开长连接（关闭 SDK 的自动重连）"""
+        if self.draining:
+            return
+        self.draining = True
+        self._stopped.set()
+        for connection in self.connections:
+            connection.cli._auto_reconnect = False
+            try:
+                await connection.cli._disconnect()
+            except Exception as e:
+                logger.debug(f"断开长连接时出错: {e}")
+            connection.state = "stopped"
+        self._update_gauge()
+        logger.info(f"🔌 飞书长连接已停止接收事件 [{self.app.name}]")
     
     async def disconnect(self):
         """断开连接"""
-        # 🟢 关键修改：不再调用不存在的 close()
-        # 由于我们使用了守护线程，主程序退出时，长连接线程会自动被系统回收
-        logger.info("🔌 飞书长连接客户端已标记为停止")
+        await self.stop_ingest()
+        tasks = [connection.task for connection in self.connections if connection.task and not connection.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-# 全局实例
-feishu_event_client = FeishuEventClient()
\ No newline at end of file
+# 每个飞书应用一个长连接客户端
+feishu_event_clients = [FeishuEventClient(app) for app in global_config.feishu.all_apps()]
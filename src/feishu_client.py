@@ -1,27 +1,86 @@
 """飞书 API 客户端"""
 import requests
+import hashlib
 import json
+import os
 import time
-from typing import Optional, Dict, Any
-from src.logger import logger
-from src.config import global_config
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, List, Tuple, Union
+from src.logger import logger, hot_logger
+from src.config import global_config, FeishuAppConfig
+from src.base64_codec import BufferReader
+from src.circuit_breaker import circuit_breakers, CircuitOpenError
+from src.warm_cache import warm_cache
 from requests_toolbelt import MultipartEncoder
 
+
+def _create_http_session() -> requests.Session:
+    """创建所有飞书应用共享的 HTTP 连接池"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# 共享 HTTP 连接池
+http_session = _create_http_session()
+
+# 流式下载时每次读取的块大小
+_DOWNLOAD_CHUNK = 256 * 1024
+
+
 class FeishuClient:
     """飞书 API 客户端 (Requests 版)"""
     
-    def __init__(self):
-        self.app_id = global_config.feishu.app_id
-        self.app_secret = global_config.feishu.app_secret
+    def __init__(self, app: FeishuAppConfig):
+        self.app_name = app.name
+        self.app_id = app.app_id
+        self.app_secret = app.app_secret
+        self.session = http_session
+        self.bot_open_id = ""  # 启动时通过 bot/v3/info 获取
         self._tenant_access_token = None
         self._token_expire_time = 0
+        self.token_fetched_at = 0.0
         self.base_url = "https://open.feishu.cn/open-apis"
+
+    def _request(self, endpoint: str, method: str, url: str, **kwargs) -> requests.Response:
+        """经过熔断器发送请求
+
+        超时、连接错误与 HTTP 5xx/429 记为失败；接口已熔断时不发请求，直接抛出 CircuitOpenError。
+        """
+        breaker = circuit_breakers.get(self.app_name, endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(self.app_name, endpoint)
+        start = time.monotonic()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 500 or response.status_code == 429
+            return response
+        finally:
+            breaker.record(failed, time.monotonic() - start)
+
+    def _get_send_token(self) -> str:
+        """发送类请求获取 token；鉴权接口熔断时抛出 CircuitOpenError，以便调用方暂存重试"""
+        token = self._get_tenant_access_token()
+        if not token and circuit_breakers.get(self.app_name, "auth").is_open():
+            raise CircuitOpenError(self.app_name, "auth")
+        return token
     
     def _get_tenant_access_token(self) -> str:
         """获取 tenant_access_token (带缓存)"""
         now = time.time()
         if self._tenant_access_token and now < self._token_expire_time:
             return self._tenant_access_token
+        if self._tenant_access_token is None and global_config.warm_start.persist_token:
+            # 进程启动后首次获取：优先使用快照中仍在有效期内的 token
+            saved = warm_cache.lookup("tenant_token", self.app_id)
+            if saved is not None:
+                self._tenant_access_token, self._token_expire_time = saved
+                self.token_fetched_at = now
+                logger.info(f"♻️ 使用快照中的 tenant_access_token [{self.app_name}]")
+                return self._tenant_access_token
         
         url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
         headers = {
@@ -33,19 +92,24 @@ class FeishuClient:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = self._request("auth", "POST", url, headers=headers, json=payload, timeout=10)
             response.raise_for_status()
             data = response.json()
             
             if data.get("code") == 0:
                 self._tenant_access_token = data.get("tenant_access_token")
+                self.token_fetched_at = now
                 # 提前 5 分钟过期
                 self._token_expire_time = now + data.get("expire", 7200) - 300
+                if global_config.warm_start.persist_token:
+                    warm_cache.put("tenant_token", self.app_id, self._tenant_access_token, self._token_expire_time)
                 logger.info("✅ 成功获取 tenant_access_token")
                 return self._tenant_access_token
             else:
                 logger.error(f"❌ 获取 tenant_access_token 失败: {data}")
                 return ""
+        except CircuitOpenError:
+            return ""
         except Exception as e:
             logger.error(f"❌ 获取 tenant_access_token 异常: {e}")
             return ""
@@ -57,8 +121,8 @@ class FeishuClient:
         msg_type: str,
         content: str
     ) -> bool:
-        """发送消息"""
-        token = self._get_tenant_access_token()
+        """发送消息，接口熔断时抛出 CircuitOpenError"""
+        token = self._get_send_token()
         if not token:
             return False
             
@@ -77,22 +141,27 @@ class FeishuClient:
         }
         
         try:
-            response = requests.post(url, params=params, headers=headers, json=payload, timeout=10)
+            response = self._request("send_message", "POST", url, params=params, headers=headers, json=payload, timeout=10)
             
             # 记录 logid 方便排查
             if "X-Tt-Logid" in response.headers:
-                logger.debug(f"Feishu Request LogID: {response.headers['X-Tt-Logid']}")
+                logger.debug("Feishu Request LogID: %s", response.headers['X-Tt-Logid'])
             
             response.raise_for_status()
             data = response.json()
             
             if data.get("code") == 0:
-                logger.info(f"✅ 消息发送成功: {receive_id} (msg_id: {data.get('data', {}).get('message_id')})")
+                hot_logger.info(
+                    "message_sent", "✅ 消息发送成功: %s (msg_id: %s)",
+                    receive_id, data.get('data', {}).get('message_id')
+                )
                 return True
             else:
                 logger.error(f"❌ 消息发送失败: {data}")
                 return False
                 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"❌ 发送消息异常: {e}")
             return False
@@ -103,8 +172,8 @@ class FeishuClient:
         msg_type: str,
         content: str
     ) -> bool:
-        """回复消息"""
-        token = self._get_tenant_access_token()
+        """回复消息，接口熔断时抛出 CircuitOpenError"""
+        token = self._get_send_token()
         if not token:
             return False
             
@@ -121,25 +190,117 @@ class FeishuClient:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = self._request("reply_message", "POST", url, headers=headers, json=payload, timeout=10)
             
             if "X-Tt-Logid" in response.headers:
-                logger.debug(f"Feishu Reply LogID: {response.headers['X-Tt-Logid']}")
+                logger.debug("Feishu Reply LogID: %s", response.headers['X-Tt-Logid'])
                 
             response.raise_for_status()
             data = response.json()
             
             if data.get("code") == 0:
-                logger.info(f"✅ 回复消息成功: {message_id}")
+                hot_logger.info("message_replied", "✅ 回复消息成功: %s", message_id)
                 return True
             else:
                 logger.error(f"❌ 回复消息失败: {data}")
                 return False
                 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"❌ 回复消息异常: {e}")
             return False
 
+    def batch_send(self, open_ids: List[str], msg_type: str, content: Dict[str, Any]) -> Optional[List[str]]:
+        """批量发送消息给多个用户（message/v4/batch_send，单次最多 200 人），接口熔断时抛出 CircuitOpenError
+
+        Returns:
+            无效（未发送）的 open_id 列表，请求失败时返回 None
+        """
+        token = self._get_send_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/message/v4/batch_send/"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {"open_ids": open_ids, "msg_type": msg_type, "content": content}
+
+        try:
+            response = self._request("batch_send", "POST", url, headers=headers, json=payload, timeout=30)
+            data = response.json()
+
+            if data.get("code") == 0:
+                result = data.get("data", {})
+                hot_logger.info("message_sent", "✅ 批量消息已提交: %d 人 (msg_id: %s)", len(open_ids), result.get("message_id"))
+                return result.get("invalid_open_ids") or []
+            else:
+                logger.error(f"❌ 批量发送失败: {data}")
+                return None
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 批量发送异常: {e}")
+            return None
+
+    def reply_card(self, message_id: str, card: str) -> Optional[str]:
+        """以消息卡片回复消息，返回卡片消息的 message_id（用于后续更新），失败或熔断时返回 None"""
+        token = self._get_send_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/im/v1/messages/{message_id}/reply"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {"msg_type": "interactive", "content": card}
+
+        try:
+            response = self._request("reply_message", "POST", url, headers=headers, json=payload, timeout=10)
+            data = response.json()
+
+            if data.get("code") == 0:
+                hot_logger.info("message_replied", "✅ 回复消息成功: %s", message_id)
+                return data.get("data", {}).get("message_id")
+            else:
+                logger.error(f"❌ 卡片回复失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"❌ 卡片回复异常: {e}")
+            return None
+
+    def patch_card(self, message_id: str, card: str) -> bool:
+        """更新已发送的消息卡片（卡片需开启 update_multi）"""
+        token = self._get_send_token()
+        if not token:
+            return False
+
+        url = f"{self.base_url}/im/v1/messages/{message_id}"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+
+        try:
+            response = self._request("patch_card", "PATCH", url, headers=headers, json={"content": card}, timeout=10)
+            data = response.json()
+
+            if data.get("code") == 0:
+                return True
+            else:
+                logger.warning(f"更新消息卡片失败: {data}")
+                return False
+        except CircuitOpenError:
+            return False
+        except Exception as e:
+            logger.error(f"更新消息卡片异常: {e}")
+            return False
+
     def get_user_info(self, open_id: str) -> Optional[Dict[str, Any]]:
         """获取用户信息"""
         token = self._get_tenant_access_token()
@@ -156,7 +317,7 @@ class FeishuClient:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._request("get_user_info", "GET", url, headers=headers, params=params, timeout=10)
             
             if response.status_code != 200:
                  logger.warning(f"获取用户信息 HTTP 状态码异常: {response.status_code}")
@@ -168,45 +329,404 @@ class FeishuClient:
             else:
                 logger.warning(f"获取用户信息失败: {data}")
                 return None
+        except CircuitOpenError:
+            return None
         except Exception as e:
             logger.error(f"获取用户信息异常: {e}")
             return None
-    # 🟢 [新增] 上传图片到飞书
-    def upload_image(self, image_data: bytes) -> Optional[str]:
-        """上传图片并获取 image_key"""
+    def get_message_resource(self, message_id: str, file_key: str, resource_type: str = "image") -> Optional[tuple]:
+        """下载消息中的资源文件，返回 (字节, MIME 类型)"""
+        token = self._get_tenant_access_token()
+        if not token:
+            logger.error("无法获取 access token")
+            return None
+        
+        # 🟢 使用正确的API：获取消息中的资源文件
+        # 文档: https://open.feishu.cn/document/uAjLw4CM/ukTMukTMukTM/reference/im-v1/message-resource/get
+        url = f"{self.base_url}/im/v1/messages/{message_id}/resources/{file_key}"
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        
+        # 指定返回类型为文件流
+        params = {
+            "type": resource_type
+        }
+        
+        try:
+            response = self._request("get_message_resource", "GET", url, headers=headers, params=params, timeout=10)
+            
+            if response.status_code == 200:
+                # 资源内容在响应体中
+                mime = response.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
+                return response.content, mime
+            else:
+                # 🟢 详细错误日志
+                try:
+                    error_data = response.json()
+                    logger.error(f"资源下载失败: HTTP {response.status_code}")
+                    logger.error(f"错误详情: {error_data}")
+                    logger.error(f"URL: {url}")
+                except:
+                    logger.error(f"资源下载失败: HTTP {response.status_code}, Response: {response.text[:200]}")
+                return None
+                
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"下载资源异常: {e}", exc_info=True)
+            return None
+
+    def download_resource_to_file(
+        self,
+        message_id: str,
+        file_key: str,
+        resource_type: str,
+        dest_path: Union[str, os.PathLike],
+        max_bytes: int = 0
+    ) -> Optional[Tuple[int, str, str]]:
+        """流式下载消息中的资源文件到磁盘，返回 (字节数, MIME 类型, sha256)
+
+        数据按块写入文件，不在内存中整体保留；超过 max_bytes 时中止并删除已写入的部分。
+        """
+        token = self._get_tenant_access_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/im/v1/messages/{message_id}/resources/{file_key}"
+        headers = {"Authorization": f"Bearer {token}"}
+        params = {"type": resource_type}
+        completed = False
+        try:
+            response = self._request(
+                "get_message_resource", "GET", url, headers=headers, params=params, timeout=30, stream=True
+            )
+            with response:
+                if response.status_code != 200:
+                    logger.error(f"资源下载失败: HTTP {response.status_code}, key: {file_key}")
+                    return None
+                length = int(response.headers.get("Content-Length") or 0)
+                if max_bytes and length > max_bytes:
+                    logger.warning(f"⚠️ 资源超过下载上限 ({length} > {max_bytes})，跳过: {file_key}")
+                    return None
+
+                digest = hashlib.sha256()
+                size = 0
+                with open(dest_path, "wb") as f:
+                    for chunk in response.iter_content(_DOWNLOAD_CHUNK):
+                        size += len(chunk)
+                        if max_bytes and size > max_bytes:
+                            logger.warning(f"⚠️ 资源超过下载上限 ({max_bytes})，已中止: {file_key}")
+                            return None
+                        digest.update(chunk)
+                        f.write(chunk)
+                mime = response.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+            completed = True
+            return size, mime, digest.hexdigest()
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"下载资源异常: {e}")
+            return None
+        finally:
+            if not completed:
+                try:
+                    os.unlink(dest_path)
+                except OSError:
+                    pass
+
+    def get_bot_info(self) -> Optional[Dict[str, Any]]:
+        """获取机器人自身信息"""
+        token = self._get_tenant_access_token()
+        if not token:
+            return None
+        
+        url = f"{self.base_url}/bot/v3/info"
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        try:
+            response = self._request("get_bot_info", "GET", url, headers=headers, timeout=10)
+            data = response.json()
+            
+            if data.get("code") == 0:
+                return data.get("bot", {})
+            else:
+                logger.warning(f"获取机器人信息失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"获取机器人信息异常: {e}")
+            return None
+
+    def get_message(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """获取指定消息的内容"""
         token = self._get_tenant_access_token()
+        if not token:
+            return None
+            
+        url = f"{self.base_url}/im/v1/messages/{message_id}"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        
+        try:
+            response = self._request("get_message", "GET", url, headers=headers, timeout=10)
+            data = response.json()
+            
+            if data.get("code") == 0:
+                items = data.get("data", {}).get("items") or []
+                return items[0] if items else None
+            else:
+                logger.warning(f"获取消息失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"获取消息异常: {e}")
+            return None
+
+    def list_chat_messages(
+        self, chat_id: str, start_time: int, page_token: str = "", page_size: int = 50
+    ) -> Optional[Dict[str, Any]]:
+        """按创建时间升序分页获取会话中 start_time（秒）之后的消息
+
+        Returns:
+            接口返回的 data（items / has_more / page_token），失败时返回 None
+        """
+        token = self._get_tenant_access_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/im/v1/messages"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        params = {
+            "container_id_type": "chat",
+            "container_id": chat_id,
+            "start_time": str(start_time),
+            "sort_type": "ByCreateTimeAsc",
+            "page_size": page_size,
+        }
+        if page_token:
+            params["page_token"] = page_token
+
+        try:
+            response = self._request("list_messages", "GET", url, headers=headers, params=params, timeout=10)
+            data = response.json()
+
+            if data.get("code") == 0:
+                return data.get("data", {})
+            else:
+                logger.warning(f"获取会话消息失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"获取会话消息异常: {e}")
+            return None
+
+    def get_chat_info(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """获取群信息"""
+        token = self._get_tenant_access_token()
+        if not token:
+            return None
+            
+        url = f"{self.base_url}/im/v1/chats/{chat_id}"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        
+        try:
+            response = self._request("get_chat_info", "GET", url, headers=headers, timeout=10)
+            data = response.json()
+            
+            if data.get("code") == 0:
+                return data.get("data", {})
+            else:
+                logger.warning(f"获取群信息失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"获取群信息异常: {e}")
+            return None
+
+    def add_reaction(self, message_id: str, emoji_type: str) -> Optional[str]:
+        """给消息添加表情回复，返回 reaction_id"""
+        token = self._get_tenant_access_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/im/v1/messages/{message_id}/reactions"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {"reaction_type": {"emoji_type": emoji_type}}
+
+        try:
+            response = self._request("reaction", "POST", url, headers=headers, json=payload, timeout=10)
+            data = response.json()
+
+            if data.get("code") == 0:
+                return data.get("data", {}).get("reaction_id")
+            else:
+                logger.warning(f"添加表情回复失败: {data}")
+                return None
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"添加表情回复异常: {e}")
+            return None
+
+    def delete_reaction(self, message_id: str, reaction_id: str) -> bool:
+        """删除机器人添加的表情回复"""
+        token = self._get_tenant_access_token()
+        if not token:
+            return False
+
+        url = f"{self.base_url}/im/v1/messages/{message_id}/reactions/{reaction_id}"
+        headers = {"Authorization": f"Bearer {token}"}
+
+        try:
+            response = self._request("reaction", "DELETE", url, headers=headers, timeout=10)
+            data = response.json()
+
+            if data.get("code") == 0:
+                return True
+            else:
+                logger.warning(f"删除表情回复失败: {data}")
+                return False
+        except CircuitOpenError:
+            return False
+        except Exception as e:
+            logger.error(f"删除表情回复异常: {e}")
+            return False
+
+    # 🟢 [新增] 上传图片到飞书
+    def upload_image(self, image_data: Union[bytes, bytearray, memoryview]) -> Optional[str]:
+        """上传图片并获取 image_key
+        
+        使用 MultipartEncoder 流式编码请求体，图片数据按块读取，不会整体复制一份。
+        接口熔断时抛出 CircuitOpenError。
+        """
+        token = self._get_send_token()
         if not token: return None
 
         url = f"{self.base_url}/im/v1/images"
-        headers = {"Authorization": f"Bearer {token}"}
         
         # 构造 multipart/form-data
         # image_type 必须是 message
-        files = {
-            'image_type': (None, 'message'),
-            'image': ('image.jpg', image_data)
+        encoder = MultipartEncoder(fields={
+            'image_type': 'message',
+            'image': ('image.jpg', BufferReader(image_data), 'application/octet-stream')
+        })
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": encoder.content_type
         }
         
         try:
-            response = requests.post(url, headers=headers, files=files, timeout=20)
+            response = self._request("upload_image", "POST", url, headers=headers, data=encoder, timeout=20)
             data = response.json()
             
             if data.get("code") == 0:
                 image_key = data.get("data", {}).get("image_key")
-                logger.info(f"✅ 图片上传成功, key: {image_key}")
+                hot_logger.info("image_uploaded", "✅ 图片上传成功, key: %s", image_key)
                 return image_key
             else:
                 logger.error(f"❌ 图片上传失败: {data}")
                 return None
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"❌ 上传图片异常: {e}")
             return None
 
+    def upload_file(
+        self,
+        source: Union[str, os.PathLike, bytes, bytearray, memoryview],
+        file_name: str,
+        file_type: str = "stream",
+        duration_ms: Optional[int] = None
+    ) -> Optional[str]:
+        """上传文件并获取 file_key
+
+        source 为本地路径时直接从磁盘分块读取，为字节缓冲时按块读取，均不整体复制。
+        file_type: opus / mp4 / pdf / doc / xls / ppt / stream。接口熔断时抛出 CircuitOpenError。
+        """
+        token = self._get_send_token()
+        if not token:
+            return None
+
+        url = f"{self.base_url}/im/v1/files"
+        opened = None
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                opened = open(source, "rb")
+                reader = opened
+            else:
+                reader = BufferReader(source)
+            fields = {
+                "file_type": file_type,
+                "file_name": file_name,
+                "file": (file_name, reader, "application/octet-stream"),
+            }
+            if duration_ms:
+                fields["duration"] = str(int(duration_ms))
+            encoder = MultipartEncoder(fields=fields)
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": encoder.content_type
+            }
+            response = self._request("upload_file", "POST", url, headers=headers, data=encoder, timeout=120)
+            data = response.json()
+
+            if data.get("code") == 0:
+                file_key = data.get("data", {}).get("file_key")
+                hot_logger.info("file_uploaded", "✅ 文件上传成功, key: %s", file_key)
+                return file_key
+            else:
+                logger.error(f"❌ 文件上传失败: {data}")
+                return None
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 上传文件异常: {e}")
+            return None
+        finally:
+            if opened is not None:
+                opened.close()
+
+    def send_file_message(self, receive_id: str, receive_id_type: str, file_key: str, msg_type: str = "file") -> bool:
+        """发送文件 (file) 或语音 (audio) 消息"""
+        content = json.dumps({"file_key": file_key})
+        return self.send_message(receive_id, receive_id_type, msg_type, content)
+
     # 🟢 [新增] 发送图片消息
     def send_image_message(self, receive_id: str, receive_id_type: str, image_key: str) -> bool:
         """发送图片消息"""
         content = json.dumps({"image_key": image_key})
         return self.send_message(receive_id, receive_id_type, "image", content)
 
-# 全局飞书客户端实例
-feishu_client = FeishuClient()
+# 各应用的飞书客户端，按应用名称索引
+feishu_clients: Dict[str, FeishuClient] = {
+    app.name: FeishuClient(app) for app in global_config.feishu.all_apps()
+}
+
+# 默认应用的客户端（单应用部署时即唯一的客户端）
+feishu_client = next(iter(feishu_clients.values()))
+
+
+def get_feishu_client(app_name: Optional[str] = None) -> FeishuClient:
+    """按应用名称获取客户端，名称为空或未知时返回默认应用"""
+    if app_name and app_name in feishu_clients:
+        return feishu_clients[app_name]
+    if app_name:
+        logger.warning(f"⚠️ 未知的飞书应用: {app_name}，使用默认应用")
+    return feishu_client
@@ -0,0 +1,161 @@
+"""入站限流 - 按用户与会话的令牌桶，防止刷屏或机器人互相回复打满下载与 MaiBot"""
+import asyncio
+import itertools
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.logger import hot_logger
+from src.config import global_config
+from src.metrics import metrics
+
+DROP = "drop"
+COLLAPSE = "collapse"
+DELAY = "delay"
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多 burst 个"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, rate: float) -> float:
+        """距离下一个令牌可用的秒数"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else float("inf")
+
+
+class _CollapsedBurst:
+    """被折叠的一段刷屏：只保留条数与最后一条消息"""
+
+    __slots__ = ("count", "last", "timer", "flush")
+
+    def __init__(self, flush: Callable[[Any, int], Any]):
+        self.count = 0
+        self.last: Any = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.flush = flush
+
+
+class FloodControl:
+    """按 open_id 与 chat_id 的入站令牌桶
+
+    在解析消息、查询资料与下载图片之前调用，只在主事件循环中使用。
+    超限的消息按 mode 处理：
+    - drop: 直接丢弃
+    - collapse: 同一来源 collapse_window 秒内的超限消息合并为一条摘要
+    - delay: 等待令牌补充后再处理，累计等待超过 max_delay 时丢弃
+    关闭时 flush() 立即放行所有等待中与折叠中的消息，之后不再限流。
+    """
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._bursts: Dict[str, _CollapsedBurst] = {}
+        self._delayed: Dict[int, Tuple[asyncio.TimerHandle, Callable[..., Any], tuple]] = {}
+        self._delay_ids = itertools.count()
+        self._flushed = False
+        # 被限流最多的来源，用于排查（只保留计数，不做指标标签，避免基数爆炸）
+        self.throttled: Counter = Counter()
+
+    def _bucket(self, key: str, burst: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(burst, now)
+            while len(self._buckets) > global_config.flood_control.max_tracked:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def admit(self, open_id: str, chat_id: str) -> Tuple[Optional[str], float]:
+        """尝试为一条消息取令牌
+
+        Returns:
+            (超限的来源键，放行时为 None；距离下一个令牌的秒数)
+        """
+        cfg = global_config.flood_control
+        if not cfg.enable or self._flushed:
+            return None, 0.0
+        now = time.monotonic()
+        limits = []
+        if open_id:
+            limits.append((f"user:{open_id}", cfg.user_rate, cfg.user_burst))
+        if chat_id:
+            limits.append((f"chat:{chat_id}", cfg.chat_rate, cfg.chat_burst))
+
+        buckets = []
+        for key, rate, burst in limits:
+            bucket = self._bucket(key, burst, now)
+            bucket.refill(rate, burst, now)
+            if bucket.tokens < 1:
+                self.throttled[key] += 1
+                if len(self.throttled) > cfg.max_tracked:
+                    self.throttled = Counter(dict(self.throttled.most_common(cfg.max_tracked // 2)))
+                metrics.inc("inbound_throttled", scope=key.split(":", 1)[0], mode=cfg.mode)
+                hot_logger.info("inbound_throttled", "🚦 入站限流: %s", key)
+                return key, bucket.wait_time(rate)
+            buckets.append(bucket)
+        # 所有来源都有令牌时才扣除，避免被会话限流的消息白白消耗用户令牌
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return None, 0.0
+
+    def delay(self, wait: float, callback: Callable[..., Any], *args: Any):
+        """wait 秒后重新调用 callback(*args)（delay 模式），关闭时由 flush() 提前执行"""
+        delay_id = next(self._delay_ids)
+        handle = asyncio.get_running_loop().call_later(wait, self._run_delayed, delay_id)
+        self._delayed[delay_id] = (handle, callback, args)
+
+    def _run_delayed(self, delay_id: int):
+        entry = self._delayed.pop(delay_id, None)
+        if entry is not None:
+            _, callback, args = entry
+            callback(*args)
+
+    def collapse(self, key: str, message: Any, flush: Callable[[Any, int], Any]):
+        """记录一条被折叠的消息；窗口结束时以 (最后一条消息, 条数) 调用 flush"""
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _CollapsedBurst(flush)
+            burst.timer = asyncio.get_running_loop().call_later(
+                global_config.flood_control.collapse_window, self._flush, key
+            )
+        burst.count += 1
+        burst.last = message
+
+    def _flush(self, key: str):
+        burst = self._bursts.pop(key, None)
+        if burst and burst.count:
+            metrics.inc("inbound_collapsed", burst.count)
+            burst.flush(burst.last, burst.count)
+
+    def pending(self) -> int:
+        """等待放行（delay）与折叠中（collapse）的消息数"""
+        return len(self._delayed) + sum(burst.count for burst in self._bursts.values())
+
+    def flush(self):
+        """关闭时调用：立即放行等待中的消息、提交折叠摘要，此后不再限流"""
+        self._flushed = True
+        for delay_id in list(self._delayed):
+            handle = self._delayed[delay_id][0]
+            handle.cancel()
+            self._run_delayed(delay_id)
+        for key, burst in list(self._bursts.items()):
+            if burst.timer is not None:
+                burst.timer.cancel()
+            self._flush(key)
+
+    def top_throttled(self, n: int = 10) -> List[Tuple[str, int]]:
+        return self.throttled.most_common(n)
+
+
+# 全局入站限流器
+flood_control = FloodControl()
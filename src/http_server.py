@@ -0,0 +1,83 @@
+"""本地 HTTP 服务 - 健康检查、blob 下载与 /admin 诊断接口（见 src/admin.py）"""
+from typing import Optional
+from aiohttp import web
+from src.logger import logger
+from src.config import global_config
+from src.blob_store import blob_store
+
+# 单次写出的块大小，避免一次性复制整个 blob
+_CHUNK_SIZE = 64 * 1024
+
+
+class LocalHTTPServer:
+    """基于 aiohttp 的本地 HTTP 服务"""
+
+    def __init__(self):
+        self.app = web.Application()
+        self._runner: Optional[web.AppRunner] = None
+        self.app.router.add_get("/health", self.handle_health)
+        self.app.router.add_get("/blobs/{blob_id}", self.handle_blob)
+
+    @property
+    def base_url(self) -> str:
+        """MaiBot 访问本服务使用的地址"""
+        cfg = global_config.server
+        if cfg.public_base_url:
+            return cfg.public_base_url.rstrip("/")
+        return f"http://{cfg.host}:{cfg.port}"
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    def blob_url(self, blob_id: str) -> str:
+        return f"{self.base_url}/blobs/{blob_id}"
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """健康检查"""
+        return web.json_response({
+            "status": "healthy",
+            "service": "MaiBot-Feishu-Adapter"
+        })
+
+    async def handle_blob(self, request: web.Request) -> web.StreamResponse:
+        """按 blob_id 直接从 mmap 分块输出"""
+        found = blob_store.get(request.match_info["blob_id"])
+        if found is None:
+            raise web.HTTPNotFound()
+
+        view, mime = found
+        try:
+            response = web.StreamResponse(headers={"Cache-Control": "max-age=3600"})
+            response.content_type = mime
+            response.content_length = len(view)
+            await response.prepare(request)
+            for offset in range(0, len(view), _CHUNK_SIZE):
+                await response.write(view[offset:offset + _CHUNK_SIZE])
+            await response.write_eof()
+            return response
+        finally:
+            view.release()
+
+    async def start(self):
+        """启动服务"""
+        if self._runner is not None:
+            return
+        cfg = global_config.server
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, cfg.host, cfg.port)
+        await site.start()
+        self._runner = runner
+        logger.info(f"🌐 本地 HTTP 服务已启动: http://{cfg.host}:{cfg.port}")
+
+    async def stop(self):
+        """停止服务"""
+        if self._runner is None:
+            return
+        runner, self._runner = self._runner, None
+        await runner.cleanup()
+
+
+# 全局 HTTP 服务实例
+http_server = LocalHTTPServer()
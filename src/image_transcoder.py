@@ -0,0 +1,143 @@
+"""图片转码模块 - 在进程池中缩小图片后再转发给 MaiBot"""
+import asyncio
+import importlib.util
+import io
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+_FORMAT_MIME = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+
+def _transcode_worker(
+    data: bytes, max_dimension: int, target_format: str, quality: int, skip_below_bytes: int
+) -> Optional[Tuple[bytes, str]]:
+    """在子进程中执行的转码函数，无需处理时返回 None"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        # 动图转码会丢帧，保持原样
+        if getattr(img, "is_animated", False):
+            return None
+        if max(img.size) <= max_dimension and len(data) < skip_below_bytes:
+            return None
+
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        if target_format == "JPEG" and img.mode not in ("RGB", "L"):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            img = background
+
+        out = io.BytesIO()
+        save_kwargs = {"optimize": True}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+        img.save(out, format=target_format, **save_kwargs)
+
+    result = out.getvalue()
+    if len(result) >= len(data):
+        return None
+    return result, _FORMAT_MIME.get(target_format, "application/octet-stream")
+
+
+class ImageTranscoder:
+    """图片转码器
+
+    Pillow 的解码/缩放/编码全部在独立进程中完成，事件循环只负责等待结果。
+    结果按 image_key 做 LRU 缓存，同一张图片被重复转发时不再重复计算。
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 无需转码的图片缓存为 None，只记结论不保留原图
+        self._cache: "OrderedDict[str, Optional[Tuple[bytes, str]]]" = OrderedDict()
+        self._available: Optional[bool] = None
+
+    @property
+    def enabled(self) -> bool:
+        if not global_config.image.transcode_enable:
+            return False
+        if self._available is None:
+            self._available = importlib.util.find_spec("PIL") is not None
+            if not self._available:
+                logger.warning("⚠️ 已开启图片转码，但未安装 Pillow，转码将被跳过")
+        return self._available
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 此时事件循环、SDK 与日志线程都已在运行，fork 可能复制到被持有的锁而死锁，
+            # 因此用 spawn 启动全新的子进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=max(1, global_config.image.transcode_workers),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def transcode(self, image_key: str, data: bytes, mime: str) -> Tuple[bytes, str]:
+        """按配置转码图片，失败或无需处理时返回原图"""
+        if not self.enabled:
+            return data, mime
+
+        if image_key in self._cache:
+            self._cache.move_to_end(image_key)
+            metrics.inc("image_transcode_cache_hit")
+            return self._cache[image_key] or (data, mime)
+
+        cfg = global_config.image
+        target_format = cfg.target_format.upper()
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._get_executor(),
+                _transcode_worker,
+                data,
+                cfg.max_dimension,
+                target_format,
+                cfg.quality,
+                cfg.skip_below_bytes,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 图片转码失败，使用原图: {e}")
+            metrics.inc("image_transcode_failed")
+            return data, mime
+
+        elapsed = time.perf_counter() - start
+        metrics.observe("image_transcode_seconds", elapsed)
+
+        if result is None:
+            metrics.inc("image_transcode_skipped")
+        else:
+            saved = len(data) - len(result[0])
+            metrics.inc("image_transcode_bytes_saved", saved)
+            metrics.inc("image_transcode_done")
+            logger.debug(
+                "🗜️ 图片转码 %s: %d -> %d 字节, 耗时 %.0fms", image_key, len(data), len(result[0]), elapsed * 1000
+            )
+
+        self._cache[image_key] = result
+        while len(self._cache) > cfg.transcode_cache_size:
+            self._cache.popitem(last=False)
+        return result or (data, mime)
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局图片转码器实例
+image_transcoder = ImageTranscoder()
@@ -0,0 +1,192 @@
+"""入站消息调度 - 私聊 / @机器人 / 普通群消息分级，会话间公平排队"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from src.logger import logger, hot_logger
+from src.config import global_config
+from src.metrics import metrics
+
+# 优先级类别
+DM = "dm"  # 私聊
+MENTION = "mention"  # 群聊中 @机器人
+GROUP = "group"  # 普通群消息
+
+CLASSES = (DM, MENTION, GROUP)
+
+# (入队时间, 处理函数, 参数, 过载/超时时是否可丢弃)
+InboundItem = Tuple[float, Callable[..., Awaitable[Any]], tuple, bool]
+
+
+def _field(obj: Any, name: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def classify_message(chat_type: str, mentions: Optional[List[Any]], bot_open_id: str = "") -> str:
+    """根据会话类型与 mentions 判断优先级，不解析消息内容
+
+    已知机器人 open_id 时精确匹配；未知时（启动早期）任何 @个人 都视为 @机器人。
+    """
+    if chat_type == "p2p":
+        return DM
+    for mention in mentions or []:
+        mention_id = _field(mention, "id")
+        open_id = mention_id if isinstance(mention_id, str) else _field(mention_id, "open_id")
+        if not open_id:
+            continue
+        if not bot_open_id or open_id == bot_open_id:
+            return MENTION
+    return GROUP
+
+
+class InboundScheduler:
+    """入站消息调度器
+
+    - 每个优先级类别内按会话分队列，会话之间轮转出队，刷屏的群不会挤占其他群
+    - 类别之间按权重（平滑加权轮询）出队，私聊与 @机器人 优先，普通群消息不会被饿死
+    - 固定数量的处理协程限制同时转换的消息数
+    - 过载时先丢弃普通群消息：超过 max_ambient_queue 时丢弃最长会话中最旧的一条，
+      出队时排队超过 ambient_max_delay 的普通群消息直接丢弃
+    - droppable=False 提交的消息（补拉）不参与上述丢弃，由提交方自行控制数量
+    """
+
+    def __init__(self):
+        cfg = global_config.inbound
+        self.weights = {DM: cfg.dm_weight, MENTION: cfg.mention_weight, GROUP: cfg.group_weight}
+        self._queues: Dict[str, "OrderedDict[str, Deque[InboundItem]]"] = {
+            name: OrderedDict() for name in CLASSES
+        }
+        self._sizes: Dict[str, int] = {name: 0 for name in CLASSES}
+        self._credits: Dict[str, int] = {name: 0 for name in CLASSES}
+        self._ready: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.in_flight = 0
+
+    def __len__(self) -> int:
+        return sum(self._sizes.values())
+
+    def depth(self) -> Dict[str, int]:
+        return dict(self._sizes)
+
+    def pending_items(self):
+        """遍历排队中的消息：(类别, chat_id, 入队时间, 参数)"""
+        for priority, chats in self._queues.items():
+            for chat_id, queue in chats.items():
+                for enqueued, _, args, _ in queue:
+                    yield priority, chat_id, enqueued, args
+
+    def submit(
+        self, priority: str, chat_id: str, fn: Callable[..., Awaitable[Any]], *args: Any, droppable: bool = True
+    ) -> bool:
+        """提交一条入站消息（只能在主事件循环中调用），队列已满被丢弃时返回 False"""
+        cfg = global_config.inbound
+        if len(self) >= cfg.max_queue:
+            metrics.inc("inbound_dropped", cls=priority, reason="queue_full")
+            hot_logger.info("inbound_dropped", "⚠️ 入站队列已满，丢弃消息: %s", chat_id)
+            return False
+        if priority == GROUP and self._sizes[GROUP] >= cfg.max_ambient_queue:
+            self._drop_ambient()
+
+        chats = self._queues[priority]
+        queue = chats.get(chat_id)
+        if queue is None:
+            queue = chats[chat_id] = deque()
+        queue.append((time.monotonic(), fn, args, droppable))
+        self._sizes[priority] += 1
+        metrics.set_gauge("inbound_queue_depth", self._sizes[priority], cls=priority)
+
+        self._ensure_workers()
+        self._ready.set()
+        return True
+
+    def _drop_ambient(self):
+        """丢弃排队最长的群中最旧的一条可丢弃的普通消息"""
+        chats = self._queues[GROUP]
+        for chat_id in sorted(chats, key=lambda key: len(chats[key]), reverse=True):
+            queue = chats[chat_id]
+            for index, item in enumerate(queue):
+                if item[3]:
+                    break
+            else:
+                continue
+            del queue[index]
+            break
+        else:
+            return
+        if not queue:
+            del chats[chat_id]
+        self._sizes[GROUP] -= 1
+        metrics.inc("inbound_dropped", cls=GROUP, reason="overload")
+        hot_logger.info("inbound_dropped", "⚠️ 入站过载，丢弃普通群消息: %s", chat_id)
+
+    def _next(self) -> Optional[Tuple[str, InboundItem]]:
+        """按类别权重与会话轮转取出下一条消息"""
+        active = [name for name in CLASSES if self._sizes[name]]
+        if not active:
+            return None
+        total = 0
+        for name in active:
+            self._credits[name] += self.weights[name]
+            total += self.weights[name]
+        chosen = max(active, key=lambda name: self._credits[name])
+        self._credits[chosen] -= total
+
+        chats = self._queues[chosen]
+        chat_id, queue = next(iter(chats.items()))
+        item = queue.popleft()
+        if queue:
+            chats.move_to_end(chat_id)
+        else:
+            del chats[chat_id]
+        self._sizes[chosen] -= 1
+        metrics.set_gauge("inbound_queue_depth", self._sizes[chosen], cls=chosen)
+        return chosen, item
+
+    def _ensure_workers(self):
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        self._workers = [task for task in self._workers if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < max(1, global_config.inbound.workers):
+            self._workers.append(loop.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            picked = self._next()
+            if picked is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            priority, (enqueued, fn, args, droppable) = picked
+            waited = time.monotonic() - enqueued
+            if priority == GROUP and droppable and waited > global_config.inbound.ambient_max_delay:
+                metrics.inc("inbound_dropped", cls=priority, reason="stale")
+                continue
+            metrics.observe("inbound_queue_seconds", waited, cls=priority)
+
+            self.in_flight += 1
+            try:
+                await fn(*args)
+            except Exception as e:
+                logger.error(f"❌ 处理入站消息失败: {e}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        if len(self):
+            logger.warning(f"⚠️ 退出时仍有 {len(self)} 条入站消息未处理")
+
+
+# 全局入站调度器
+inbound_scheduler = InboundScheduler()
@@ -1,27 +1,146 @@
-"""日志模块"""
+"""日志模块
+
+日志记录只把 LogRecord 放入队列，格式化和写 stdout 在后台线程完成，
+stdout 写入缓慢时不会反压事件循环。队列满时直接丢弃并计数。
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
-from datetime import datetime
+import threading
+import time
+from typing import Dict, Tuple
+from src.config import global_config
 
-# 创建日志记录器
-logger = logging.getLogger("feishu_adapter")
-logger.setLevel(logging.DEBUG)
+# 日志队列容量，超出后丢弃新日志
+_QUEUE_SIZE = 10000
 
-# 控制台处理器
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)
+
+class JsonFormatter(logging.Formatter):
+    """JSON 行格式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """不阻塞的队列处理器
+
+    标准 QueueHandler 会在调用线程里完成消息格式化；这里原样入队，
+    由后台线程格式化。队列满时丢弃日志而不是等待。
+    """
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_level(level: str) -> int:
+    value = logging.getLevelName(str(level).upper())
+    return value if isinstance(value, int) else logging.INFO
+
+
+_level = _parse_level(global_config.debug.level)
 
 # 日志格式
-formatter = logging.Formatter(
-    "%(asctime)s | %(levelname)-7s | %(name)s:%(funcName)s:%(lineno)d - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+if global_config.debug.log_format == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        "%(asctime)s | %(levelname)-7s | %(name)s:%(funcName)s:%(lineno)d - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+# 控制台处理器（运行在后台线程中）
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setLevel(_level)
 console_handler.setFormatter(formatter)
 
-# 添加处理器
-logger.addHandler(console_handler)
+_log_queue: "queue.Queue" = queue.Queue(maxsize=_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(_log_queue)
+_listener = logging.handlers.QueueListener(_log_queue, console_handler, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
+
+# 创建日志记录器
+logger = logging.getLogger("feishu_adapter")
+logger.setLevel(_level)
+logger.addHandler(queue_handler)
 
 # 为 maim_message 库创建专用 logger
 custom_logger = logging.getLogger("maim_message")
-custom_logger.setLevel(logging.INFO)
-custom_logger.addHandler(console_handler)
+custom_logger.setLevel(max(_level, logging.INFO))
+custom_logger.addHandler(queue_handler)
+
+
+class HotPathLogger:
+    """热路径日志限流
+
+    每条消息都会触发的日志按 key 限速：每个 key 每秒最多输出 rate 条，
+    被抑制的条数会附在下一条输出的日志后面。rate <= 0 表示不限速。
+    消息使用 % 格式参数，只有真正输出时才格式化。
+    """
+
+    def __init__(self, target: logging.Logger, rate: float):
+        self.target = target
+        self.rate = rate
+        self._lock = threading.Lock()
+        # key -> (窗口起始时间, 窗口内已输出条数, 被抑制条数)
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+
+    def _admit(self, key: str) -> Tuple[bool, int]:
+        if self.rate <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            start, emitted, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - start >= 1.0:
+                start, emitted = now, 0
+            if emitted < self.rate:
+                self._windows[key] = (start, emitted + 1, 0)
+                return True, suppressed
+            self._windows[key] = (start, emitted, suppressed + 1)
+            return False, 0
+
+    def log(self, level: int, key: str, msg: str, *args):
+        if not self.target.isEnabledFor(level):
+            return
+        admitted, suppressed = self._admit(key)
+        if not admitted:
+            return
+        if suppressed:
+            msg = msg + " (已省略 %d 条同类日志)"
+            args = args + (suppressed,)
+        # stacklevel=3 让日志记录调用方的函数名和行号
+        self.target.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, key: str, msg: str, *args):
+        self.log(logging.DEBUG, key, msg, *args)
+
+    def info(self, key: str, msg: str, *args):
+        self.log(logging.INFO, key, msg, *args)
+
+
+# 热路径日志（每条消息都会触发的日志）
+hot_logger = HotPathLogger(logger, global_config.debug.hot_path_log_rate)
@@ -1,38 +1,391 @@
 """MaiBot 通信客户端"""
 import json
 import asyncio
-import base64
+import bisect
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
 from maim_message import Router, RouteConfig, TargetConfig
-from src.logger import logger, custom_logger
-from src.config import global_config
-from src.feishu_client import feishu_client
+from src.logger import logger, hot_logger, custom_logger
+from src.config import global_config, MaiBotBackendConfig
+from src.feishu_client import get_feishu_client
+from src.base64_codec import decode_base64_off_loop
+from src.metrics import metrics
+from src.retry_queue import retry_queue
+from src.outbound_scheduler import outbound_scheduler, REPLY, IMAGE_UPLOAD, IMAGE_SEND, FILE_TRANSFER
+from src.cache import AsyncTTLCache
+from src.warm_cache import warm_cache
+from src.ack_reaction import ack_reactions
+from src.card_reply import card_replies
+from src.broadcast import broadcaster
 
-class MaiBotClient:
-    def __init__(self):
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环：实例增减或故障时只有该实例的会话被重新分配"""
+
+    def __init__(self, names: List[str], virtual_nodes: int):
+        points = []
+        for name in names:
+            for i in range(max(1, virtual_nodes)):
+                points.append((_hash(f"{name}#{i}"), name))
+        points.sort()
+        self._hashes = [point[0] for point in points]
+        self._names = [point[1] for point in points]
+
+    def lookup(self, key: str, healthy: set) -> Optional[str]:
+        """沿环顺时针查找第一个健康实例"""
+        if not self._hashes or not healthy:
+            return None
+        start = bisect.bisect(self._hashes, _hash(key))
+        for offset in range(len(self._hashes)):
+            name = self._names[(start + offset) % len(self._hashes)]
+            if name in healthy:
+                return name
+        return None
+
+
+# 已上传图片：(应用名称, 内容 SHA-256) -> image_key，相同图片不再重复上传
+uploaded_image_cache = AsyncTTLCache(
+    "uploaded_image",
+    ttl=global_config.cache.uploaded_image_ttl,
+    max_size=global_config.cache.uploaded_image_max_size,
+)
+warm_cache.register(uploaded_image_cache)
+
+
+def _sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def _upload_image_once(feishu_client, image_data) -> Optional[str]:
+    """按内容哈希复用已上传图片的 image_key，未上传过时才真正上传"""
+    loop = asyncio.get_running_loop()
+    key = (feishu_client.app_name, await loop.run_in_executor(None, _sha256, image_data))
+    warm_cache.restore(uploaded_image_cache, key)
+    image_key = uploaded_image_cache.get(key)
+    if image_key:
+        metrics.inc("image_upload_dedup_hit")
+        return image_key
+    image_key = await outbound_scheduler.run(IMAGE_UPLOAD, feishu_client.upload_image, image_data)
+    if image_key:
+        uploaded_image_cache.set(key, image_key)
+    return image_key
+
+
+def _upload_and_send(feishu_client, image_data, receive_id: str, receive_id_type: str, uploaded: Optional[dict] = None):
+    """构造上传+发送图片的任务，返回是否发送成功
+
+    上传与发送分别在 image_upload / image_send 线程池中执行；
+    上传得到的 image_key 会被记住，熔断后重试时不会重复上传。
+    广播时各目标共用同一个 uploaded，图片只上传一次。
+    """
+    uploaded = {} if uploaded is None else uploaded
+    lock = uploaded.setdefault("lock", asyncio.Lock())
+
+    async def upload_and_send():
+        async with lock:
+            if "image_key" not in uploaded:
+                image_key = await _upload_image_once(feishu_client, image_data)
+                if not image_key:
+                    return False
+                uploaded["image_key"] = image_key
+        return await outbound_scheduler.run(
+            IMAGE_SEND, feishu_client.send_image_message, receive_id, receive_id_type, uploaded["image_key"]
+        )
+
+    return upload_and_send
+
+
+# 文件扩展名 -> im/v1/files 的 file_type
+_FILE_TYPES = {
+    "mp4": "mp4", "pdf": "pdf",
+    "doc": "doc", "docx": "doc",
+    "xls": "xls", "xlsx": "xls",
+    "ppt": "ppt", "pptx": "ppt",
+    "opus": "opus", "ogg": "opus",
+}
+
+
+async def _resolve_file_source(file_ref: str):
+    """解析出站文件来源：base64（base64:// 或 data URI）解码为缓冲区，本地路径保持为路径以便流式读取
+
+    Returns:
+        (来源, 字节数)，无法解析时返回 None
+    """
+    if not file_ref:
+        return None
+    if file_ref.startswith("base64://") or file_ref.startswith("data:"):
+        data = await decode_base64_off_loop(file_ref)
+        return data, len(data)
+    path = file_ref[len("file://"):] if file_ref.startswith("file://") else file_ref
+    if os.path.isabs(path) and os.path.isfile(path):
+        return path, os.path.getsize(path)
+    logger.warning(f"⚠️ 暂不支持的文件来源: {file_ref[:50]}...")
+    return None
+
+
+def _upload_file_and_send(feishu_client, file: dict, receive_id: str, receive_id_type: str):
+    """构造上传+发送文件/语音的任务，返回是否发送成功
+
+    上传在 file_transfer 线程池中流式进行；file_key 记在 file 中，重试与广播时复用。
+    """
+    lock = file.setdefault("lock", asyncio.Lock())
+
+    async def upload_and_send():
+        async with lock:
+            if "file_key" not in file:
+                file_key = await outbound_scheduler.run(
+                    FILE_TRANSFER, feishu_client.upload_file, file["source"], file["name"], file["file_type"]
+                )
+                if not file_key:
+                    return False
+                file["file_key"] = file_key
+        return await outbound_scheduler.run(
+            IMAGE_SEND, feishu_client.send_file_message, receive_id, receive_id_type, file["file_key"], file["msg_type"]
+        )
+
+    return upload_and_send
+
+
+async def _prepare_file_seg(seg_type: str, data) -> Optional[dict]:
+    """解析文件 (file) 或语音 (voice / record) 消息段，无法发送时返回 None
+
+    data 可以是 base64 字符串 / 本地路径，或 {"file": ..., "name": ...}。
+    Ogg/Opus 语音以飞书语音消息发送，其他格式的语音以文件形式发送。
+    """
+    if isinstance(data, dict):
+        file_ref = data.get("file") or data.get("path") or ""
+        file_name = data.get("name") or ""
+    else:
+        file_ref, file_name = str(data or ""), ""
+
+    resolved = await _resolve_file_source(file_ref)
+    if resolved is None:
+        return None
+    source, size = resolved
+    if size > global_config.media.max_upload_bytes:
+        metrics.inc("outbound_file_rejected", reason="too_large")
+        logger.warning(f"⚠️ 文件超过上传上限 ({size} > {global_config.media.max_upload_bytes})，未发送")
+        return None
+
+    if not file_name:
+        file_name = os.path.basename(source) if isinstance(source, str) else "file"
+    msg_type = "file"
+    if seg_type in ("voice", "record"):
+        head = bytes(source[:4]) if not isinstance(source, str) else b""
+        if head == b"OggS" or file_name.endswith(".opus"):
+            file_type, msg_type = "opus", "audio"
+            if "." not in file_name:
+                file_name = "voice.opus"
+        else:
+            file_type = "stream"
+            if "." not in file_name:
+                file_name = "voice.mp3"
+    else:
+        file_type = _FILE_TYPES.get(file_name.rsplit(".", 1)[-1].lower(), "stream") if "." in file_name else "stream"
+
+    return {"source": source, "size": size, "name": file_name, "file_type": file_type, "msg_type": msg_type}
+
+
+async def _send_prepared_file(feishu_client, file: dict, receive_id: str, receive_id_type: str):
+    metrics.inc("outbound_file_bytes", file["size"], type=file["msg_type"])
+    return await retry_queue.run_or_defer(
+        feishu_client.app_name, "upload_file", f"{file['msg_type']} 消息 -> {receive_id}",
+        _upload_file_and_send(feishu_client, file, receive_id, receive_id_type), chat=receive_id)
+
+
+async def _send_file_seg(feishu_client, seg_type: str, data, receive_id: str, receive_id_type: str):
+    """发送文件或语音消息段"""
+    file = await _prepare_file_seg(seg_type, data)
+    if file is not None:
+        return await _send_prepared_file(feishu_client, file, receive_id, receive_id_type)
+
+
+def _as_list(value) -> list:
+    if not value:
+        return []
+    return [str(item) for item in value] if isinstance(value, (list, tuple)) else [str(value)]
+
+
+def _parse_targets(params: dict) -> List[Tuple[str, str]]:
+    """解析指令的发送目标 [(receive_id, receive_id_type)]
+
+    单个目标沿用 group_id > user_id > target_id 的优先级；
+    group_ids / user_ids / target_ids 列表用于广播，重复的目标只发一次。
+    """
+    targets = []
+    if params.get("group_id"):
+        targets.append((str(params["group_id"]), "chat_id"))
+    elif params.get("user_id"):
+        targets.append((str(params["user_id"]), "open_id"))
+    elif params.get("target_id"):
+        target_id = str(params["target_id"])
+        targets.append((target_id, "chat_id" if target_id.startswith("oc_") else "open_id"))
+    targets.extend((group_id, "chat_id") for group_id in _as_list(params.get("group_ids")))
+    targets.extend((user_id, "open_id") for user_id in _as_list(params.get("user_ids")))
+    targets.extend(
+        (target_id, "chat_id" if target_id.startswith("oc_") else "open_id")
+        for target_id in _as_list(params.get("target_ids"))
+    )
+    return list(dict.fromkeys(targets))
+
+
+class MaiBotBackend:
+    """单个 MaiBot 实例：独立的 Router 连接与统计"""
+
+    def __init__(self, config: MaiBotBackendConfig):
+        self.name = config.name
+        self.url = f"ws://{config.host}:{config.port}/ws"
         route_config = RouteConfig(
             route_config={
                 global_config.maibot.platform: TargetConfig(
-                    url=f"ws://{global_config.maibot.host}:{global_config.maibot.port}/ws",
+                    url=self.url,
                     token=None,
                 )
             }
         )
         self.router = Router(route_config, custom_logger)
+        self.healthy = False
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def check(self) -> bool:
+        """根据底层连接状态刷新健康标记"""
+        try:
+            self.healthy = self.router.check_connection(global_config.maibot.platform)
+        except Exception:
+            self.healthy = False
+        return self.healthy
+
+    def record(self, ok: bool, elapsed: float):
+        if ok:
+            self.sent += 1
+            self.latency_sum += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            metrics.observe("maibot_send_seconds", elapsed, backend=self.name)
+        else:
+            self.failed += 1
+            metrics.inc("maibot_send_failed", backend=self.name)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "avg_latency_ms": self.latency_sum / self.sent * 1000 if self.sent else 0.0,
+            "max_latency_ms": self.latency_max * 1000,
+        }
+
+
+class MaiBotClient:
+    def __init__(self):
+        cfg = global_config.maibot
+        self.backends: Dict[str, MaiBotBackend] = {
+            backend.name: MaiBotBackend(backend) for backend in cfg.all_backends()
+        }
+        self.ring = HashRing(list(self.backends), cfg.virtual_nodes)
+        # 第一个实例的 Router（单实例部署时即唯一的连接）
+        self.router = next(iter(self.backends.values())).router
+        # 排空时用于判断是否仍有回复在途
+        self.replies_in_flight = 0
+        self.last_sent_at = 0.0
+        self.last_reply_at = 0.0
     
     async def connect(self):
-        logger.info(f"正在连接到 MaiBot: ws://{global_config.maibot.host}:{global_config.maibot.port}/ws")
-        self.router.register_class_handler(self.handle_maibot_response)
-        await self.router.run()
-    
+        for backend in self.backends.values():
+            logger.info(f"正在连接到 MaiBot [{backend.name}]: {backend.url}")
+            backend.router.register_class_handler(self.handle_maibot_response)
+        await asyncio.gather(
+            self._health_check_loop(),
+            *(backend.router.run() for backend in self.backends.values()),
+        )
+
+    async def _health_check_loop(self):
+        """定期检查各实例连接状态，状态变化时记录日志"""
+        while True:
+            for backend in self.backends.values():
+                was_healthy = backend.healthy
+                if backend.check() != was_healthy:
+                    if backend.healthy:
+                        logger.info(f"✅ MaiBot 实例已恢复: {backend.name}")
+                    else:
+                        logger.warning(f"⚠️ MaiBot 实例不可用，其会话将转移到其他实例: {backend.name}")
+                metrics.set_gauge("maibot_backend_healthy", int(backend.healthy), backend=backend.name)
+                metrics.set_gauge("maibot_backend_in_flight", backend.in_flight, backend=backend.name)
+            await asyncio.sleep(global_config.maibot.health_check_interval)
+
+    def _route_key(self, message_base) -> str:
+        """会话亲和键：群聊用 group_id，私聊用 user_id"""
+        message_info = message_base.message_info
+        if message_info.group_info and message_info.group_info.group_id:
+            return f"group:{message_info.group_info.group_id}"
+        if message_info.user_info and message_info.user_info.user_id:
+            return f"user:{message_info.user_info.user_id}"
+        return str(message_info.message_id)
+
+    def pick_backend(self, key: str, exclude: Optional[set] = None) -> Optional[MaiBotBackend]:
+        """按一致性哈希选择健康实例；全部不健康时仍按哈希选择，交给底层重连"""
+        healthy = {name for name, backend in self.backends.items() if backend.healthy}
+        if exclude:
+            healthy -= exclude
+        name = self.ring.lookup(key, healthy)
+        if name is None and not exclude:
+            name = self.ring.lookup(key, set(self.backends))
+        return self.backends.get(name) if name else None
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {name: backend.stats() for name, backend in self.backends.items()}
+
     async def send_message(self, message_base):
-        """发送消息到 MaiBot (接收 MessageBase 对象)"""
-        try:
-            await self.router.send_message(message_base)
-        except Exception as e:
-            logger.error(f"发送消息到 MaiBot 失败: {e}")
+        """发送消息到 MaiBot (接收 MessageBase 对象)
+
+        按会话选择实例；发送失败时将该实例标记为不健康，并重试下一个健康实例。
+        """
+        self.last_sent_at = time.monotonic()
+        key = self._route_key(message_base)
+        tried = set()
+        while True:
+            backend = self.pick_backend(key, tried)
+            if backend is None:
+                logger.error("发送消息到 MaiBot 失败: 没有可用的 MaiBot 实例")
+                return
+            tried.add(backend.name)
+
+            backend.in_flight += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                ok = await backend.router.send_message(message_base) is not False
+            except Exception as e:
+                logger.error(f"发送消息到 MaiBot [{backend.name}] 失败: {e}")
+            finally:
+                backend.in_flight -= 1
+            backend.record(ok, time.perf_counter() - start)
+
+            if ok:
+                return
+            backend.healthy = False
 
     async def handle_maibot_response(self, message: dict):
         """处理 MaiBot 的回复/指令"""
+        self.replies_in_flight += 1
+        self.last_reply_at = time.monotonic()
+        try:
+            await self._handle_maibot_response(message)
+        finally:
+            self.replies_in_flight -= 1
+
+    async def _handle_maibot_response(self, message: dict):
         try:
             # 🟢 关键修改：MaiBot 的回复是以 MessageBase 字典格式发送的
             # 检查是否是 MessageBase 格式（包含 message_info 和 message_segment）
@@ -49,90 +402,117 @@ class MaiBotClient:
             
             if action in ["send_msg", "send_private_msg", "send_group_msg"]:
                 params = message.get("params", {})
+                # 多应用部署时由 params.app 指定发送所用的飞书应用，缺省为默认应用
+                feishu_client = get_feishu_client(params.get("app"))
                 
-                # 获取目标 ID
-                user_id = params.get("user_id")
-                group_id = params.get("group_id")
-                receive_id = ""
-                receive_id_type = ""
-                
-                if group_id:
-                    receive_id = str(group_id); receive_id_type = "chat_id"
-                elif user_id:
-                    receive_id = str(user_id); receive_id_type = "open_id"
-                else:
-                    target_id = params.get("target_id")
-                    if target_id:
-                        receive_id = str(target_id)
-                        receive_id_type = "chat_id" if receive_id.startswith("oc_") else "open_id"
-                    else:
-                        return
+                targets = _parse_targets(params)
+                if not targets:
+                    return
 
                 # 解析消息内容
                 raw_content = params.get("message", "")
                 
                 # 如果是字符串，转为单元素列表
                 segments = raw_content if isinstance(raw_content, list) else [{"type": "text", "data": {"text": str(raw_content)}}]
-                
-                # 获取当前 loop
-                try: loop = asyncio.get_running_loop()
-                except RuntimeError: loop = asyncio.get_event_loop()
+                prepared = await self._prepare_segments(segments)
+                if not prepared:
+                    return
 
-                # 遍历消息段，逐个发送
-                for seg in segments:
-                    if not isinstance(seg, dict): continue
-                    
-                    seg_type = seg.get("type")
-                    data = seg.get("data", {})
-                    
-                    # 1. 处理文本
-                    if seg_type == "text":
-                        text = data.get("text", "")
-                        if text.strip():
-                            content_payload = json.dumps({"text": text}, ensure_ascii=False)
-                            await loop.run_in_executor(None, lambda: feishu_client.send_message(
-                                receive_id, receive_id_type, "text", content_payload
-                            ))
-                            
-                    # 2. 处理图片
-                    elif seg_type == "image":
-                        file_content = data.get("file", "")
-                        
-                        # 检查是否为 Base64
-                        base64_str = ""
-                        if file_content.startswith("base64://"):
-                            base64_str = file_content.replace("base64://", "")
-                        elif "base64" in file_content: 
-                            base64_str = file_content
-                        
-                        if base64_str:
-                            try:
-                                logger.info("🖼️ 检测到图片，正在解码上传...")
-                                # 解码 Base64
-                                image_data = base64.b64decode(base64_str)
-                                
-                                # 定义内部函数以便在 executor 中运行
-                                def upload_and_send():
-                                    image_key = feishu_client.upload_image(image_data)
-                                    if image_key:
-                                        feishu_client.send_image_message(receive_id, receive_id_type, image_key)
-                                
-                                await loop.run_in_executor(None, upload_and_send)
-                                
-                            except Exception as e:
-                                logger.error(f"❌ 图片处理失败: {e}")
-                        else:
-                            logger.warning(f"⚠️ 暂不支持发送网络图片链接: {file_content[:30]}...")
-
-                    # 3. 处理表情
-                    elif seg_type == "emoji" or seg_type == "face":
-                        pass 
+                if len(targets) == 1:
+                    await self._send_segments(feishu_client, prepared, *targets[0])
+                    return
 
+                # 多个目标：广播（图片、文件只上传一次）
+                texts = [item[1] for item in prepared if item[0] == "text"]
+                await broadcaster.run(
+                    feishu_client, targets,
+                    lambda receive_id, receive_id_type: self._send_segments(
+                        feishu_client, prepared, receive_id, receive_id_type
+                    ),
+                    f"{action} ({len(prepared)} 段)",
+                    batch_texts=texts if len(texts) == len(prepared) else None,
+                )
                 return 
 
         except Exception as e:
             logger.error(f"处理 MaiBot 回复异常: {e}", exc_info=True)
 
+    async def _prepare_segments(self, segments: list) -> List[tuple]:
+        """解析指令中的消息段：文本转为消息内容，图片解码，文件解析来源（广播时各目标共用）"""
+        prepared = []
+        for seg in segments:
+            if not isinstance(seg, dict): continue
+            
+            seg_type = seg.get("type")
+            data = seg.get("data", {})
+            
+            # 1. 处理文本
+            if seg_type == "text":
+                text = data.get("text", "")
+                if text.strip():
+                    prepared.append(("text", text))
+                    
+            # 2. 处理图片
+            elif seg_type == "image":
+                file_content = data.get("file", "")
+                
+                # 检查是否为 Base64（base64:// 或 data:...;base64, 前缀在解码时去除）
+                if "base64" in file_content:
+                    try:
+                        logger.info("🖼️ 检测到图片，正在解码上传...")
+                        # 在解码线程池中解码 Base64，不阻塞事件循环
+                        prepared.append(("image", await decode_base64_off_loop(file_content), {}))
+                    except Exception as e:
+                        logger.error(f"❌ 图片处理失败: {e}")
+                else:
+                    logger.warning(f"⚠️ 暂不支持发送网络图片链接: {file_content[:30]}...")
+
+            # 3. 处理文件与语音
+            elif seg_type in ("file", "record", "voice"):
+                try:
+                    file = await _prepare_file_seg(seg_type, data)
+                    if file is not None:
+                        prepared.append(("file", file))
+                except Exception as e:
+                    logger.error(f"❌ 文件处理失败: {e}")
+
+            # 4. 处理表情
+            elif seg_type == "emoji" or seg_type == "face":
+                pass 
+        return prepared
+
+    async def _send_segments(self, feishu_client, prepared: List[tuple], receive_id: str, receive_id_type: str) -> Optional[bool]:
+        """向一个目标逐段发送
+
+        Returns:
+            True 全部发送；None 有消息段因熔断暂存；False 有消息段发送失败
+        """
+        outcome: Optional[bool] = True
+        for item in prepared:
+            kind = item[0]
+            try:
+                if kind == "text":
+                    content_payload = json.dumps({"text": item[1]}, ensure_ascii=False)
+                    result = await retry_queue.run_or_defer(
+                        feishu_client.app_name, "send_message", f"文本消息 -> {receive_id}",
+                        lambda content_payload=content_payload: outbound_scheduler.run(
+                            REPLY, feishu_client.send_message, receive_id, receive_id_type, "text", content_payload
+                        ), chat=receive_id)
+                elif kind == "image":
+                    result = await retry_queue.run_or_defer(
+                        feishu_client.app_name, "upload_image", f"图片消息 -> {receive_id}",
+                        _upload_and_send(feishu_client, item[1], receive_id, receive_id_type, item[2]), chat=receive_id)
+                else:
+                    result = await _send_prepared_file(feishu_client, item[1], receive_id, receive_id_type)
+            except Exception as e:
+                logger.error(f"❌ 发送到 {receive_id} 失败: {e}")
+                result = False
+            if result is False:
+                outcome = False
+            elif result is None and outcome is True:
+                outcome = None
+        return outcome
+
     async def handle_message_base_reply(self, message_base_dict: dict):
         """处理 MessageBase 格式的回复消息"""
         from maim_message import MessageBase, Seg
@@ -171,48 +551,57 @@ class MaiBotClient:
             additional_config = getattr(message_info, 'additional_config', {}) or {}
             feishu_info = additional_config.get('feishu', {})
             original_message_id = feishu_info.get('message_id')
+            # 🟢 按接收原消息的应用发送回复
+            feishu_client = get_feishu_client(feishu_info.get('app'))
             
-            # 发送消息
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = asyncio.get_event_loop()
-
+            # 发送消息（接口熔断时暂存到重试队列）
             for seg in segments:
                 seg_type = seg.get("type")
                 data = seg.get("data", "")
                 
                 if seg_type == "text":
                     if data.strip():
+                        # 卡片模式：同一条消息的多段回复合并到一张卡片中逐步更新
+                        # （该会话还有暂存的发送时不走卡片，按普通消息排在其后）
+                        if (original_message_id and global_config.card_reply.enable
+                                and not retry_queue.has_pending(feishu_client.app_name, receive_id)):
+                            if await card_replies.append(feishu_client, original_message_id, data):
+                                continue
                         content_payload = json.dumps({"text": data}, ensure_ascii=False)
                         
                         # 如果有原始消息 ID，使用 reply；否则 send
                         if original_message_id:
-                            await loop.run_in_executor(None, lambda: feishu_client.reply_message(
-                                original_message_id, "text", content_payload
-                            ))
+                            await retry_queue.run_or_defer(
+                                feishu_client.app_name, "reply_message", f"回复 -> {original_message_id}",
+                                lambda content_payload=content_payload: outbound_scheduler.run(
+                                    REPLY, feishu_client.reply_message, original_message_id, "text", content_payload
+                                ), chat=receive_id)
                         else:
-                            await loop.run_in_executor(None, lambda: feishu_client.send_message(
-                                receive_id, receive_id_type, "text", content_payload
-                            ))
+                            await retry_queue.run_or_defer(
+                                feishu_client.app_name, "send_message", f"文本消息 -> {receive_id}",
+                                lambda content_payload=content_payload: outbound_scheduler.run(
+                                    REPLY, feishu_client.send_message, receive_id, receive_id_type, "text", content_payload
+                                ), chat=receive_id)
                         
                 elif seg_type == "image":
-                    if data.startswith("base64://"):
-                        base64_str = data.replace("base64://", "")
-                    else:
-                        base64_str = data
-                    
                     try:
-                        image_data = base64.b64decode(base64_str)
-                        def upload_and_send():
-                            image_key = feishu_client.upload_image(image_data)
-                            if image_key:
-                                feishu_client.send_image_message(receive_id, receive_id_type, image_key)
-                        await loop.run_in_executor(None, upload_and_send)
+                        # 前缀在解码时去除；解码在线程池中进行
+                        image_data = await decode_base64_off_loop(data)
+                        await retry_queue.run_or_defer(
+                            feishu_client.app_name, "upload_image", f"图片消息 -> {receive_id}",
+                            _upload_and_send(feishu_client, image_data, receive_id, receive_id_type), chat=receive_id)
                     except Exception as e:
                         logger.error(f"图片发送失败: {e}")
+
+                elif seg_type in ("file", "voice"):
+                    try:
+                        await _send_file_seg(feishu_client, seg_type, data, receive_id, receive_id_type)
+                    except Exception as e:
+                        logger.error(f"文件发送失败: {e}")
             
-            logger.info(f"✅ 消息已发送到飞书")
+            hot_logger.info("reply_delivered", "✅ 消息已发送到飞书")
+            if original_message_id:
+                ack_reactions.replied(original_message_id)
                         
         except Exception as e:
             logger.error(f"处理 MessageBase 回复失败: {e}", exc_info=True)
@@ -230,16 +619,19 @@ class MaiBotClient:
             result.append({"type": "image", "data": seg.data})
         elif seg.type == "emoji":
             result.append({"type": "emoji", "data": seg.data})
+        elif seg.type in ("voice", "file"):
+            result.append({"type": seg.type, "data": seg.data})
         # 忽略其他类型（如 reply 等）
         
         return result
 
     async def disconnect(self):
-        try:
-            await self.router.stop()
-        except asyncio.CancelledError:
-            pass  # 忽略取消错误，这是正常的关闭行为
-        except Exception as e:
-            logger.error(f"断开连接失败: {e}")
+        for backend in self.backends.values():
+            try:
+                await backend.router.stop()
+            except asyncio.CancelledError:
+                pass  # 忽略取消错误，这是正常的关闭行为
+            except Exception as e:
+                logger.error(f"断开连接失败 [{backend.name}]: {e}")
 
 maibot_client = MaiBotClient()
\ No newline at end of file
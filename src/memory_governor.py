@@ -0,0 +1,230 @@
+"""内存预算 - 跟踪进程 RSS 与适配器自身缓冲区，接近预算时逐级降级"""
+import asyncio
+import gc
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, Optional
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+# 降级级别
+NORMAL = 0  # 正常
+SHRINK = 1  # 压缩缓存
+PLACEHOLDER = 2  # 图片不再下载，以占位文本转发
+PAUSE = 3  # 暂停接收事件（由飞书重新投递）
+
+LEVEL_NAMES = {NORMAL: "normal", SHRINK: "shrink", PLACEHOLDER: "placeholder", PAUSE: "pause"}
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_rss() -> Optional[int]:
+    """当前常驻内存（字节）；无法读取 /proc 时返回 None"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# cgroup v1 在未设置限制时返回一个接近 2^63 的值
+_UNLIMITED = 1 << 60
+
+
+def read_cgroup_limit() -> Optional[int]:
+    """容器 / cgroup 的内存上限（字节）；未设置或无法读取时返回 None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+        return limit if 0 < limit < _UNLIMITED else None
+    return None
+
+
+def read_peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryGovernor:
+    """内存预算
+
+    每 check_interval 秒读取一次 RSS（读不到时以适配器自身缓冲区的估算值代替），
+    按占预算的比例决定降级级别，级别越高包含的降级越多。
+    budget_mb 为 0 时以容器 / cgroup 的内存上限为预算，没有上限时不做降级：
+    1. shrink: 各缓存、最近消息缓冲区与 blob 存储按 shrink_ratio 压缩，并触发一次 GC
+    2. placeholder: 新消息中的图片不再下载，以 [图片] 占位
+    3. pause: 长连接回调拒绝新事件，由飞书稍后重新投递；已排队的消息继续处理
+    回落时需低于阈值 hysteresis 以上才降低级别，避免在阈值附近来回切换。
+    """
+
+    def __init__(self):
+        self.level = NORMAL
+        self.rss: Optional[int] = None
+        self.usage = 0
+        self.transitions = 0
+        self.changed_at = time.time()
+        self.budget = 0
+        # 已转换、尚未发送完成的消息中内联 base64 图片的字节数
+        self.inline_image_bytes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def degrade_images(self) -> bool:
+        return self.level >= PLACEHOLDER
+
+    @property
+    def paused(self) -> bool:
+        return self.level >= PAUSE
+
+    def track_inline(self, task: asyncio.Task, size: int):
+        """记录一条含内联图片的消息，发送任务结束后释放"""
+        if size <= 0:
+            return
+        self.inline_image_bytes += size
+
+        def release(_):
+            self.inline_image_bytes -= size
+
+        task.add_done_callback(release)
+
+    def buffers(self) -> Dict[str, int]:
+        """适配器自身缓冲区的估算占用（字节）"""
+        from src.reply_context import reply_context
+        from src.blob_store import blob_store
+
+        return {
+            "recent_messages": reply_context.buffer.approx_bytes,
+            "blobs_mapped": blob_store.total_bytes,
+            "inline_images": self.inline_image_bytes,
+        }
+
+    def queues(self) -> Dict[str, int]:
+        """排队中的条目数（不是字节）"""
+        from src.inbound_scheduler import inbound_scheduler
+        from src.retry_queue import retry_queue
+
+        return {
+            "inbound_queued": len(inbound_scheduler),
+            "retry_queue": len(retry_queue),
+        }
+
+    def _target_level(self, ratio: float) -> int:
+        cfg = global_config.memory
+        thresholds = [(PAUSE, cfg.pause_at), (PLACEHOLDER, cfg.placeholder_at), (SHRINK, cfg.shrink_at)]
+        for level, threshold in thresholds:
+            # 已处于该级别时，低于阈值 hysteresis 以上才退出
+            if ratio >= threshold or (self.level >= level and ratio >= threshold - cfg.hysteresis):
+                return level
+        return NORMAL
+
+    @staticmethod
+    def _resolve_budget() -> int:
+        budget_mb = global_config.memory.budget_mb
+        if budget_mb > 0:
+            return budget_mb * 1024 * 1024
+        return read_cgroup_limit() or 0
+
+    def check(self):
+        budget = self.budget
+        self.rss = read_rss()
+        if self.rss is not None:
+            self.usage = self.rss
+        else:
+            self.usage = sum(self.buffers().values())
+        metrics.set_gauge("memory_rss_bytes", self.usage)
+
+        level = self._target_level(self.usage / budget) if budget > 0 else NORMAL
+        if level != self.level:
+            self._transition(level)
+        if self.level >= SHRINK:
+            self._shrink()
+
+    def _transition(self, level: int):
+        previous, self.level = self.level, level
+        self.transitions += 1
+        self.changed_at = time.time()
+        metrics.inc("memory_level_transitions", to=LEVEL_NAMES[level])
+        metrics.set_gauge("memory_level", level)
+        usage_mb = self.usage / 1024 / 1024
+        message = (
+            f"内存降级级别 {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]}"
+            f"（{usage_mb:.0f}MB / {self.budget / 1024 / 1024:.0f}MB）"
+        )
+        if level > previous:
+            logger.warning(f"⚠️ {message}")
+            if previous < SHRINK <= level:
+                self._shrink()
+                gc.collect()
+        else:
+            logger.info(f"✅ {message}")
+
+    def _shrink(self):
+        """按比例压缩各缓存（淘汰最久未用的条目）"""
+        from src.user_cache import user_profile_cache
+        from src.chat_cache import chat_info_cache
+        from src.reply_context import reply_context
+        from src.maibot_client import uploaded_image_cache
+        from src.blob_store import blob_store
+
+        ratio = global_config.memory.shrink_ratio
+        for cache in (user_profile_cache.cache, chat_info_cache.cache, reply_context.fetched, uploaded_image_cache):
+            cache.shrink(int(cache.max_size * ratio))
+        reply_context.buffer.shrink(int(reply_context.buffer.memory_budget * ratio))
+        blob_store.shrink(int(blob_store.max_bytes * ratio))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "level": LEVEL_NAMES[self.level],
+            "usage": self.usage,
+            "rss": self.rss,
+            "peak_rss": read_peak_rss(),
+            "budget": self.budget,
+            "transitions": self.transitions,
+            "since": round(time.time() - self.changed_at, 1),
+            "buffers": self.buffers(),
+            "queues": self.queues(),
+        }
+
+    async def run_periodic(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.debug(f"内存检查失败: {e}")
+            await asyncio.sleep(global_config.memory.check_interval)
+
+    def start(self):
+        if not global_config.memory.enable or self._task is not None:
+            return
+        self.budget = self._resolve_budget()
+        if not self.budget:
+            logger.info("🧠 内存预算未设置且未检测到容器内存上限，不启用内存降级")
+            return
+        logger.info(f"🧠 内存预算: {self.budget / 1024 / 1024:.0f}MB")
+        self._task = asyncio.get_running_loop().create_task(self.run_periodic())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局内存预算
+memory_governor = MemoryGovernor()
@@ -1,10 +1,15 @@
 """消息格式转换器 - 使用 maim_message 标准格式"""
+import asyncio
 import json
+import re
 import time
 import base64
-from typing import Dict, Any
-from src.logger import logger
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from src.logger import logger, hot_logger
 from src.config import global_config
+from src.metrics import metrics
+from src.chat_cache import chat_info_cache
+from src.reply_context import reply_context
 
 # 🟢 引入 maim_message 标准对象
 from maim_message import (
@@ -17,67 +22,337 @@ from maim_message import (
 )
 
 
-async def download_feishu_image(image_key: str, message_id: str) -> str:
-    """下载飞书图片并转换为base64
+async def fetch_feishu_image(image_key: str, message_id: str, app_name: Optional[str] = None) -> Optional[Tuple[bytes, str]]:
+    """下载飞书消息中的图片原始数据
     
     Args:
         image_key: 飞书图片的image_key
         message_id: 消息ID
+        app_name: 接收该消息的飞书应用
         
     Returns:
-        base64编码的图片字符串，失败返回空字符串
+        (图片字节, MIME 类型)，失败返回 None
     """
-    from src.feishu_client import feishu_client
-    import requests
+    from src.feishu_client import get_feishu_client
+    from src.outbound_scheduler import outbound_scheduler, MEDIA_DOWNLOAD
     
-    try:
-        # 获取 access token
-        token = feishu_client._get_tenant_access_token()
-        if not token:
-            logger.error("无法获取 access token")
-            return ""
-        
-        # 🟢 使用正确的API：获取消息中的资源文件
-        # 文档: https://open.feishu.cn/document/uAjLw4CM/ukTMukTMukTM/reference/im-v1/message-resource/get
-        url = f"https://open.feishu.cn/open-apis/im/v1/messages/{message_id}/resources/{image_key}"
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
-        
-        # 指定返回类型为文件流
-        params = {
-            "type": "image"
-        }
-        
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            # 图片内容在响应体中
-            image_bytes = response.content
-            image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-            logger.info(f"✅ 图片下载成功: {image_key}")
-            return image_base64
-        else:
-            # 🟢 详细错误日志
-            try:
-                error_data = response.json()
-                logger.error(f"图片下载失败: HTTP {response.status_code}")
-                logger.error(f"错误详情: {error_data}")
-                logger.error(f"URL: {url}")
-            except:
-                logger.error(f"图片下载失败: HTTP {response.status_code}, Response: {response.text[:200]}")
-            return ""
-            
-    except Exception as e:
-        logger.error(f"下载图片异常: {e}", exc_info=True)
+    client = get_feishu_client(app_name)
+    fetched = await outbound_scheduler.run(MEDIA_DOWNLOAD, client.get_message_resource, message_id, image_key, "image")
+    if fetched:
+        hot_logger.info("image_downloaded", "✅ 图片下载成功: %s", image_key)
+    return fetched
+
+
+async def download_feishu_image(image_key: str, message_id: str, app_name: Optional[str] = None) -> str:
+    """下载飞书图片并转换为base64
+    
+    Returns:
+        base64编码的图片字符串，失败返回空字符串
+    """
+    fetched = await fetch_feishu_image(image_key, message_id, app_name)
+    if not fetched:
         return ""
+    return base64.b64encode(fetched[0]).decode("utf-8")
+
+
+def inline_image_bytes(seg: Seg) -> int:
+    """消息段中内联 base64 图片的总字节数"""
+    if seg.type == "seglist":
+        return sum(inline_image_bytes(child) for child in seg.data or [])
+    if seg.type == "image" and isinstance(seg.data, str):
+        return len(seg.data)
+    return 0
+
+
+async def build_image_seg(image_key: str, message_id: str, app_name: Optional[str] = None) -> Optional[Seg]:
+    """下载图片并构造 image Seg
+
+    reference 模式下图片写入本地 blob 存储，只发送可供 MaiBot 按需下载的地址
+    (image_url Seg)；blob 存储或 HTTP 服务不可用时回退为内联 base64。
+    内存接近预算时不下载，以占位文本代替。
+    """
+    from src.memory_governor import memory_governor
+    if memory_governor.degrade_images:
+        metrics.inc("inbound_image_placeholder")
+        return Seg(type="text", data="[图片]")
+
+    fetched = await fetch_feishu_image(image_key, message_id, app_name)
+    if not fetched:
+        return None
+    image_bytes, mime = fetched
+
+    # 可选：在进程池中缩小图片
+    from src.image_transcoder import image_transcoder
+    image_bytes, mime = await image_transcoder.transcode(image_key, image_bytes, mime)
+
+    if global_config.image.transfer_mode == "reference":
+        from src.blob_store import blob_store
+        from src.http_server import http_server
+
+        if http_server.running:
+            loop = asyncio.get_running_loop()
+            blob_id = await loop.run_in_executor(None, blob_store.put, image_bytes, mime)
+            if blob_id:
+                metrics.inc("inbound_image_bytes", len(image_bytes), mode="reference")
+                return Seg(type="image_url", data=http_server.blob_url(blob_id))
+        metrics.inc("inbound_image_reference_fallback")
+
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    metrics.inc("inbound_image_bytes", len(image_base64), mode="base64")
+    return Seg(type="image", data=image_base64)
+
+
+# 文件类消息的中文名称
+_MEDIA_LABELS = {"file": "文件", "audio": "语音", "media": "视频"}
+
+
+def _format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f}MB"
+    return f"{max(size, 1) / 1024:.0f}KB"
+
+
+async def fetch_media_to_blob(file_key: str, message_id: str, app_name: Optional[str] = None) -> Optional[Tuple[str, int]]:
+    """流式下载文件/语音/视频到 blob 存储，返回 (blob_id, 字节数)"""
+    from src.feishu_client import get_feishu_client
+    from src.blob_store import blob_store
+    from src.outbound_scheduler import outbound_scheduler, FILE_TRANSFER
+
+    client = get_feishu_client(app_name)
+    loop = asyncio.get_running_loop()
+    temp_path = await loop.run_in_executor(None, blob_store.temp_path)
+    fetched = await outbound_scheduler.run(
+        FILE_TRANSFER, client.download_resource_to_file,
+        message_id, file_key, "file", temp_path, global_config.media.max_download_bytes
+    )
+    if not fetched:
+        metrics.inc("inbound_media_failed")
+        return None
+    size, mime, digest = fetched
+    blob_id = await loop.run_in_executor(None, blob_store.adopt_file, temp_path, digest, mime)
+    if not blob_id:
+        return None
+    metrics.inc("inbound_media_bytes", size)
+    hot_logger.info("media_downloaded", "✅ 文件下载成功: %s (%d bytes)", file_key, size)
+    return blob_id, size
+
+
+async def build_media_seg(message_type: str, content_json: Dict[str, Any], message_id: str,
+                          app_name: Optional[str] = None) -> Tuple[Seg, str]:
+    """文件 / 语音 / 视频消息：下载到 blob 存储，以 "[文件: 名称, 大小] 下载地址" 文本交给 MaiBot
+
+    未开启本地 HTTP 服务、超过下载上限或下载失败时只发送描述文本。
+
+    Returns:
+        (Seg, 纯文本摘要)
+    """
+    from src.http_server import http_server
+
+    label = _MEDIA_LABELS.get(message_type, message_type)
+    file_key = content_json.get("file_key", "")
+    description = label
+    if content_json.get("file_name"):
+        description += f": {content_json['file_name']}"
+    if content_json.get("duration"):
+        description += f", {int(content_json['duration']) / 1000:.0f}秒"
+
+    if not (file_key and message_id and global_config.media.enable and http_server.running):
+        return Seg(type="text", data=f"[{description}]"), f"[{description}]"
 
+    fetched = await fetch_media_to_blob(file_key, message_id, app_name)
+    if not fetched:
+        return Seg(type="text", data=f"[{description}（未下载）]"), f"[{description}]"
+    blob_id, size = fetched
+    text = f"[{description}, {_format_size(size)}] {http_server.blob_url(blob_id)}"
+    return Seg(type="text", data=text), f"[{description}]"
 
 
+# 飞书文本中的提及占位符：@_user_1、@_user_10 ... 以及 @所有人 的 @_all
+# 正则按最长匹配，@_user_10 不会被 @_user_1 截断
+_MENTION_KEY_PATTERN = re.compile(r"@_user_\d+|@_all")
 
 
-async def process_feishu_message(event_data: Dict[str, Any]):
-    """处理飞书原始数据 -> 转换为 MaiBot 标准格式 -> 发送"""
+def _field(obj: Any, name: str) -> Any:
+    """兼容 SDK 对象与 dict 的字段读取"""
+    if isinstance(obj, dict):
+        return obj.get(name) or ""
+    return getattr(obj, name, "") or ""
+
+
+def build_mention_table(mentions) -> Tuple[Dict[str, str], bool, Optional[str]]:
+    """根据 mentions 构造占位符替换表
+
+    Returns:
+        (替换表 {key: "@<昵称:user_id>"}, 机器人是否被 @, 机器人的 user_id)
+    """
+    table: Dict[str, str] = {}
+    bot_mentioned = False
+    bot_user_id = None
+
+    for mention in mentions or []:
+        # mention 可能是 MentionEvent 对象（事件），也可能是 dict（接口返回 / 补拉消息）
+        try:
+            key = _field(mention, "key")
+            mention_id_obj = _field(mention, "id")
+            mention_name = _field(mention, "name")
+
+            # 事件中 id 是一个对象，需要获取 open_id；接口返回中 id 直接是字符串
+            mention_id = ""
+            if mention_id_obj:
+                if isinstance(mention_id_obj, str):
+                    mention_id = mention_id_obj
+                else:
+                    mention_id = _field(mention_id_obj, "open_id")
+                # 检查是否 mention 的是机器人（tenant_key）
+                if _field(mention, "tenant_key"):
+                    bot_mentioned = True
+                    bot_user_id = mention_id  # 记录机器人的 user_id
+
+            if key and mention_id:
+                # 替换为 @<昵称:user_id> 格式（参考 Napcat）
+                table[key] = f"@<{mention_name}:{mention_id}>"
+        except Exception as e:
+            logger.debug("处理 mention 失败: %s", e)
+
+    return table, bot_mentioned, bot_user_id
+
+
+def _plain_replace_is_exact(table: Dict[str, str]) -> bool:
+    """逐个 str.replace 是否与正则最长匹配的结果一致：没有占位符是另一个的前缀
+    （@_user_1 与 @_user_10），替换结果里也不含占位符（昵称恰好是 @_user_2）"""
+    if len(table) > 1:
+        keys = sorted(table)
+        for shorter, longer in zip(keys, keys[1:]):
+            if longer.startswith(shorter):
+                return False
+    for value in table.values():
+        if "@_" in value:
+            return False
+    return True
+
+
+def rewrite_mentions(text: str, table: Dict[str, str]) -> str:
+    """替换文本中的提及占位符，未知占位符原样保留
+
+    常见情况（提及不超过 9 人）没有前缀冲突，逐个 str.replace 即可，
+    比每处匹配都回调一次 Python 函数的正则替换快；否则按正则最长匹配单次扫描替换。
+    文本中的占位符都来自本条消息的 mentions，不会出现以已知占位符为前缀的未知占位符。
+    """
+    if not text or not table:
+        return text
+    if _plain_replace_is_exact(table):
+        for key, value in table.items():
+            text = text.replace(key, value)
+        return text
+    if "@_" not in text:
+        return text
+    return _MENTION_KEY_PATTERN.sub(lambda m: table.get(m.group(0), m.group(0)), text)
+
+
+def _post_paragraphs(content_json: Dict[str, Any]) -> Tuple[str, List[list]]:
+    """取出富文本的标题和段落，兼容带语言层（zh_cn/en_us）和不带语言层两种结构"""
+    if "content" not in content_json:
+        for value in content_json.values():
+            if isinstance(value, dict) and "content" in value:
+                content_json = value
+                break
+    return content_json.get("title", "") or "", content_json.get("content", []) or []
+
+
+def iter_post_elements(content_json: Dict[str, Any], mention_table: Dict[str, str]) -> Iterator[Tuple[str, str]]:
+    """逐元素解析飞书富文本 (post)
+
+    依次产出 ("text", 文本) 或 ("image", image_key)，段落之间产出换行，
+    调用方可以边解析边拼接，无需先展开整篇内容。
+    """
+    title, paragraphs = _post_paragraphs(content_json)
+    if title:
+        yield "text", title + "\n"
+
+    for index, paragraph in enumerate(paragraphs):
+        if index:
+            yield "text", "\n"
+        if not isinstance(paragraph, list):
+            continue
+        for element in paragraph:
+            if not isinstance(element, dict):
+                continue
+            tag = element.get("tag")
+            if tag == "text":
+                yield "text", rewrite_mentions(element.get("text", ""), mention_table)
+            elif tag == "a":
+                text = element.get("text", "")
+                href = element.get("href", "")
+                if href and href != text:
+                    yield "text", f"{text}({href})" if text else href
+                else:
+                    yield "text", text
+            elif tag == "at":
+                key = element.get("user_id", "")
+                if key in mention_table:
+                    yield "text", mention_table[key]
+                elif key == "all" or key == "@_all":
+                    yield "text", "@所有人"
+                else:
+                    yield "text", f"@{element.get('user_name', '') or key}"
+            elif tag == "img":
+                image_key = element.get("image_key", "")
+                if image_key:
+                    yield "image", image_key
+            elif tag == "emotion":
+                yield "text", f"[{element.get('emoji_type', '表情')}]"
+            elif tag == "code_block":
+                yield "text", element.get("text", "")
+            elif tag == "hr":
+                yield "text", "\n"
+            elif tag == "media":
+                yield "text", "[视频]"
+
+
+async def parse_post_content(
+    content_json: Dict[str, Any],
+    mention_table: Dict[str, str],
+    message_id: str,
+    app_name: Optional[str] = None,
+) -> Tuple[List[Seg], str]:
+    """将富文本 (post) 转换为 Seg 列表和纯文本摘要
+
+    相邻的文本元素合并为一个 text Seg，内嵌图片按出现位置转为 image Seg。
+    """
+    seg_list: List[Seg] = []
+    plain_parts: List[str] = []
+    pending_text: List[str] = []
+
+    def flush_text():
+        if pending_text:
+            text = "".join(pending_text)
+            pending_text.clear()
+            if text.strip():
+                seg_list.append(Seg(type="text", data=text))
+
+    for kind, value in iter_post_elements(content_json, mention_table):
+        if kind == "text":
+            pending_text.append(value)
+            plain_parts.append(value)
+            continue
+
+        flush_text()
+        image_seg = await build_image_seg(value, message_id, app_name) if message_id else None
+        if image_seg:
+            seg_list.append(image_seg)
+            plain_parts.append("[图片]")
+        else:
+            plain_parts.append("[图片下载失败]")
+
+    flush_text()
+    return seg_list, "".join(plain_parts)
+
+
+async def process_feishu_message(event_data: Dict[str, Any], ack: bool = True):
+    """处理飞书原始数据 -> 转换为 MaiBot 标准格式 -> 发送
+
+    ack=False 时不加确认表情（补拉的历史消息）
+    """
     
     # 1. 提取基础信息
     sender = event_data.get("sender", {})
@@ -87,6 +362,11 @@ async def process_feishu_message(event_data: Dict[str, Any]):
     if sender.get("sender_type") == "app":
         return
 
+    # 接收该消息的飞书应用（多应用部署时用于下载资源和路由回复）
+    from src.feishu_client import get_feishu_client
+    client = get_feishu_client(event_data.get("app"))
+    app_name = client.app_name
+
     # 2. 构造用户信息 (UserInfo 对象)
     open_id = sender.get("sender_id", {}).get("open_id")
     user_id = open_id or sender.get("sender_id", {}).get("user_id", "")
@@ -106,11 +386,14 @@ async def process_feishu_message(event_data: Dict[str, Any]):
     chat_id = message.get("chat_id", "")
     
     group_info = None
+    chat_info = None
     if chat_type == "group":
+        # 🟢 群名来自群信息缓存，只有首次遇到该群或缓存失效时才请求接口
+        chat_info = await chat_info_cache.get(chat_id, app_name)
         group_info = GroupInfo(
             platform=platform_name,
             group_id=str(chat_id),
-            group_name="飞书群组"
+            group_name=(chat_info or {}).get("name") or "飞书群组"
         )
 
     # 4. 时间戳处理
@@ -125,6 +408,9 @@ async def process_feishu_message(event_data: Dict[str, Any]):
     message_type = message.get("message_type", "")
     message_id = message.get("message_id", "")  # 🟢 获取消息ID
     
+    # 🟢 处理 @ 提及：先构造占位符替换表，解析内容时单次扫描替换
+    mention_table, bot_mentioned, bot_user_id = build_mention_table(message.get("mentions", []))
+
     seg_list = []
     text_content = ""
     
@@ -132,66 +418,57 @@ async def process_feishu_message(event_data: Dict[str, Any]):
         content_json = json.loads(content_raw) if isinstance(content_raw, str) else content_raw
         
         if message_type == "text":
-            text_content = content_json.get("text", "")
+            # 将 @_user_1 替换为 @<昵称:user_id>
+            text_content = rewrite_mentions(content_json.get("text", ""), mention_table)
+        elif message_type == "post":
+            # 🟢 富文本：段落、链接、内嵌图片、@ 转为 Seg 列表
+            seg_list, text_content = await parse_post_content(content_json, mention_table, message_id, app_name)
         elif message_type == "image":
             # 🟢 处理图片消息
             image_key = content_json.get("image_key", "")
             if image_key and message_id:
-                # 下载图片并转换为base64
-                image_base64 = await download_feishu_image(image_key, message_id)
-                if image_base64:
-                    seg_list.append(Seg(type="image", data=image_base64))
+                # 下载图片（内联 base64 或 blob 引用）
+                image_seg = await build_image_seg(image_key, message_id, app_name)
+                if image_seg:
+                    seg_list.append(image_seg)
                     text_content = "[图片]"
                 else:
                     text_content = "[图片下载失败]"
             else:
                 text_content = "[图片]"
+        elif message_type in _MEDIA_LABELS:
+            # 🟢 文件 / 语音 / 视频：流式下载到本地并以下载地址转发
+            media_seg, text_content = await build_media_seg(message_type, content_json, message_id, app_name)
+            seg_list.append(media_seg)
         else:
             text_content = f"[{message_type}]"
     except Exception as e:
         logger.error(f"解析消息内容失败: {e}")
         text_content = str(content_raw)
-    
-    # 🟢 处理 @ 提及：将 @_user_1 替换为 @<昵称:user_id>
-    mentions = message.get("mentions", [])
-    bot_mentioned = False  # 标记机器人是否被 @
-    bot_user_id = None
-    
-    if mentions and text_content:
-        for mention in mentions:
-            # mention 是 MentionEvent 对象，需要用属性访问
-            try:
-                key = getattr(mention, "key", "")
-                mention_id_obj = getattr(mention, "id", None)
-                mention_name = getattr(mention, "name", "")
-                
-                # id 也是一个对象，需要获取 open_id
-                mention_id = ""
-                if mention_id_obj:
-                    mention_id = getattr(mention_id_obj, "open_id", "")
-                    # 检查是否 mention 的是机器人（tenant_key）
-                    mention_tenant_key = getattr(mention, "tenant_key", "")
-                    if mention_tenant_key:
-                        bot_mentioned = True
-                        bot_user_id = mention_id  # 记录机器人的 user_id
-                
-                if key and mention_id:
-                    # 替换为 @<昵称:user_id> 格式（参考 Napcat）
-                    replacement = f"@<{mention_name}:{mention_id}>"
-                    text_content = text_content.replace(key, replacement)
-            except Exception as e:
-                logger.debug(f"处理 mention 失败: {e}")
 
     # 构造最终的 Seg 列表
     if not seg_list:  # 如果没有图片，添加文本
         seg_list.append(Seg(type="text", data=text_content))
     
+    # 🟢 回复引用：优先从最近消息缓冲区解析被回复的消息，未命中再调用接口
+    parent_id = message.get("parent_id") or ""
+    quoted = await reply_context.resolve(parent_id, app_name) if parent_id else None
+    if quoted:
+        _, quoted_sender_id, quoted_sender_name, quoted_text = quoted
+        seg_list = [
+            Seg(type="reply", data=parent_id),
+            Seg(type="text", data=f"[回复<{quoted_sender_name}:{quoted_sender_id}>：{quoted_text}]，说："),
+        ] + seg_list
+    
+    # 记录到最近消息缓冲区，供后续回复解析
+    reply_context.record(chat_id, message_id, str(user_id), nickname, text_content)
+    
     # 包装为 seglist
     submit_seg = Seg(type="seglist", data=seg_list)
 
     # 6. 构造 FormatInfo
     format_info = FormatInfo(
-        content_format=["text", "image"],
+        content_format=["text", "image", "image_url"],
         accept_format=["text", "image", "json"]
     )
 
@@ -206,9 +483,14 @@ async def process_feishu_message(event_data: Dict[str, Any]):
         format_info=format_info,
         additional_config={
             "feishu": {
+                "app": app_name,  # 🟢 回复按应用名称路由回对应的飞书应用
                 "chat_id": chat_id,
                 "chat_type": chat_type,
-                "message_id": message.get("message_id", "")  # 🟢 保存消息ID用于回复引用
+                "chat_mode": (chat_info or {}).get("chat_mode", ""),
+                "member_count": (chat_info or {}).get("member_count", 0),
+                "message_id": message.get("message_id", ""),  # 🟢 保存消息ID用于回复引用
+                "parent_id": parent_id,
+                "root_id": message.get("root_id") or "",
             },
             "bot_mentioned": bot_mentioned,  # 🟢 标记机器人是否被 @
             "bot_user_id": bot_user_id,      # 🟢 机器人的 user_id
@@ -222,10 +504,13 @@ async def process_feishu_message(event_data: Dict[str, Any]):
         raw_message=text_content
     )
 
-    logger.info(f"📩 转换消息: {nickname}: {text_content[:30]}")
+    hot_logger.info("message_converted", "📩 转换消息: %s: %.30s", nickname, text_content)
     
     # 9. 发送到 MaiBot
     from src.maibot_client import maibot_client
+    from src.ack_reaction import ack_reactions
+    from src.inbound_scheduler import classify_message, MENTION
+    from src.memory_governor import memory_governor
     import asyncio
     
     try:
@@ -234,7 +519,15 @@ async def process_feishu_message(event_data: Dict[str, Any]):
         except RuntimeError:
             loop = asyncio.get_event_loop()
             
-        loop.create_task(maibot_client.send_message(message_base))
+        task = loop.create_task(maibot_client.send_message(message_base))
+        memory_governor.track_inline(task, inline_image_bytes(submit_seg))
+        # 🟢 确认表情不等待结果，不影响转发
+        if ack:
+            # 只有 mention 的 open_id 与机器人一致才算 @机器人（机器人 open_id 未知时不算）
+            direct = chat_type == "p2p" or bool(client.bot_open_id) and classify_message(
+                chat_type, message.get("mentions"), client.bot_open_id
+            ) == MENTION
+            ack_reactions.ack(app_name, message_id, direct)
         
     except Exception as e:
         logger.error(f"❌ 投递消息到 Maibot 失败: {e}", exc_info=True)
\ No newline at end of file
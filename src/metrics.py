@@ -0,0 +1,64 @@
+"""运行指标模块 - 进程内计数器、仪表和耗时统计"""
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+
+def _metric_key(name: str, labels: Dict[str, Any]) -> str:
+    """将指标名和标签拼接为唯一键，例如 image_bytes{mode=reference}"""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """累加计数器"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """设置仪表当前值"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次观测值（耗时等），保留次数、总和与最大值"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            stat = self._timings.get(key)
+            if stat is None:
+                self._timings[key] = {"count": 1, "sum": value, "max": value}
+            else:
+                stat["count"] += 1
+                stat["sum"] += value
+                if value > stat["max"]:
+                    stat["max"] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前所有指标"""
+        with self._lock:
+            timings = {
+                key: dict(stat, avg=stat["sum"] / stat["count"] if stat["count"] else 0.0)
+                for key, stat in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+
+# 全局指标实例
+metrics = Metrics()
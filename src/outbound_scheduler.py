@@ -0,0 +1,85 @@
+"""出站请求调度 - 按类别使用独立的有界线程池"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+# 请求类别，按交互优先级从高到低排列
+REPLY = "reply"  # 文本发送/回复
+IMAGE_SEND = "image_send"  # 已上传图片的消息发送
+METADATA = "metadata"  # 用户资料、群信息、被引用消息、机器人信息
+MEDIA_DOWNLOAD = "media_download"  # 下载消息中的图片等资源
+IMAGE_UPLOAD = "image_upload"  # 图片上传
+FILE_TRANSFER = "file_transfer"  # 文件/语音/视频的流式下载与上传
+REACTION = "reaction"  # 收到消息时的确认表情
+
+
+class OutboundScheduler:
+    """出站请求调度器
+
+    每个类别一个独立线程池，并发数由配置单独限定：一批图片上传只会占满
+    image_upload 的线程，文本回复始终有自己的空闲线程。每个类别另有排队
+    上限，超过时调用方在事件循环中等待（背压），而不是无限堆积到线程池队列。
+    排队时间（提交到真正开始执行）按类别记录为 outbound_queue_seconds。
+    """
+
+    def __init__(self):
+        cfg = global_config.outbound
+        workers = {
+            REPLY: cfg.reply_workers,
+            IMAGE_SEND: cfg.image_send_workers,
+            METADATA: cfg.metadata_workers,
+            MEDIA_DOWNLOAD: cfg.media_download_workers,
+            IMAGE_UPLOAD: cfg.image_upload_workers,
+            FILE_TRANSFER: cfg.file_transfer_workers,
+            REACTION: cfg.reaction_workers,
+        }
+        self._pools: Dict[str, ThreadPoolExecutor] = {
+            name: ThreadPoolExecutor(max_workers=max(1, count), thread_name_prefix=f"outbound-{name}")
+            for name, count in workers.items()
+        }
+        self._slots: Dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(max(1, cfg.max_pending)) for name in workers
+        }
+        self._pending: Dict[str, int] = {name: 0 for name in workers}
+
+    def pending(self) -> Dict[str, int]:
+        """各类别排队+执行中的请求数"""
+        return dict(self._pending)
+
+    async def run(self, work_class: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """在指定类别的线程池中执行阻塞函数"""
+        pool = self._pools.get(work_class)
+        if pool is None:
+            logger.warning(f"⚠️ 未知的出站请求类别: {work_class}，使用 {METADATA}")
+            work_class, pool = METADATA, self._pools[METADATA]
+
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            metrics.observe("outbound_queue_seconds", started - submitted, cls=work_class)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe("outbound_run_seconds", time.monotonic() - started, cls=work_class)
+
+        async with self._slots[work_class]:
+            self._pending[work_class] += 1
+            metrics.set_gauge("outbound_pending", self._pending[work_class], cls=work_class)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, timed)
+            finally:
+                self._pending[work_class] -= 1
+                metrics.set_gauge("outbound_pending", self._pending[work_class], cls=work_class)
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局出站调度器
+outbound_scheduler = OutboundScheduler()
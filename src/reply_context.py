@@ -0,0 +1,158 @@
+"""回复上下文 - 每个会话最近消息的环形缓冲区，用于解析被回复的消息"""
+import json
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.cache import AsyncTTLCache
+from src.metrics import metrics
+from src.feishu_client import get_feishu_client
+from src.outbound_scheduler import outbound_scheduler, METADATA
+
+# 紧凑存储：(message_id, sender_id, sender_name, text)
+RecentMessage = Tuple[str, str, str, str]
+
+# 每条记录除字符串内容外的固定开销估算（tuple + 索引项）
+_ENTRY_OVERHEAD = 160
+
+
+def _entry_size(entry: RecentMessage) -> int:
+    return _ENTRY_OVERHEAD + sum(len(part) for part in entry)
+
+
+class RecentMessageBuffer:
+    """按会话保存最近转换过的消息
+
+    每个会话一个定长 deque，另有 message_id 索引用于 O(1) 查找。
+    总占用超过内存预算时，从最久未活跃的会话开始淘汰最旧的消息。
+    """
+
+    def __init__(self, per_chat: int, memory_budget: int, text_chars: int):
+        self.per_chat = per_chat
+        self.memory_budget = memory_budget
+        self.text_chars = text_chars
+        self._chats: "OrderedDict[str, Deque[RecentMessage]]" = OrderedDict()
+        self._index: Dict[str, RecentMessage] = {}
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self._bytes
+
+    def record(self, chat_id: str, message_id: str, sender_id: str, sender_name: str, text: str):
+        """记录一条消息"""
+        if not chat_id or not message_id or message_id in self._index:
+            return
+        entry: RecentMessage = (message_id, sender_id or "", sender_name or "", (text or "")[:self.text_chars])
+
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            ring = self._chats[chat_id] = deque()
+        else:
+            self._chats.move_to_end(chat_id)
+
+        if len(ring) >= self.per_chat:
+            self._drop(ring.popleft())
+        ring.append(entry)
+        self._index[message_id] = entry
+        self._bytes += _entry_size(entry)
+        self._enforce_budget()
+
+    def lookup(self, message_id: str) -> Optional[RecentMessage]:
+        return self._index.get(message_id)
+
+    def shrink(self, memory_budget: int):
+        """临时压缩到给定预算以内"""
+        self._enforce_budget(memory_budget)
+
+    def _drop(self, entry: RecentMessage):
+        self._index.pop(entry[0], None)
+        self._bytes -= _entry_size(entry)
+
+    def _enforce_budget(self, budget: Optional[int] = None):
+        limit = self.memory_budget if budget is None else budget
+        while self._bytes > limit and self._chats:
+            chat_id, ring = next(iter(self._chats.items()))
+            if ring:
+                self._drop(ring.popleft())
+            if not ring:
+                del self._chats[chat_id]
+        metrics.set_gauge("recent_messages_bytes", self._bytes)
+        metrics.set_gauge("recent_messages_count", len(self._index))
+
+
+def _summarize_api_message(item: Dict[str, Any]) -> str:
+    """将 im/v1/messages 返回的消息转为纯文本摘要"""
+    from src.message_converter import build_mention_table, rewrite_mentions, iter_post_elements
+
+    if item.get("deleted"):
+        return "[消息已撤回]"
+    msg_type = item.get("msg_type", "")
+    try:
+        content = json.loads(item.get("body", {}).get("content", "") or "{}")
+    except ValueError:
+        return f"[{msg_type}]"
+
+    mention_table, _, _ = build_mention_table(item.get("mentions") or [])
+    if msg_type == "text":
+        return rewrite_mentions(content.get("text", ""), mention_table)
+    if msg_type == "post":
+        return "".join(
+            value if kind == "text" else "[图片]"
+            for kind, value in iter_post_elements(content, mention_table)
+        )
+    if msg_type == "image":
+        return "[图片]"
+    return f"[{msg_type}]"
+
+
+class ReplyContextResolver:
+    """解析被回复的消息：优先查本地环形缓冲区，未命中时调用接口并缓存"""
+
+    def __init__(self):
+        cfg = global_config.cache
+        self.buffer = RecentMessageBuffer(cfg.recent_per_chat, cfg.recent_memory_budget, cfg.recent_text_chars)
+        self.fetched = AsyncTTLCache("quoted_message", ttl=cfg.quoted_message_ttl, max_size=2000)
+
+    def record(self, chat_id: str, message_id: str, sender_id: str, sender_name: str, text: str):
+        self.buffer.record(chat_id, message_id, sender_id, sender_name, text)
+
+    async def resolve(self, message_id: str, app_name: Optional[str] = None) -> Optional[RecentMessage]:
+        """返回被回复消息的 (message_id, sender_id, sender_name, text)，失败返回 None"""
+        if not message_id:
+            return None
+        entry = self.buffer.lookup(message_id)
+        if entry is not None:
+            metrics.inc("reply_context_resolved", source="buffer")
+            return entry
+
+        async def load():
+            item = await outbound_scheduler.run(METADATA, get_feishu_client(app_name).get_message, message_id)
+            if not item:
+                return None
+            sender = item.get("sender", {}) or {}
+            sender_id = sender.get("id", "") or ""
+            sender_name = ""
+            if sender.get("sender_type") == "user" and sender.get("id_type", "open_id") == "open_id":
+                from src.user_cache import user_profile_cache
+                profile = await user_profile_cache.get(sender_id, app_name) or {}
+                sender_name = profile.get("name", "")
+            elif sender.get("sender_type") == "app":
+                sender_name = "机器人"
+            text = _summarize_api_message(item)[:self.buffer.text_chars]
+            return message_id, sender_id, sender_name, text
+
+        try:
+            entry = await self.fetched.get_or_load(message_id, load)
+        except Exception as e:
+            logger.debug(f"获取被回复消息失败: {e}")
+            return None
+        metrics.inc("reply_context_resolved", source="api" if entry else "miss")
+        return entry
+
+
+# 全局回复上下文实例
+reply_context = ReplyContextResolver()
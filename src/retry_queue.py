@@ -0,0 +1,157 @@
+"""熔断重试队列 - 飞书接口熔断期间暂存待发送的请求，恢复后按顺序重试"""
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Optional
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+from src.circuit_breaker import circuit_breakers, CircuitOpenError
+
+
+class DeferredSend:
+    """一次被推迟的发送"""
+
+    __slots__ = ("app", "endpoint", "chat", "description", "fn", "created")
+
+    def __init__(self, app: str, endpoint: str, chat: str, description: str, fn: Callable[[], Awaitable[Any]]):
+        self.app = app
+        self.endpoint = endpoint
+        self.chat = chat
+        self.description = description
+        self.fn = fn
+        self.created = time.monotonic()
+
+
+class OutboundRetryQueue:
+    """熔断期间的发送暂存队列
+
+    发送任务是无参的协程函数（内部通过出站调度器执行阻塞请求），重试时重新调用。
+    发送前若接口已熔断则直接入队，不占用线程池等待超时；
+    后台任务在熔断器进入 half_open 后逐条重试，第一条即为探测请求。
+    同一会话还有暂存的发送时，新的发送也排到队尾，熔断恢复后不会先于旧消息发出。
+    队列有容量上限与最长等待时间，超出的消息丢弃并记录。
+    """
+
+    def __init__(self):
+        self.max_size = global_config.circuit_breaker.retry_queue_size
+        self.max_age = global_config.circuit_breaker.retry_max_age
+        self._items: Deque[DeferredSend] = deque()
+        # (应用名称, 会话) -> 暂存中的条数
+        self._chats: Counter = Counter()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def pending_items(self):
+        """遍历暂存中的发送：(应用名称, 接口, 描述, 入队时间)"""
+        for item in self._items:
+            yield item.app, item.endpoint, item.description, item.created
+
+    def has_pending(self, app: str, chat: str) -> bool:
+        """该会话是否还有暂存的发送"""
+        return bool(chat) and self._chats[(app, chat)] > 0
+
+    async def run_or_defer(
+        self, app: str, endpoint: str, description: str, fn: Callable[[], Awaitable[Any]], chat: str = ""
+    ) -> Any:
+        """执行发送；接口已熔断、执行中熔断或该会话仍有暂存的发送时转入重试队列，返回 None
+
+        chat 为发送目标（会话 ID / open_id），用于保持同一会话的发送顺序；为空时不排序。
+        """
+        if self.has_pending(app, chat):
+            self.defer(app, endpoint, description, fn, chat, reason="ordering")
+            return None
+        for name in (endpoint, "auth"):
+            if circuit_breakers.get(app, name).is_open():
+                self.defer(app, name, description, fn, chat)
+                return None
+        try:
+            return await fn()
+        except CircuitOpenError as e:
+            self.defer(app, e.endpoint, description, fn, chat)
+            return None
+
+    def defer(
+        self, app: str, endpoint: str, description: str, fn: Callable[[], Awaitable[Any]],
+        chat: str = "", reason: str = "open",
+    ) -> bool:
+        """加入重试队列，队列已满时返回 False"""
+        if len(self._items) >= self.max_size:
+            metrics.inc("retry_queue_dropped", reason="full")
+            logger.warning(f"⚠️ 熔断重试队列已满，丢弃: {description}")
+            return False
+        self._items.append(DeferredSend(app, endpoint, chat, description, fn))
+        if chat:
+            self._chats[(app, chat)] += 1
+        metrics.inc("retry_queue_deferred", app=app, endpoint=endpoint, reason=reason)
+        metrics.set_gauge("retry_queue_size", len(self._items))
+        if reason == "ordering":
+            logger.info(f"⏸️ 会话仍有暂存的消息，排在其后: {description}")
+        else:
+            logger.info(f"⏸️ 飞书接口 {endpoint} [{app}] 熔断中，已暂存: {description}")
+        self._ensure_worker()
+        self._wakeup.set()
+        return True
+
+    def _pop(self) -> DeferredSend:
+        item = self._items.popleft()
+        if item.chat:
+            key = (item.app, item.chat)
+            self._chats[key] -= 1
+            if self._chats[key] <= 0:
+                del self._chats[key]
+        return item
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+
+    async def _worker(self):
+        while True:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            item = self._items[0]
+            if time.monotonic() - item.created > self.max_age:
+                self._pop()
+                metrics.inc("retry_queue_dropped", reason="expired")
+                logger.warning(f"⚠️ 暂存超时，丢弃: {item.description}")
+                continue
+            if circuit_breakers.get(item.app, item.endpoint).is_open():
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                await item.fn()
+            except CircuitOpenError as e:
+                # 探测失败或其他接口熔断，继续等待
+                item.endpoint = e.endpoint
+                await asyncio.sleep(1)
+                continue
+            except Exception as e:
+                logger.error(f"❌ 重试发送失败: {item.description}: {e}")
+            self._pop()
+            metrics.inc("retry_queue_replayed")
+            metrics.set_gauge("retry_queue_size", len(self._items))
+            metrics.observe("retry_queue_wait_seconds", time.monotonic() - item.created)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._items:
+            logger.warning(f"⚠️ 退出时仍有 {len(self._items)} 条暂存消息未发送")
+
+
+# 全局熔断重试队列
+retry_queue = OutboundRetryQueue()
@@ -0,0 +1,92 @@
+"""用户资料缓存 - 昵称与头像"""
+from typing import Any, Dict, Optional
+from src.cache import AsyncTTLCache
+from src.config import global_config
+from src.feishu_client import get_feishu_client
+from src.outbound_scheduler import outbound_scheduler, METADATA
+from src.warm_cache import warm_cache
+
+
+def _avatar_url(avatar: Any) -> str:
+    """从 avatar 字段（接口返回 dict / 事件返回 AvatarInfo）取出头像地址"""
+    if not avatar:
+        return ""
+    if isinstance(avatar, dict):
+        return avatar.get("avatar_240") or avatar.get("avatar_origin") or avatar.get("avatar_72") or ""
+    return (
+        getattr(avatar, "avatar_240", None)
+        or getattr(avatar, "avatar_origin", None)
+        or getattr(avatar, "avatar_72", None)
+        or ""
+    )
+
+
+def _compact_user_info(data: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留转换消息需要的字段"""
+    return {
+        "name": data.get("name", "") or "",
+        "avatar_url": data.get("avatar_url") or _avatar_url(data.get("avatar")),
+    }
+
+
+class UserProfileCache:
+    """用户资料缓存
+
+    资料通过 contact/v3/users/{open_id} 获取。通讯录事件
+    (contact.user.updated_v3 / contact.user.deleted_v3) 会就地更新或删除条目，
+    因此 TTL 可以设置得很长，而不会把过期的昵称发给 MaiBot。
+    open_id 按应用隔离，因此以 (应用名称, open_id) 为键。
+    """
+
+    def __init__(self):
+        self.cache = AsyncTTLCache(
+            "user_profile",
+            ttl=global_config.cache.user_ttl,
+            max_size=global_config.cache.user_max_size,
+        )
+        warm_cache.register(self.cache)
+
+    async def get(self, open_id: str, app_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取用户资料，失败返回 None"""
+        if not open_id:
+            return None
+        client = get_feishu_client(app_name)
+
+        async def load():
+            data = await outbound_scheduler.run(METADATA, client.get_user_info, open_id)
+            return _compact_user_info(data) if data else None
+
+        key = (client.app_name, open_id)
+        warm_cache.restore(self.cache, key)
+        return await self.cache.get_or_load(key, load)
+
+    def apply_update(self, user_event: Any, app_name: Optional[str] = None):
+        """用 contact.user.updated_v3 事件中的新资料就地更新已缓存的条目"""
+        open_id = getattr(user_event, "open_id", "")
+        key = (get_feishu_client(app_name).app_name, open_id)
+        if not open_id:
+            return
+        if key not in self.cache:
+            # 未缓存的用户无需写入，下次遇到时再按需获取；
+            # 但正在进行的加载可能拿到的是更新前的资料，需要丢弃
+            self.cache.invalidate(key)
+            return
+        name = getattr(user_event, "name", None)
+        if not name:
+            # 事件未携带昵称（字段权限不足），只能失效等待重新获取
+            self.cache.invalidate(key)
+            warm_cache.forget(self.cache.name, key)
+            return
+        self.cache.set(key, {
+            "name": name,
+            "avatar_url": _avatar_url(getattr(user_event, "avatar", None)),
+        })
+
+    def invalidate(self, open_id: str, app_name: Optional[str] = None):
+        key = (get_feishu_client(app_name).app_name, open_id)
+        self.cache.invalidate(key)
+        warm_cache.forget(self.cache.name, key)
+
+
+# 全局用户资料缓存实例
+user_profile_cache = UserProfileCache()
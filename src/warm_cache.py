@@ -0,0 +1,239 @@
+"""热启动快照 - 将查找类缓存定期保存到本地 SQLite，重启后按需恢复"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from src.logger import logger
+from src.config import global_config
+from src.metrics import metrics
+
+# 快照格式版本，结构或值的含义变化时递增，旧快照将被丢弃
+SCHEMA_VERSION = 1
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False)
+
+
+class WarmStartStore:
+    """缓存快照存储
+
+    - 各缓存通过 register() 登记，save() 时把未过期条目写入快照（按键覆盖，未被访问的旧条目保留到过期）
+    - 启动时 load() 在线程池中把未过期条目一次性读入内存（值保持 JSON 文本，取用时再解析），
+      之后 lookup()/scan() 只查内存，不在事件循环中访问 SQLite
+    - restore() 在缓存未命中时按键取出一条，并按剩余有效期写回内存缓存；已回到缓存的条目从内存快照中移除
+    - 快照带版本号与保存时间，版本不符或超过 max_age 未更新的快照整体丢弃
+    - invalidate 过的键记录为待删除，lookup 不再返回，下次保存时删除
+
+    SQLite 连接只在线程池中使用（加载、保存），通过锁串行化。
+    """
+
+    def __init__(self):
+        cfg = global_config.warm_start
+        path = Path(cfg.path)
+        if not path.is_absolute():
+            path = Path(__file__).parent.parent / path
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._caches: Dict[str, Any] = {}
+        # 启动时加载的快照 {(命名空间, 编码后的键): (过期时间戳, JSON 值)}
+        self._snapshot: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._pending: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._forgotten: Set[Tuple[str, str]] = set()
+        self._opened = False
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, cache: Any):
+        """登记一个 AsyncTTLCache，以其名称作为快照命名空间"""
+        self._caches[cache.name] = cache
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        """首次使用时打开快照，检查版本与新鲜度（调用方持有锁）"""
+        if self._opened:
+            return self._conn
+        self._opened = True
+        if not global_config.warm_start.enable:
+            return None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            os.chmod(self.path, 0o600)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT, key TEXT, value TEXT, expire_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            version = int(meta.get("schema_version", SCHEMA_VERSION))
+            saved_at = float(meta.get("saved_at", 0) or 0)
+            if version != SCHEMA_VERSION:
+                logger.info(f"♻️ 缓存快照版本不符 ({version} != {SCHEMA_VERSION})，已丢弃")
+                conn.execute("DELETE FROM entries")
+            elif saved_at and time.time() - saved_at > global_config.warm_start.max_age:
+                logger.info("♻️ 缓存快照已过期，已丢弃")
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute("DELETE FROM entries WHERE expire_at < ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)
+            )
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning(f"⚠️ 打开缓存快照失败，本次不使用快照: {e}")
+            self._conn = None
+        return self._conn
+
+    def _read_all(self) -> Dict[Tuple[str, str], Tuple[float, str]]:
+        with self._lock:
+            conn = self._open()
+            if conn is None:
+                return {}
+            rows = conn.execute(
+                "SELECT namespace, key, value, expire_at FROM entries WHERE expire_at > ?", (time.time(),)
+            ).fetchall()
+        return {(namespace, key): (expire_at, value) for namespace, key, value, expire_at in rows}
+
+    async def load(self):
+        """启动时在线程池中读入快照（需在首次 lookup 之前调用）"""
+        if not global_config.warm_start.enable:
+            return
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, self._read_all)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 读取缓存快照失败，本次不使用快照: {e}")
+            return
+        # 加载期间已写入或失效的条目以内存中的为准
+        for encoded in self._forgotten:
+            snapshot.pop(encoded, None)
+        snapshot.update(self._snapshot)
+        self._snapshot = snapshot
+        if snapshot:
+            logger.info(f"🔥 已加载缓存快照: {len(snapshot)} 条，将按需恢复")
+
+    def lookup(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """读取快照中的条目，返回 (值, 过期时间戳)；只查内存，可在线程池中调用"""
+        entry = self._snapshot.get((namespace, _encode_key(key)))
+        if entry is None or entry[0] <= time.time():
+            return None
+        metrics.inc("warm_cache_restored", namespace=namespace)
+        return json.loads(entry[1]), entry[0]
+
+    def scan(self, namespace: str) -> List[Tuple[Any, Any, float]]:
+        """读取某个命名空间下全部未过期条目，返回 [(键, 值, 过期时间戳)]（元组键还原为 tuple）"""
+        now = time.time()
+        result = []
+        for (entry_namespace, key), (expire_at, value) in list(self._snapshot.items()):
+            if entry_namespace != namespace or expire_at <= now:
+                continue
+            decoded = json.loads(key)
+            result.append((tuple(decoded) if isinstance(decoded, list) else decoded, json.loads(value), expire_at))
+        return result
+
+    def restore(self, cache: Any, key: Hashable):
+        """缓存未命中时尝试从快照恢复该条目（保留原剩余有效期）"""
+        if key in cache:
+            return
+        found = self.lookup(cache.name, key)
+        if found is not None:
+            value, expire_at = found
+            cache.set(key, value, ttl=expire_at - time.time())
+            # 之后由内存缓存持有，保存时随缓存写回
+            self._snapshot.pop((cache.name, _encode_key(key)), None)
+
+    def put(self, namespace: str, key: Hashable, value: Any, expire_at: float):
+        """写入非缓存类条目（机器人信息、token），下次保存时落盘"""
+        encoded = (namespace, _encode_key(key))
+        entry = (expire_at, json.dumps(value, ensure_ascii=False))
+        self._forgotten.discard(encoded)
+        self._pending[encoded] = entry
+        self._snapshot[encoded] = entry
+
+    def forget(self, namespace: str, key: Hashable):
+        """条目已失效，快照中的旧值不再使用"""
+        encoded = (namespace, _encode_key(key))
+        self._pending.pop(encoded, None)
+        self._snapshot.pop(encoded, None)
+        self._forgotten.add(encoded)
+
+    def _collect(self) -> Tuple[List[Tuple[str, str, str, float]], List[Tuple[str, str]]]:
+        """在事件循环线程中收集待写入的条目"""
+        # 先整体换出，线程池中的 put（token）不会与遍历冲突
+        pending, self._pending = self._pending, {}
+        forgotten, self._forgotten = self._forgotten, set()
+        rows = [
+            (namespace, key, value, expire_at)
+            for (namespace, key), (expire_at, value) in pending.items()
+        ]
+        for namespace, cache in self._caches.items():
+            for key, expire_at, value in cache.items():
+                if value is None:
+                    continue
+                encoded = (namespace, _encode_key(key))
+                forgotten.discard(encoded)
+                # 缓存中的值更新，快照里的旧值不再用于恢复
+                self._snapshot.pop(encoded, None)
+                rows.append((namespace, encoded[1], json.dumps(value, ensure_ascii=False), expire_at))
+        return rows, list(forgotten)
+
+    def _write(self, rows: List[Tuple[str, str, str, float]], forgotten: List[Tuple[str, str]]) -> int:
+        with self._lock:
+            conn = self._open()
+            if conn is None:
+                return 0
+            with conn:
+                conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", forgotten)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, expire_at) VALUES (?, ?, ?, ?)", rows
+                )
+                conn.execute("DELETE FROM entries WHERE expire_at < ?", (time.time(),))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('saved_at', ?)", (str(time.time()),))
+            return len(rows)
+
+    async def save(self):
+        """保存快照（收集在事件循环中进行，写入在线程池中进行）"""
+        if not global_config.warm_start.enable:
+            return
+        start = time.perf_counter()
+        rows, forgotten = self._collect()
+        try:
+            count = await asyncio.get_running_loop().run_in_executor(None, self._write, rows, forgotten)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 保存缓存快照失败: {e}")
+            return
+        metrics.observe("warm_cache_save_seconds", time.perf_counter() - start)
+        logger.debug("💾 缓存快照已保存: %d 条", count)
+
+    async def run_periodic(self):
+        """定期保存快照"""
+        while True:
+            await asyncio.sleep(global_config.warm_start.save_interval)
+            await self.save()
+
+    def start(self):
+        if global_config.warm_start.enable and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run_periodic())
+
+    async def stop(self):
+        """停止定期保存并做最后一次保存"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局缓存快照
+warm_cache = WarmStartStore()
@@ -0,0 +1,14 @@
+"""测试公共设置：以项目根目录为导入路径；导入 src.config 时若从模板生成了 config.toml，测试结束后删除"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_CONFIG_PATH = ROOT / "config.toml"
+_CONFIG_EXISTED = _CONFIG_PATH.exists()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _CONFIG_EXISTED:
+        _CONFIG_PATH.unlink(missing_ok=True)
@@ -0,0 +1,29 @@
+"""断线补拉的高水位"""
+from src.backfill import MessageBackfill
+
+
+def test_record_keeps_ids_at_mark():
+    backfill = MessageBackfill()
+    backfill.record("app", "oc_1", "group", "1000", "m1")
+    backfill.record("app", "oc_1", "group", "1000", "m2")
+    backfill.record("app", "oc_1", "group", "999", "m0")
+    assert backfill._marks[("app", "oc_1")] == [1000, "group", ["m1", "m2"]]
+    backfill.record("app", "oc_1", "group", "1001", "m3")
+    assert backfill._marks[("app", "oc_1")] == [1001, "group", ["m3"]]
+
+
+def test_items_at_or_before_mark_are_skipped():
+    before = MessageBackfill._before_mark
+    assert before({"create_time": "999", "message_id": "m0"}, 1000, {"m1"})
+    assert before({"create_time": "1000", "message_id": "m1"}, 1000, {"m1"})
+    assert not before({"create_time": "1000", "message_id": "m2"}, 1000, {"m1"})
+    assert not before({"create_time": "1001", "message_id": "m3"}, 1000, {"m1"})
+    # 旧快照没有消息 ID：高水位那一毫秒整体跳过
+    assert before({"create_time": "1000", "message_id": "m2"}, 1000, None)
+
+
+def test_old_snapshot_mark_is_upgraded():
+    backfill = MessageBackfill()
+    backfill._marks[("app", "oc_1")] = [1000, "p2p"]
+    backfill.record("app", "oc_1", "p2p", "1000", "m1")
+    assert backfill._marks[("app", "oc_1")] == [1000, "p2p", ["m1"]]
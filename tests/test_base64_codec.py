@@ -0,0 +1,54 @@
+"""分块 base64 解码"""
+import asyncio
+import base64
+import os
+
+import pytest
+
+from src import base64_codec
+from src.base64_codec import BufferReader, decode_base64_off_loop, decode_base64_to_buffer
+
+PAYLOAD = os.urandom(10_000) + b"\x00\xff"
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # 小块尺寸让测试数据跨越多个分块
+    monkeypatch.setattr(base64_codec, "_CHUNK_CHARS", 1024)
+
+
+@pytest.mark.parametrize("prefix", ["", "base64://", "data:image/png;base64,"])
+def test_decode_with_prefixes(prefix):
+    encoded = prefix + base64.b64encode(PAYLOAD).decode()
+    assert bytes(decode_base64_to_buffer(encoded)) == PAYLOAD
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 1023, 1024, 1025])
+def test_padding_and_chunk_boundaries(size):
+    data = PAYLOAD[:size]
+    assert bytes(decode_base64_to_buffer(base64.b64encode(data).decode())) == data
+
+
+def test_line_breaks_after_first_chunk():
+    # MIME 风格每 76 字符换行，换行都出现在前 256 个字符之后也要正确解码
+    encoded = base64.b64encode(PAYLOAD).decode()
+    wrapped = encoded[:300] + "".join("\r\n" + encoded[i:i + 76] for i in range(300, len(encoded), 76))
+    assert bytes(decode_base64_to_buffer(wrapped)) == PAYLOAD
+
+
+def test_encodebytes_output():
+    assert bytes(decode_base64_to_buffer(base64.encodebytes(PAYLOAD).decode())) == PAYLOAD
+
+
+def test_decode_off_loop_accepts_bytes():
+    encoded = base64.b64encode(PAYLOAD)
+    assert bytes(asyncio.run(decode_base64_off_loop(encoded))) == PAYLOAD
+
+
+def test_buffer_reader():
+    reader = BufferReader(memoryview(b"abcdef"))
+    assert reader.len == 6
+    assert reader.read(4) == b"abcd"
+    assert reader.len == 2
+    assert reader.read() == b"ef"
+    assert reader.read(1) == b""
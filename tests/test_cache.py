@@ -0,0 +1,97 @@
+"""AsyncTTLCache 单飞加载"""
+import asyncio
+import time
+
+import pytest
+
+from src.cache import AsyncTTLCache
+
+
+def test_concurrent_loads_share_one_call():
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"name": "飞书用户"}
+
+    async def run():
+        cache = AsyncTTLCache("test", ttl=60, max_size=10)
+        results = await asyncio.gather(*(cache.get_or_load("ou_1", loader) for _ in range(10)))
+        again = await cache.get_or_load("ou_1", loader)
+        return cache, results, again
+
+    cache, results, again = asyncio.run(run())
+    assert calls == 1
+    assert all(result == {"name": "飞书用户"} for result in results)
+    assert again == results[0]
+    assert cache.stats()["inflight"] == 0
+
+
+def test_failed_load_propagates_to_all_waiters_and_is_not_cached():
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        cache = AsyncTTLCache("test", ttl=60, max_size=10)
+        results = await asyncio.gather(
+            *(cache.get_or_load("ou_1", loader) for _ in range(3)), return_exceptions=True
+        )
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert "ou_1" not in cache
+
+
+def test_invalidate_during_load_is_not_written_back():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=60, max_size=10)
+        started = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        task = asyncio.create_task(cache.get_or_load("key", loader))
+        await started.wait()
+        cache.invalidate("key")
+        assert await task == "stale"
+        return cache
+
+    assert "key" not in asyncio.run(run())
+
+
+@pytest.mark.parametrize("value, expected_ttl", [("v", 60), (None, 5)])
+def test_negative_results_use_negative_ttl(value, expected_ttl):
+    cache = AsyncTTLCache("test", ttl=60, max_size=10, negative_ttl=5)
+    cache.set("key", value)
+    [(_, expire_at, _)] = list(cache.items())
+    assert expire_at - time.time() == pytest.approx(expected_ttl, abs=1)
+
+
+def test_set_during_load_wins_over_stale_result():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=60, max_size=10)
+        started = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        task = asyncio.create_task(cache.get_or_load("key", loader))
+        await started.wait()
+        cache.set("key", "fresh")
+        await task
+        return cache
+
+    assert asyncio.run(run()).get("key") == "fresh"
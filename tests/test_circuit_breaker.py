@@ -0,0 +1,72 @@
+"""熔断器状态转换与按应用隔离"""
+import pytest
+
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from src.config import global_config
+
+
+@pytest.fixture(autouse=True)
+def breaker_config(monkeypatch):
+    cfg = global_config.circuit_breaker
+    monkeypatch.setattr(cfg, "enable", True)
+    monkeypatch.setattr(cfg, "window_seconds", 60)
+    monkeypatch.setattr(cfg, "min_calls", 4)
+    monkeypatch.setattr(cfg, "failure_rate", 0.5)
+    monkeypatch.setattr(cfg, "slow_call_seconds", 5)
+    monkeypatch.setattr(cfg, "slow_call_rate", 0.8)
+    monkeypatch.setattr(cfg, "open_seconds", 30)
+    return cfg
+
+
+def test_opens_when_failure_rate_reached():
+    breaker = CircuitBreaker("app", "send_message")
+    breaker.record(False, 0.1)
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED  # 未达到 min_calls
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+
+def test_slow_calls_open_breaker():
+    breaker = CircuitBreaker("app", "upload_image")
+    for _ in range(4):
+        breaker.record(False, 10)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_single_probe(breaker_config, monkeypatch):
+    breaker = CircuitBreaker("app", "reply_message")
+    for _ in range(4):
+        breaker.record(True, 0.1)
+    monkeypatch.setattr(breaker_config, "open_seconds", 0)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.is_open()
+
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(breaker_config, monkeypatch):
+    breaker = CircuitBreaker("app", "reply_message")
+    for _ in range(4):
+        breaker.record(True, 0.1)
+    monkeypatch.setattr(breaker_config, "open_seconds", 0)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_registry_isolates_apps():
+    registry = CircuitBreakerRegistry()
+    assert registry.get("a", "auth") is registry.get("a", "auth")
+    assert registry.get("a", "auth") is not registry.get("b", "auth")
+    for _ in range(4):
+        registry.get("a", "auth").record(True, 0.1)
+    assert registry.states() == {"a": {"auth": OPEN}, "b": {"auth": CLOSED}}
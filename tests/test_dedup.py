@@ -0,0 +1,34 @@
+"""最近 ID 集合"""
+from src.dedup import RecentIdSet
+
+
+def test_duplicate_is_rejected():
+    ids = RecentIdSet("test")
+    assert ids.add("m1")
+    assert not ids.add("m1")
+    assert "m1" in ids
+    assert "m2" not in ids
+
+
+def test_empty_id_is_always_accepted():
+    ids = RecentIdSet("test")
+    assert ids.add("")
+    assert ids.add("")
+    assert len(ids) == 0
+
+
+def test_capacity_evicts_oldest():
+    ids = RecentIdSet("test", max_size=2)
+    ids.add("m1")
+    ids.add("m2")
+    ids.add("m3")
+    assert len(ids) == 2
+    assert "m1" not in ids
+    assert ids.add("m1")
+
+
+def test_expired_id_can_be_added_again():
+    ids = RecentIdSet("test", ttl=0)
+    assert ids.add("m1")
+    assert "m1" not in ids
+    assert ids.add("m1")
@@ -0,0 +1,41 @@
+"""长连接首次连接失败后的重试可被 stop_ingest() 停止"""
+import asyncio
+import time
+
+from src.config import FeishuAppConfig
+from src.event_client import FeishuEventClient, LongConnection
+
+
+class _FailingClient:
+    """首次连接总是失败的 SDK 客户端替身"""
+
+    def __init__(self):
+        self.attempts = 0
+        self._auto_reconnect = True
+
+    async def _connect(self):
+        self.attempts += 1
+        raise OSError("network unreachable")
+
+    async def _disconnect(self):
+        pass
+
+
+def test_stop_ingest_interrupts_first_connect_retry():
+    async def run():
+        client = FeishuEventClient(FeishuAppConfig(name="test"))
+        client.main_loop = asyncio.get_running_loop()
+        cli = _FailingClient()
+        connection = LongConnection(cli, 0)
+        client.connections = [connection]
+        task = asyncio.create_task(client._run_connection(connection))
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        await client.stop_ingest()
+        await asyncio.wait_for(task, 1)
+        return cli, connection, time.monotonic() - start
+
+    cli, connection, elapsed = asyncio.run(run())
+    assert cli.attempts == 1
+    assert connection.state == "stopped"
+    assert elapsed < 1
@@ -0,0 +1,60 @@
+"""入站限流：令牌桶与关闭时的放行"""
+import asyncio
+
+import pytest
+
+from src.config import global_config
+from src.flood_control import FloodControl, TokenBucket
+
+
+def test_token_bucket_refill_is_capped_at_burst():
+    bucket = TokenBucket(3, now=0.0)
+    bucket.tokens = 0
+    bucket.refill(rate=2, burst=3, now=1.0)
+    assert bucket.tokens == pytest.approx(2)
+    bucket.refill(rate=2, burst=3, now=10.0)
+    assert bucket.tokens == 3
+    assert bucket.updated == 10.0
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(1, now=0.0)
+    assert bucket.wait_time(rate=2) == 0.0
+    bucket.tokens = 0.5
+    assert bucket.wait_time(rate=2) == pytest.approx(0.25)
+    bucket.tokens = 0
+    assert bucket.wait_time(rate=0) == float("inf")
+
+
+def test_admit_throttles_after_burst(monkeypatch):
+    cfg = global_config.flood_control
+    monkeypatch.setattr(cfg, "enable", True)
+    monkeypatch.setattr(cfg, "user_rate", 1.0)
+    monkeypatch.setattr(cfg, "user_burst", 2)
+    monkeypatch.setattr(cfg, "chat_burst", 100)
+    flood = FloodControl()
+    assert flood.admit("ou_1", "oc_1")[0] is None
+    assert flood.admit("ou_1", "oc_1")[0] is None
+    key, wait = flood.admit("ou_1", "oc_1")
+    assert key is not None and wait > 0
+    # 其他用户不受影响
+    assert flood.admit("ou_2", "oc_1")[0] is None
+
+
+def test_flush_releases_delayed_and_collapsed(monkeypatch):
+    monkeypatch.setattr(global_config.flood_control, "collapse_window", 60)
+
+    async def run():
+        flood = FloodControl()
+        delayed, collapsed = [], []
+        flood.delay(60, delayed.append, "m1")
+        flood.collapse("user:ou_1", "m2", lambda last, count: collapsed.append((last, count)))
+        flood.collapse("user:ou_1", "m3", lambda last, count: collapsed.append((last, count)))
+        assert flood.pending() == 3
+        flood.flush()
+        assert flood.pending() == 0
+        return delayed, collapsed
+
+    delayed, collapsed = asyncio.run(run())
+    assert delayed == ["m1"]
+    assert collapsed == [("m3", 2)]
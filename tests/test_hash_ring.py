@@ -0,0 +1,36 @@
+"""MaiBot 实例一致性哈希环"""
+from src.maibot_client import HashRing
+
+NAMES = ["a", "b", "c"]
+KEYS = [f"chat_{i}" for i in range(500)]
+
+
+def test_lookup_is_stable():
+    ring = HashRing(NAMES, 64)
+    healthy = set(NAMES)
+    assert [ring.lookup(key, healthy) for key in KEYS] == [ring.lookup(key, healthy) for key in KEYS]
+
+
+def test_keys_spread_across_instances():
+    ring = HashRing(NAMES, 64)
+    owners = [ring.lookup(key, set(NAMES)) for key in KEYS]
+    for name in NAMES:
+        assert owners.count(name) > len(KEYS) / len(NAMES) / 3
+
+
+def test_unhealthy_instance_only_moves_its_own_keys():
+    ring = HashRing(NAMES, 64)
+    before = {key: ring.lookup(key, set(NAMES)) for key in KEYS}
+    after = {key: ring.lookup(key, {"a", "c"}) for key in KEYS}
+    for key in KEYS:
+        if before[key] != "b":
+            assert after[key] == before[key]
+        else:
+            assert after[key] in ("a", "c")
+
+
+def test_no_healthy_instance():
+    ring = HashRing(NAMES, 8)
+    assert ring.lookup("chat", set()) is None
+    assert ring.lookup("chat", {"unknown"}) is None
+    assert HashRing([], 8).lookup("chat", {"a"}) is None
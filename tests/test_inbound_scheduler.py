@@ -0,0 +1,88 @@
+"""入站调度：类别间平滑加权轮询与会话间轮转"""
+import asyncio
+from collections import Counter
+
+from src.inbound_scheduler import DM, GROUP, MENTION, InboundScheduler, classify_message
+
+
+async def _noop(*args):
+    pass
+
+
+def _scheduler(weights):
+    scheduler = InboundScheduler()
+    scheduler.weights = weights
+    # 不启动处理协程，只测试出队顺序
+    scheduler._ensure_workers = lambda: None
+    scheduler._ready = asyncio.Event()
+    return scheduler
+
+
+def _drain(scheduler):
+    order = []
+    while True:
+        picked = scheduler._next()
+        if picked is None:
+            return order
+        priority, (_, _, args, _) = picked
+        order.append((priority, args[0]))
+
+
+def test_swrr_follows_weights_and_interleaves():
+    scheduler = _scheduler({DM: 4, MENTION: 2, GROUP: 1})
+    for i in range(70):
+        for priority in (DM, MENTION, GROUP):
+            scheduler.submit(priority, f"{priority}_chat", _noop, i)
+
+    first_round = [priority for priority, _ in _drain(scheduler)[:7]]
+    assert Counter(first_round) == {DM: 4, MENTION: 2, GROUP: 1}
+    # 平滑：高权重类别不会连续占满一轮
+    assert first_round[:4] != [DM] * 4
+
+
+def test_low_priority_is_not_starved():
+    scheduler = _scheduler({DM: 10, MENTION: 1, GROUP: 1})
+    for i in range(50):
+        scheduler.submit(DM, "dm", _noop, i)
+    scheduler.submit(GROUP, "group", _noop, "ambient")
+    order = _drain(scheduler)
+    assert order.index((GROUP, "ambient")) <= 12
+
+
+def test_chats_round_robin_within_class_and_keep_order():
+    scheduler = _scheduler({DM: 1, MENTION: 1, GROUP: 1})
+    for i in range(3):
+        scheduler.submit(GROUP, "busy", _noop, f"busy{i}")
+    scheduler.submit(GROUP, "quiet", _noop, "quiet0")
+    order = [value for _, value in _drain(scheduler)]
+    assert order == ["busy0", "quiet0", "busy1", "busy2"]
+
+
+def test_classify_message():
+    mention = {"id": {"open_id": "ou_bot"}}
+    other = {"id": {"open_id": "ou_user"}}
+    assert classify_message("p2p", None) == DM
+    assert classify_message("group", [mention], "ou_bot") == MENTION
+    assert classify_message("group", [other], "ou_bot") == GROUP
+    assert classify_message("group", [], "ou_bot") == GROUP
+    # 机器人 open_id 未知时任何 @个人 都视为 @机器人
+    assert classify_message("group", [other], "") == MENTION
+
+
+def test_non_droppable_items_survive_ambient_overload(monkeypatch):
+    from src.config import global_config
+    monkeypatch.setattr(global_config.inbound, "max_ambient_queue", 2)
+    scheduler = _scheduler({DM: 1, MENTION: 1, GROUP: 1})
+    scheduler.submit(GROUP, "chat", _noop, "backfill0", droppable=False)
+    scheduler.submit(GROUP, "chat", _noop, "backfill1", droppable=False)
+    scheduler.submit(GROUP, "chat", _noop, "live0")
+    scheduler.submit(GROUP, "chat", _noop, "live1")
+    assert [value for _, value in _drain(scheduler)] == ["backfill0", "backfill1", "live1"]
+
+
+def test_submit_reports_full_queue(monkeypatch):
+    from src.config import global_config
+    monkeypatch.setattr(global_config.inbound, "max_queue", 1)
+    scheduler = _scheduler({DM: 1, MENTION: 1, GROUP: 1})
+    assert scheduler.submit(DM, "chat", _noop, 0)
+    assert not scheduler.submit(DM, "chat", _noop, 1)
@@ -0,0 +1,84 @@
+"""提及替换与富文本解析"""
+import asyncio
+
+from src.message_converter import (
+    build_mention_table,
+    inline_image_bytes,
+    iter_post_elements,
+    parse_post_content,
+    rewrite_mentions,
+)
+from maim_message import Seg
+
+
+def _table(count):
+    mentions = [{"key": f"@_user_{i}", "id": {"open_id": f"ou_{i}"}, "name": f"用户{i}"} for i in range(1, count + 1)]
+    return build_mention_table(mentions)[0]
+
+
+def test_rewrite_does_not_clobber_longer_keys():
+    table = _table(10)
+    assert rewrite_mentions("@_user_1 和 @_user_10", table) == "@<用户1:ou_1> 和 @<用户10:ou_10>"
+
+
+def test_unknown_placeholders_are_kept():
+    table = _table(1)
+    assert rewrite_mentions("@_user_1 @_user_2 @_all", table) == "@<用户1:ou_1> @_user_2 @_all"
+
+
+def test_names_containing_placeholders_are_not_rewritten_again():
+    table = build_mention_table([
+        {"key": "@_user_1", "id": "ou_1", "name": "@_user_2"},
+        {"key": "@_user_2", "id": "ou_2", "name": "用户2"},
+    ])[0]
+    assert rewrite_mentions("@_user_1 @_user_2", table) == "@<@_user_2:ou_1> @<用户2:ou_2>"
+
+
+def test_rewrite_fast_paths_return_input():
+    text = "没有提及"
+    assert rewrite_mentions(text, _table(1)) is text
+    assert rewrite_mentions("@_user_1", {}) == "@_user_1"
+    assert rewrite_mentions("", _table(1)) == ""
+
+
+def test_mention_table_accepts_event_objects_and_dicts():
+    class Id:
+        open_id = "ou_obj"
+
+    class Mention:
+        key = "@_user_1"
+        id = Id()
+        name = "对象"
+        tenant_key = ""
+
+    table = build_mention_table([Mention(), {"key": "@_user_2", "id": "ou_str", "name": "字典"}])[0]
+    assert table == {"@_user_1": "@<对象:ou_obj>", "@_user_2": "@<字典:ou_str>"}
+
+
+def test_iter_post_elements():
+    post = {"zh_cn": {"title": "标题", "content": [
+        [{"tag": "text", "text": "你好 @_user_1"}, {"tag": "at", "user_id": "@_user_1"}],
+        [{"tag": "a", "text": "链接", "href": "https://example.com"}, {"tag": "img", "image_key": "img_1"}],
+        [{"tag": "at", "user_id": "all"}, {"tag": "emotion", "emoji_type": "SMILE"}],
+    ]}}
+    assert list(iter_post_elements(post, _table(1))) == [
+        ("text", "标题\n"),
+        ("text", "你好 @<用户1:ou_1>"), ("text", "@<用户1:ou_1>"),
+        ("text", "\n"),
+        ("text", "链接(https://example.com)"), ("image", "img_1"),
+        ("text", "\n"),
+        ("text", "@所有人"), ("text", "[SMILE]"),
+    ]
+
+
+def test_parse_post_content_merges_adjacent_text():
+    post = {"content": [[{"tag": "text", "text": "第一段"}], [{"tag": "text", "text": "第二段"}]]}
+    segs, plain = asyncio.run(parse_post_content(post, {}, ""))
+    assert [(seg.type, seg.data) for seg in segs] == [("text", "第一段\n第二段")]
+    assert plain == "第一段\n第二段"
+
+
+def test_inline_image_bytes():
+    seg = Seg(type="seglist", data=[Seg(type="text", data="hi"), Seg(type="image", data="QUJD")])
+    assert inline_image_bytes(seg) == 4
+    assert inline_image_bytes(Seg(type="image_url", data="http://127.0.0.1/blob")) == 0